@@ -1,6 +1,6 @@
 import time
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from rooms.models import RoomUser, Room
@@ -101,4 +101,13 @@ class UserUpdateForm(forms.ModelForm):
         fields = ['username', 'email']
         help_texts = {
             "email": _("Required. Valid email address."),
-        }
\ No newline at end of file
+        }
+
+class RoomUserPasswordResetForm(PasswordResetForm):
+    """
+    Invited users have no usable password (they logged in by the invite link),
+    unlike Django's form the reset link is sent to them too.
+    """
+
+    def get_users(self, email):
+        return RoomUser.objects.filter(email__iexact=email, is_active=True)
@@ -0,0 +1,105 @@
+from django.contrib.auth.tokens import default_token_generator
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.test import TestCase
+from rooms.models import RoomUser, Room
+from rooms.tests.query_budget import QueryBudgetMixin
+
+
+class AccountsQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """
+    Query count of every accounts view.
+    """
+    # headers that real browsers send (signup has bot detection based on headers)
+    headers = {
+        'HTTP_USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)',
+        'HTTP_ACCEPT': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'HTTP_ACCEPT_LANGUAGE': 'en-US,en;q=0.9',
+    }
+
+    def setUp(self):
+        self.user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Test room', created_by=self.user)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        self.uidb64 = urlsafe_base64_encode(force_bytes(self.user.pk))
+
+
+class AnonymousQueryBudgetTests(AccountsQueryBudgetTestCase):
+    def test_signup(self):
+        url = reverse('signup')
+        with self.assertMaxQueries(0):
+            self.client.get(url, **self.headers)
+        data = {
+            'username': 'john',
+            'email': 'john@doe.com',
+            'password1': 'abcdef123456',
+            'password2': 'abcdef123456',
+        }
+        with self.assertMaxQueries(4):
+            self.client.post(url, data, **self.headers)
+
+    def test_email_confirmation(self):
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('email_confirmation', kwargs={'uidb64': self.uidb64}))
+
+    def test_email_confirmed(self):
+        token = default_token_generator.make_token(self.user)
+        with self.assertMaxQueries(2):
+            self.client.get(reverse('email_confirmed', kwargs={'uidb64': self.uidb64, 'token': token}))
+
+    def test_email_resend(self):
+        with self.assertMaxQueries(1):
+            self.client.get(reverse('email_resend', kwargs={'uidb64': self.uidb64}))
+
+    def test_login(self):
+        url = reverse('login')
+        with self.assertMaxQueries(0):
+            self.client.get(url)
+        with self.assertMaxQueries(9):
+            self.client.post(url, {'username': 'usr', 'password': '111'})
+
+    def test_password_reset(self):
+        url = reverse('password_reset')
+        with self.assertMaxQueries(0):
+            self.client.get(url)
+        with self.assertMaxQueries(1):
+            self.client.post(url, {'email': 'usr@test.com'})
+
+    def test_password_reset_confirm(self):
+        token = default_token_generator.make_token(self.user)
+        url = reverse('password_reset_confirm', kwargs={'uidb64': self.uidb64, 'token': token})
+        with self.assertMaxQueries(7):
+            self.client.get(url, follow=True)
+
+
+class LoggedInQueryBudgetTests(AccountsQueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='usr', password='111')
+
+    def test_logout(self):
+        with self.assertMaxQueries(4):
+            self.client.post(reverse('logout'))
+
+    def test_password_change(self):
+        url = reverse('password_change')
+        with self.assertMaxQueries(3):
+            self.client.get(url)
+        data = {'old_password': '111', 'new_password1': 'new_password', 'new_password2': 'new_password'}
+        with self.assertMaxQueries(12):
+            self.client.post(url, data)
+
+    def test_my_account(self):
+        url = reverse('my_account')
+        with self.assertMaxQueries(3):
+            self.client.get(url)
+        data = {'username': 'usr3', 'email': 'usr3@test.com', 'roomname': 'Test room2'}
+        with self.assertMaxQueries(6):
+            self.client.post(url, data)
+
+    def test_my_account_invited_member(self):
+        self.client.login(username='usr2', password='222')
+        with self.assertMaxQueries(3):
+            self.client.get(reverse('my_account'))
@@ -0,0 +1,62 @@
+import re
+from django.contrib.auth.forms import SetPasswordForm
+from django.core import mail
+from django.urls import reverse
+from django.test import TestCase
+from rooms.backends import new_invite_token
+from rooms.models import Room, RoomUser
+
+
+class PasswordSetTests(TestCase):
+    def setUp(self):
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room = Room.objects.create(name='Room name', created_by=owner)
+        self.token, token_hash, expires_at = new_invite_token()
+        # invited user, as rooms.invites creates it
+        self.user = RoomUser.objects.create_user(username='inv@test.com', email='inv@test.com', member_of=room,
+                                                 invite_token=token_hash, invite_expires_at=expires_at)
+        self.url = reverse('password_set')
+
+    def login_by_invite(self):
+        return self.client.get(reverse('login_invite', kwargs={'code': self.token}))
+
+    def test_invite_login_asks_for_password(self):
+        self.assertRedirects(self.login_by_invite(), self.url)
+        response = self.client.get(self.url)
+        self.assertIsInstance(response.context.get('form'), SetPasswordForm)
+        # no old password field
+        self.assertContains(response, 'type="password"', 2)
+
+    def test_set_password(self):
+        self.login_by_invite()
+        response = self.client.post(self.url, {'new_password1': 'abcdef123456', 'new_password2': 'abcdef123456'})
+        self.assertRedirects(response, reverse('room'))
+        # still logged in
+        self.assertEquals(int(self.client.session['_auth_user_id']), self.user.pk)
+
+        self.client.logout()
+        self.assertTrue(self.client.login(username='inv@test.com', password='abcdef123456'))
+
+    def test_user_with_password_redirected_to_change(self):
+        self.client.login(username='usr', password='111')
+        self.assertRedirects(self.client.get(self.url), reverse('password_change'))
+
+    def test_login_required(self):
+        response = self.client.get(self.url)
+        self.assertRedirects(response, '{}?next={}'.format(reverse('login'), self.url))
+
+    def test_recovery_after_logout(self):
+        # user didn't set a password, the invite link is already used
+        self.login_by_invite()
+        self.client.logout()
+        self.assertEquals(self.login_by_invite().status_code, 404)
+
+        self.client.post(reverse('password_reset'), {'email': 'INV@test.com'})
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(mail.outbox[0].to, ['inv@test.com'])
+
+        link = re.search(r'/accounts/reset/[\w-]+/[\w-]+/', mail.outbox[0].body).group(0)
+        response = self.client.get(link, follow=True)
+        self.client.post(response.redirect_chain[-1][0],
+                         {'new_password1': 'abcdef123456', 'new_password2': 'abcdef123456'})
+        self.assertTrue(self.client.login(username='inv@test.com', password='abcdef123456'))
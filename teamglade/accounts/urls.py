@@ -1,6 +1,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
+from .forms import RoomUserPasswordResetForm
 
 urlpatterns = [
     path('signup/', views.signup, name='signup'),
@@ -12,6 +13,7 @@ urlpatterns = [
     path('reset/',
         auth_views.PasswordResetView.as_view(
             template_name='password_reset.html',
+            form_class=RoomUserPasswordResetForm,
             email_template_name='password_reset_email.html',
             subject_template_name='password_reset_subject.txt'
             ),
@@ -26,6 +28,7 @@ urlpatterns = [
         name='password_change'),
     path('settings/password/done/', auth_views.PasswordChangeDoneView.as_view(template_name='password_change_done.html'),
         name='password_change_done'),
+    path('settings/password/set/', views.password_set, name='password_set'),
     path('settings/account/', views.UserUpdateView.as_view(), name='my_account'),
     # path('settings/account/', views.UserSettings.as_view(), name='my_account'),
     # path('settings/account/', views.ClientUpdateView.as_view(), name='my_account'),
@@ -1,5 +1,6 @@
-from django.contrib.auth import login, get_user_model, logout
+from django.contrib.auth import login, get_user_model, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.forms import SetPasswordForm
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import EmailMessage
 from django.http import HttpResponseRedirect, Http404
@@ -10,6 +11,7 @@ from django.utils.decorators import method_decorator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.views.generic import UpdateView
+from rooms.fragment_cache import bump_room_version
 from rooms.models import RoomUser, Room
 from .forms import RoomUserCreationForm, UserUpdateForm
 import logging
@@ -31,14 +33,11 @@ class UserUpdateView(UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        user = self.request.user
+        # room is resolved once per request by rooms.middleware.UserRoomMiddleware
+        roomname_field = context['form'].fields["roomname"]
+        roomname_field.initial = self.request.room.name
         # if user is owner of this room he can edit room name, otherwise not
-        if user.rooms.first() is not None:
-            roomname_field = context['form'].fields["roomname"]
-            roomname_field.initial = user.rooms.first().name
-        else:
-            roomname_field = context['form'].fields["roomname"]
-            roomname_field.initial = user.member_of.name
+        if not self.request.is_room_owner:
             roomname_field.disabled = True
             roomname_field.help_text = "Invited users can't change room name"
 
@@ -47,9 +46,13 @@ class UserUpdateView(UpdateView):
     def form_valid(self, form):
         user = form.save()
 
+        # rows of topics table in user's room show usernames of authors
+        if 'username' in form.changed_data and self.request.room:
+            bump_room_version(self.request.room.pk)
+
         # if user is owner of this room - room name is saving, if invited user - not
-        if user.rooms.first() is not None:
-            room = user.rooms.first()
+        if self.request.is_room_owner:
+            room = self.request.room
             room.name = form.cleaned_data['roomname']
             room.save()
 
@@ -105,6 +108,25 @@ def signup(request):
     return render(request, 'signup.html', {'form': form})
 
 
+@login_required
+def password_set(request):
+    # invited user logged in by the invite link has no password yet, there is no old one to ask
+    if request.user.has_usable_password():
+        return redirect('password_change')
+
+    if request.method == 'POST':
+        form = SetPasswordForm(request.user, request.POST)
+        if form.is_valid():
+            user = form.save()
+            # keep user logged in, session is bound to the password hash
+            update_session_auth_hash(request, user)
+            return redirect('room')
+    else:
+        form = SetPasswordForm(request.user)
+
+    return render(request, 'password_set.html', {'form': form})
+
+
 def email_confirmation(request, uidb64):
     return render(request, 'email_confirmation_sent.html', {'context': uidb64})
 
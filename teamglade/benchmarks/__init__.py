@@ -0,0 +1,33 @@
+"""
+Benchmarks of views while tables grow, run from the project directory, e.g.:
+    python -m benchmarks.topic_open --sizes 100 1000
+    python -m benchmarks.invite_login --sizes 1000 10000
+Every run works in its own process with a test database (created like by manage.py test
+and destroyed afterwards), database of the site is never touched. Not deployed (see .dockerignore).
+"""
+import os
+from contextlib import contextmanager
+
+import django
+
+
+@contextmanager
+def benchmark_environment():
+    """
+    Helper function.
+    Configures Django for the test client and creates test database for the time of the benchmark.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'teamglade.settings')
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    # test client needs "testserver" in ALLOWED_HOSTS
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
@@ -0,0 +1,91 @@
+"""
+Benchmark of invite link login latency while the users table grows.
+"""
+import argparse
+from statistics import median
+from time import perf_counter
+from django.contrib.auth.hashers import make_password
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from . import benchmark_environment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Number of invited users (with pending invites) for each step.')
+    parser.add_argument('--repeat', type=int, default=50, help='Invite logins measured for each step.')
+    options = parser.parse_args()
+
+    with benchmark_environment():
+        run(options.sizes, options.repeat)
+
+
+def run(sizes, repeat):
+    # models are imported when apps are ready
+    from rooms.models import Room, RoomUser
+
+    # unusable password, shared by all users - generated once
+    password = make_password(None)
+    owner = RoomUser.objects.create_user(username='bench_invite_login', password='bench')
+    room = Room.objects.create(name='Benchmark room', created_by=owner)
+    client = Client()
+
+    print('{:>10} {:>12} {:>12} {:>8}'.format('users', 'median, ms', 'max, ms', 'queries'))
+    created = 0
+    for size in sorted(sizes):
+        created = grow_users(room, password, created, size)
+
+        # with DEBUG=True queries log is limited, start capturing with an empty one
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse('login_invite', kwargs={'code': invite(room, password, 'queries', size)}))
+        client.logout()
+
+        timings = measure(client, room, password, size, repeat)
+        print('{:>10} {:>12.2f} {:>12.2f} {:>8}'.format(size, median(timings), max(timings), len(queries)))
+
+
+def grow_users(room, password, created, size, batch_size=5000):
+    from rooms.backends import new_invite_token
+    from rooms.models import RoomUser
+
+    while created < size:
+        count = min(batch_size, size - created)
+        users = []
+        for i in range(created, created + count):
+            token, token_hash, expires_at = new_invite_token()
+            users.append(RoomUser(username='bench_{}@test.com'.format(i), email='bench_{}@test.com'.format(i),
+                                  password=password, invite_token=token_hash,
+                                  invite_expires_at=expires_at, member_of=room))
+        RoomUser.objects.bulk_create(users)
+        created += count
+    return created
+
+
+def invite(room, password, name, size):
+    from rooms.backends import new_invite_token
+    from rooms.models import RoomUser
+
+    # token of a new invited user, tokens are single-use
+    token, token_hash, expires_at = new_invite_token()
+    RoomUser.objects.create(username='bench_{}_{}@test.com'.format(name, size), password=password,
+                            invite_token=token_hash, invite_expires_at=expires_at, member_of=room)
+    return token
+
+
+def measure(client, room, password, size, repeat):
+    urls = [reverse('login_invite', kwargs={'code': invite(room, password, i, size)}) for i in range(repeat)]
+    timings = []
+    for url in urls:
+        start = perf_counter()
+        client.get(url)
+        timings.append((perf_counter() - start) * 1000)
+        client.logout()
+    return timings
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of topic view latency while the room grows.
+"""
+import argparse
+from statistics import median
+from time import perf_counter
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from . import benchmark_environment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help='Number of topics in the room for each step.')
+    parser.add_argument('--repeat', type=int, default=50, help='Topic opens measured for each step.')
+    options = parser.parse_args()
+
+    with benchmark_environment():
+        run(options.sizes, options.repeat)
+
+
+def run(sizes, repeat):
+    # models are imported when apps are ready
+    from rooms.models import Room, RoomUser, Topic
+
+    user = RoomUser.objects.create_user(username='bench_topic_open', password='bench')
+    room = Room.objects.create(name='Benchmark room', created_by=user)
+    client = Client()
+    client.force_login(user)
+
+    print('{:>10} {:>12} {:>12} {:>8}'.format('topics', 'newest, ms', 'oldest, ms', 'queries'))
+    created = 0
+    for size in sorted(sizes):
+        created = grow_room(room, user, created, size)
+        newest = Topic.objects.filter(room=room).order_by('-created_at', '-id').first()
+        oldest = Topic.objects.filter(room=room).order_by('created_at', 'id').first()
+
+        # with DEBUG=True queries log is limited, start capturing with an empty one
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse('topic', kwargs={'pk': newest.pk}))
+
+        print('{:>10} {:>12.2f} {:>12.2f} {:>8}'.format(
+            size, measure(client, newest, repeat), measure(client, oldest, repeat), len(queries)))
+
+
+def grow_room(room, user, created, size, batch_size=5000):
+    from rooms.models import Topic
+
+    while created < size:
+        count = min(batch_size, size - created)
+        Topic.objects.bulk_create(
+            Topic(title='Benchmark topic #{}'.format(created + i), message='ok', room=room, created_by=user)
+            for i in range(count)
+        )
+        created += count
+    return created
+
+
+def measure(client, topic, repeat):
+    url = reverse('topic', kwargs={'pk': topic.pk})
+    timings = []
+    for i in range(repeat):
+        start = perf_counter()
+        client.get(url)
+        timings.append((perf_counter() - start) * 1000)
+    return median(timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import RoomUser, Room, Topic, File
+from django.utils import timezone
+from .models import RoomUser, Room, Topic, File, OutboxMessage
 
 class FileInline(admin.TabularInline):
     model = File
@@ -13,3 +14,17 @@ class Admin(admin.ModelAdmin):
 admin.site.register(RoomUser)
 admin.site.register(Room)
 admin.site.register(Topic, Admin)
+
+
+@admin.action(description='Send again')
+def requeue(modeladmin, request, queryset):
+    queryset.update(status=OutboxMessage.PENDING, attempts=0, next_attempt_at=timezone.now())
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status']
+    actions = [requeue]
+
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RoomsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rooms'
+
+    def ready(self):
+        import rooms.checks  # noqa
+        import rooms.fragment_cache  # noqa
+        import rooms.media_cleanup  # noqa
+        import rooms.read_tracking  # noqa
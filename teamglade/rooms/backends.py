@@ -0,0 +1,55 @@
+"""
+Login of invited users by the token from the invite link.
+Only SHA-256 of the token is stored (RoomUser.invite_token, unique - indexed), the link
+can't be made from the database. The token is random, a fast hash is enough: the check is
+one indexed lookup instead of PBKDF2 of a password. The token is single-use and expires
+after INVITE_TOKEN_EXPIRES seconds.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.utils import timezone
+from .models import RoomUser
+
+
+def new_invite_token():
+    """
+    Helper function.
+    Returns (token for the link, hash to store, expiration time).
+    """
+    token = secrets.token_urlsafe(32)
+    expires_at = timezone.now() + timedelta(seconds=settings.INVITE_TOKEN_EXPIRES)
+    return token, hash_invite_token(token), expires_at
+
+
+def hash_invite_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class InviteTokenBackend(ModelBackend):
+    """
+    authenticate(request, invite_token=...) - user invited with this token.
+    Token is cleared when it's used, a second click (or a concurrent request) gets None.
+    """
+
+    def authenticate(self, request, invite_token=None, **kwargs):
+        if not invite_token:
+            return None
+        token_hash = hash_invite_token(invite_token)
+        user = RoomUser.objects.filter(invite_token=token_hash).first()
+        if user is None or not hmac.compare_digest(user.invite_token, token_hash):
+            return None
+        if user.invite_expires_at is None or user.invite_expires_at < timezone.now() \
+                or not self.user_can_authenticate(user):
+            return None
+
+        # conditional update - only one request uses the token
+        used = RoomUser.objects.filter(pk=user.pk, invite_token=token_hash).update(
+            invite_token=None, invite_expires_at=None)
+        if not used:
+            return None
+        user.invite_token = user.invite_expires_at = None
+        return user
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Room versions of fragment cache have to be seen by all workers, otherwise
+    other workers keep serving stale rows of topics.
+    """
+    if settings.CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+        return [Warning(
+            'Default cache is local to the process, cached rows of topics go stale in other workers.',
+            hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, e.g. Redis.',
+            id='rooms.W001',
+        )]
+    return []
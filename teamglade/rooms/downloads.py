@@ -0,0 +1,161 @@
+"""
+Responses serving attachments to authorized users.
+With ATTACHMENTS_STORAGE = 'object' the browser is redirected to pre-signed URL of the bucket.
+With MEDIA_ACCEL_REDIRECT setting Django only checks access and nginx sends the file
+(X-Accel-Redirect to internal location, see nginx/nginx.conf, nginx handles ranges itself),
+otherwise file is sent by Django with FileResponse: conditional requests (ETag from the hash
+of the content, Last-Modified from the upload time kept in DB - mtime of a content-addressed blob
+changes when the same content is uploaded again) and single byte ranges are supported, so downloads can be
+resumed and cached copies are revalidated with 304. File is never read into memory,
+WSGI server can send it with sendfile (wsgi.file_wrapper).
+"""
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    Part of opened file, from its current position, length bytes.
+    read() never returns more, fileno() lets WSGI server use sendfile
+    (it sends Content-Length bytes from current position).
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def content_disposition(filename):
+    """
+    Helper function.
+    Content-Disposition header value, file is saved under its original name.
+    """
+    # control characters (e.g. newline of a topic title) can't be sent in quoted filename
+    if filename.isascii() and filename.isprintable():
+        return 'attachment; filename="{}"'.format(filename.replace('\\', '\\\\').replace('"', r'\"'))
+    return "attachment; filename*=utf-8''{}".format(quote(filename))
+
+
+def parse_range(header, size):
+    """
+    Helper function.
+    Returns (start, end) of single byte range (end is inclusive),
+    None if there is no range or it can't be parsed (whole file is sent),
+    'unsatisfiable' if range is out of the file.
+    """
+    match = range_re.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: last N bytes
+        length = int(end)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def serve_file(request, file):
+    """
+    Returns response with the content of File object, annotated with uploaded_at (see views.download_file).
+    """
+    content_type = file.content_type or 'application/octet-stream'
+    # content never changes, hash is a strong validator
+    etag = quote_etag(file.sha256) if file.sha256 else None
+    # content of a room is available only to its users
+    return serve_stored(request, file.file, content_type, content_disposition(file.filename()), etag,
+                        file.uploaded_at, 'private, no-cache')
+
+
+def serve_thumbnail(request, file):
+    """
+    Returns response with the thumbnail of File object (see rooms.thumbnails).
+    Thumbnail of a file never changes, browser keeps it without revalidation.
+    """
+    return serve_stored(request, file.thumbnail, 'image/webp', 'inline', quote_etag(file.thumbnail.name),
+                        file.uploaded_at, 'private, max-age=31536000, immutable')
+
+
+def serve_stored(request, field_file, content_type, disposition, etag, uploaded_at, cache_control):
+    """
+    Helper function.
+    Response with the content of the stored file (FieldFile), by one of the ways described above.
+    """
+    if settings.ATTACHMENTS_STORAGE == 'object':
+        # browser downloads the file from the bucket, URL expires in OBJECT_STORAGE_URL_EXPIRES
+        response = HttpResponseRedirect(field_file.storage.download_url(field_file.name, disposition, content_type))
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        # nginx sends the file from internal location with sendfile,
+        # Content-Disposition and Cache-Control of this response are kept
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_LOCATION + field_file.name)
+        response['Content-Disposition'] = disposition
+        response['Cache-Control'] = cache_control
+        return response
+
+    opened = open(field_file.path, 'rb')
+    size = os.fstat(opened.fileno()).st_size
+    last_modified = int(uploaded_at.timestamp())
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        opened.close()
+        response = not_modified
+    else:
+        byte_range = parse_range(request.headers.get('Range'), size)
+        if_range = request.headers.get('If-Range')
+        if byte_range and if_range and if_range not in (etag, http_date(last_modified)):
+            # file changed since the client got the first part
+            byte_range = None
+
+        if byte_range == 'unsatisfiable':
+            opened.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(size)
+        elif byte_range:
+            start, end = byte_range
+            opened.seek(start)
+            response = FileResponse(RangeFile(opened, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        else:
+            response = FileResponse(opened, content_type=content_type)
+            response['Content-Length'] = size
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    response['Content-Disposition'] = disposition
+    return response
@@ -1,24 +1,84 @@
+import csv
+import io
+import json
+import re
+from collections import namedtuple
 from django import forms
-from .models import Topic
+from django.conf import settings
+from django.core import signing
+from django.core.validators import validate_email
+from django.template.defaultfilters import filesizeformat
+from .models import File, Topic
+from .storage import blob_storage
+
+sha256_re = re.compile(r'^[0-9a-f]{64}$')
+
+# file uploaded to object storage by the browser, stored_name is its blob name,
+# upload_name - name it was uploaded to (None if content already attached in the room)
+DirectUpload = namedtuple('DirectUpload', 'name content_type size sha256 stored_name upload_name')
+
+# seconds the form can be sent after the upload, not taken uploads are removed
+# by gc_media command (--min-age is 1 hour by default)
+DIRECT_UPLOAD_MAX_AGE = 3600
+
+
+def sign_upload(user, sha256, upload_name):
+    """
+    Helper function.
+    Upload ticket given by rooms.views.upload_url, valid only for this user.
+    """
+    return signing.dumps({'sha256': sha256, 'name': upload_name}, salt='rooms.upload.{}'.format(user.pk))
+
+
+def load_upload(user, ticket):
+    """
+    Helper function.
+    (sha256, upload name) of the ticket made by sign_upload(), raises signing.BadSignature.
+    """
+    data = signing.loads(ticket, salt='rooms.upload.{}'.format(user.pk), max_age=DIRECT_UPLOAD_MAX_AGE)
+    return data['sha256'], data['name']
 
 
 class MultipleFileInput(forms.ClearableFileInput):
     allow_multiple_selected = True
 
+    def value_from_datadict(self, data, files, name):
+        # all selected files, not only the last one (Django 4.1 widgets return one file)
+        return files.getlist(name)
+
 
 class MultipleFileField(forms.FileField):
-    def __init__(self, *args, **kwargs):
+    default_error_messages = {
+        'max_files': 'Too many files, you can attach up to %(max_files)s files.',
+        'max_file_size': 'File "%(name)s" is too big, you can attach files up to %(max_file_size)s.',
+    }
+
+    def __init__(self, *args, max_files=None, max_file_size=None, **kwargs):
+        # limits are not checked if None
+        self.max_files = max_files
+        self.max_file_size = max_file_size
         kwargs.setdefault("widget", MultipleFileInput())
         super().__init__(*args, **kwargs)
 
     def clean(self, data, initial=None):
         single_file_clean = super().clean
         if isinstance(data, (list, tuple)):
+            if self.max_files is not None and len(data) > self.max_files:
+                raise forms.ValidationError(self.error_messages['max_files'], code='max_files',
+                                            params={'max_files': self.max_files})
             result = [single_file_clean(d, initial) for d in data]
         else:
             result = single_file_clean(data, initial)
         return result
 
+    def validate(self, value):
+        super().validate(value)
+        # called for every file
+        if value and self.max_file_size is not None and value.size > self.max_file_size:
+            raise forms.ValidationError(self.error_messages['max_file_size'], code='max_file_size',
+                                        params={'name': value.name,
+                                                'max_file_size': filesizeformat(self.max_file_size)})
+
 
 class NewTopicForm(forms.Form):
     title = forms.CharField(label='Title', max_length=100)
@@ -31,9 +91,82 @@ class NewTopicForm(forms.Form):
     )
     files = MultipleFileField(
         label='Select a files',
-        help_text='Up to 5 files, up to 5 MB each.',
         widget=MultipleFileInput(attrs={"multiple": True}), required=False
     )
+    # files uploaded to object storage by the browser before submit (see rooms.views.upload_url),
+    # JSON list of {"upload": ticket, "name": ..., "content_type": ...}
+    uploaded = forms.CharField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, upload_error=None, user=None, room=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # direct uploads are checked against the user and the room
+        self.user = user
+        self.room = room
+        # same limits are enforced while request body is read by rooms.uploadhandlers.StreamingFileUploadHandler,
+        # form checks them again for files received by other upload handlers
+        files_field = self.fields['files']
+        files_field.max_files = settings.TOPIC_FILES_MAX_COUNT
+        files_field.max_file_size = settings.TOPIC_FILE_MAX_SIZE
+        files_field.help_text = 'Up to {} files, up to {} each.'.format(
+            files_field.max_files, filesizeformat(files_field.max_file_size))
+        # upload stopped by the handler
+        self.upload_error = upload_error
+
+    def clean_files(self):
+        if self.upload_error:
+            raise forms.ValidationError(self.upload_error)
+        return self.cleaned_data['files']
+
+    def clean_uploaded(self):
+        """
+        Checks upload tickets and sizes, copies uploaded files to their blob names.
+        Knowing SHA-256 of a content doesn't give it: a file is taken only if the browser
+        uploaded it (the storage checked its SHA-256) or it's already attached in the room.
+        Blobs are touched, so deletion of a blob released in the meantime is cancelled
+        (see rooms.media_cleanup).
+        """
+        data = self.cleaned_data['uploaded']
+        if not data:
+            return []
+        if settings.ATTACHMENTS_STORAGE != 'object':
+            raise forms.ValidationError('Direct uploads are not supported.')
+        try:
+            items = [(load_upload(self.user, item['upload']),
+                      str(item['name'])[:255], str(item.get('content_type') or '')[:100])
+                     for item in json.loads(data)]
+        except (ValueError, TypeError, KeyError, signing.BadSignature):
+            raise forms.ValidationError('Invalid list of uploaded files.')
+
+        max_file_size = self.fields['files'].max_file_size
+        uploaded = []
+        for (sha256, upload_name), name, content_type in items:
+            if upload_name is None and not File.objects.filter(
+                    topic__room=self.room, sha256=sha256, blob__isnull=False).exists():
+                raise forms.ValidationError('File "{}" was not uploaded, try again.'.format(name))
+            try:
+                size = blob_storage.size(upload_name or blob_storage.blob_name(sha256))
+            except FileNotFoundError:
+                raise forms.ValidationError('File "{}" was not uploaded, try again.'.format(name))
+            if size > max_file_size:
+                raise forms.ValidationError('File "{}" is too big, you can attach files up to {}.'.format(
+                    name, filesizeformat(max_file_size)))
+            try:
+                if upload_name is None:
+                    stored_name = blob_storage.blob_name(sha256)
+                    blob_storage.touch(stored_name)
+                else:
+                    stored_name = blob_storage.adopt_upload(upload_name, sha256)
+            except FileNotFoundError:
+                raise forms.ValidationError('File "{}" was not uploaded, try again.'.format(name))
+            uploaded.append(DirectUpload(name, content_type, size, sha256, stored_name, upload_name))
+        return uploaded
+
+    def clean(self):
+        cleaned_data = super().clean()
+        max_files = self.fields['files'].max_files
+        if len(cleaned_data.get('files') or []) + len(cleaned_data.get('uploaded') or []) > max_files:
+            self.add_error('files', 'Too many files, you can attach up to {} files.'.format(max_files))
+        return cleaned_data
 
 
 # class NewTopicModelForm(forms.ModelForm):
@@ -49,5 +182,71 @@ class NewTopicForm(forms.Form):
 #         fields = ['title', 'message']
 
 
+class DeleteTopicsForm(forms.Form):
+    # nothing selected is a valid (empty) selection
+    topics = forms.ModelMultipleChoiceField(queryset=Topic.objects.none(), required=False)
+
+    def __init__(self, *args, room, **kwargs):
+        super().__init__(*args, **kwargs)
+        # only topics of this room can be selected
+        self.fields['topics'].queryset = room.topics.all()
+
+
 class SendInviteForm(forms.Form):
     email = forms.EmailField(help_text="Required. Valid email address.")
+
+
+class BulkInviteForm(forms.Form):
+    emails = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 8, 'placeholder': 'one@example.com, two@example.com'}),
+        label='Email addresses', required=False,
+        help_text='Separated by commas, spaces or new lines.',
+    )
+    csv_file = forms.FileField(label='Or CSV file', required=False,
+                               help_text='Every cell with an email address is taken, other cells are ignored.')
+
+    def clean_csv_file(self):
+        csv_file = self.cleaned_data['csv_file']
+        if not csv_file:
+            return []
+        try:
+            text = csv_file.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise forms.ValidationError('CSV file has to be in UTF-8.')
+        # headers and names in other columns are not addresses
+        return [cell.strip() for row in csv.reader(io.StringIO(text)) for cell in row if is_email(cell.strip())]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        addresses = re.split(r'[\s,;]+', cleaned_data.get('emails', '')) + cleaned_data.get('csv_file', [])
+
+        emails, seen, invalid = [], set(), []
+        for address in addresses:
+            if not address:
+                continue
+            if not is_email(address):
+                invalid.append(address)
+            elif address.lower() not in seen:
+                seen.add(address.lower())
+                emails.append(address)
+
+        if invalid:
+            raise forms.ValidationError('Invalid addresses: {}.'.format(', '.join(invalid[:10])))
+        if not emails and not self.errors:
+            raise forms.ValidationError('Enter email addresses or choose a CSV file.')
+        if len(emails) > settings.BULK_INVITE_MAX_COUNT:
+            raise forms.ValidationError('You can invite up to {} people at once.'.format(
+                settings.BULK_INVITE_MAX_COUNT))
+        cleaned_data['addresses'] = emails
+        return cleaned_data
+
+
+def is_email(value):
+    """
+    Helper function.
+    """
+    try:
+        validate_email(value)
+    except forms.ValidationError:
+        return False
+    return True
@@ -0,0 +1,46 @@
+"""
+Versions of cached fragments of the room page (rows of topics table, see room.html).
+Every room has a version number in the cache, it is a part of keys of all fragments of the room.
+Bumping the version makes all fragments of the room stale at once, old entries just expire.
+Version is bumped on topic save or delete (signals, so every way of changing topics is covered)
+and on change of username (rows show usernames of topic authors).
+"""
+from time import time
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Topic
+
+
+def room_version_key(room_id):
+    return 'room-fragments-version:{}'.format(room_id)
+
+
+def get_room_version(room_id):
+    """
+    Returns current version of fragments of the room.
+    """
+    # missing version (new room or evicted key) starts from current time,
+    # so it never matches fragments cached before with an old version
+    return cache.get_or_set(room_version_key(room_id), lambda: int(time() * 1000), timeout=None)
+
+
+def bump_room_version(room_id):
+    """
+    Makes all cached fragments of the room stale.
+    """
+    try:
+        cache.incr(room_version_key(room_id))
+    except ValueError:
+        # there is no version yet, nothing was cached with it
+        pass
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, created, **kwargs):
+    bump_room_version(instance.room_id)
+
+
+@receiver(post_delete, sender=Topic)
+def topic_deleted(sender, instance, **kwargs):
+    bump_room_version(instance.room_id)
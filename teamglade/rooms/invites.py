@@ -0,0 +1,66 @@
+"""
+Invitations of users to a room.
+Invited user gets an account (username and email are the address) and an email with the link
+to rooms.views.LoginInvitedView, with a single-use token (rooms.backends). Users are created with
+one bulk INSERT, without password hashing, invite emails are queued in the same transaction
+(see rooms.outbox), so inviting a whole class is one fast request.
+"""
+from django.contrib.auth.hashers import make_password
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.template.loader import render_to_string
+from django.urls import reverse
+from .backends import new_invite_token
+from .models import RoomUser
+
+INVITE_SUBJECT = "[TeamGlade] You are invited to join TeamGlade room"
+
+
+def registered_addresses(emails):
+    """
+    Helper function.
+    Addresses (lowercase) of emails which are already usernames or emails of users.
+    """
+    emails = [email.lower() for email in emails]
+    users = (RoomUser.objects.annotate(username_lower=Lower('username'), email_lower=Lower('email'))
+             .filter(Q(username_lower__in=emails) | Q(email_lower__in=emails))
+             .values_list('username_lower', 'email_lower'))
+    return {address for user in users for address in user}
+
+
+def invite_users(room, emails, site_url):
+    """
+    Creates invited users of the room and queues their invite emails, in one transaction.
+    Addresses of existing users are skipped. site_url - scheme and host of links.
+    Returns (invited addresses, skipped addresses).
+    """
+    registered = registered_addresses(emails)
+    invited = [email for email in emails if email.lower() not in registered]
+    skipped = [email for email in emails if email.lower() in registered]
+
+    users, tokens = [], []
+    for email in invited:
+        token, token_hash, expires_at = new_invite_token()
+        users.append(RoomUser(username=email, email=email, invite_token=token_hash, invite_expires_at=expires_at,
+                              member_of=room,
+                              # nobody can log in with a password until user sets it
+                              password=make_password(None)))
+        tokens.append(token)
+
+    with transaction.atomic():
+        RoomUser.objects.bulk_create(users)
+        # one connection for all messages (with outbox backend - one INSERT)
+        get_connection().send_messages([invite_message(user, token, site_url) for user, token in zip(users, tokens)])
+    return invited, skipped
+
+
+def invite_message(user, token, site_url):
+    """
+    Helper function.
+    Invite email with the login link of the user.
+    """
+    link = site_url + reverse('login_invite', kwargs={'code': token})
+    html_message = render_to_string('invite_email.html', {'context': link, })
+    return EmailMessage(INVITE_SUBJECT, html_message, to=[user.email])  # FROM field will be DEFAULT_FROM_EMAIL
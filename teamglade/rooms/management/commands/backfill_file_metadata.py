@@ -0,0 +1,55 @@
+import mimetypes
+from os.path import basename
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from rooms.models import File
+from rooms.storage import file_sha256
+
+
+class Command(BaseCommand):
+    help = ("Fills size, content type, original name and SHA-256 of files uploaded before "
+            "these columns were added. Reads files from storage once.")
+
+    fields = ['original_name', 'size', 'content_type', 'sha256']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Files updated with one query.')
+
+    def handle(self, *args, **options):
+        files = (File.objects.filter(Q(size__isnull=True) | Q(sha256='') | Q(content_type='') | Q(original_name=''))
+                 .select_related('blob')
+                 .order_by('pk'))
+
+        updated, missing, batch = 0, 0, []
+        for file in files.iterator(chunk_size=options['batch_size']):
+            try:
+                self.fill(file)
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write('File {} is missing in storage: {}'.format(file.pk, file.file.name))
+                continue
+
+            batch.append(file)
+            if len(batch) >= options['batch_size']:
+                updated += File.objects.bulk_update(batch, self.fields)
+                batch = []
+        if batch:
+            updated += File.objects.bulk_update(batch, self.fields)
+
+        self.stdout.write(self.style.SUCCESS('Updated {} files, {} missing in storage.'.format(updated, missing)))
+
+    def fill(self, file):
+        if not file.original_name:
+            file.original_name = basename(file.file.name)
+        if not file.content_type:
+            file.content_type = mimetypes.guess_type(file.original_name)[0] or 'application/octet-stream'
+
+        # blob knows its size and hash, storage is read only for older files
+        if file.size is None:
+            file.size = file.blob.size if file.blob else file.file.size
+        if not file.sha256:
+            if file.blob:
+                file.sha256 = file.blob.sha256
+            else:
+                with file.file.open('rb') as content:
+                    file.sha256 = file_sha256(content)
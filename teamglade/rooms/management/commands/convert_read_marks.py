@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rooms.models import Topic
+from rooms.read_tracking import convert_m2m_marks
+
+
+class Command(BaseCommand):
+    help = ("Converts read marks of was_read_by table to watermarks and exceptions "
+            "(storage of READ_TRACKING = 'watermark'). Run it before switching the setting.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=int, nargs='*', help='Id of rooms to convert, all rooms by default.')
+        parser.add_argument('--delete-m2m', action='store_true',
+                            help='Delete converted rows of was_read_by table.')
+
+    def handle(self, *args, **options):
+        watermarks, exceptions = convert_m2m_marks(options['room'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            'Created {} watermarks and {} exceptions.'.format(watermarks, exceptions)))
+
+        if options['delete_m2m']:
+            marks = Topic.was_read_by.through.objects.all()
+            if options['room']:
+                marks = marks.filter(topic__room_id__in=options['room'])
+            with transaction.atomic():
+                deleted, _ = marks.delete()
+            self.stdout.write(self.style.SUCCESS('Deleted {} rows of was_read_by table.'.format(deleted)))
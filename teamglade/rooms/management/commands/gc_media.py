@@ -0,0 +1,89 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rooms.models import Blob, File
+from rooms.storage import attachments_storage, blob_storage
+
+
+class Command(BaseCommand):
+    help = ("Removes files of uploads/, thumbnails/ and blobs/ of attachments storage which no File or Blob "
+            "refers to (left by failed deletions or uploads). Deletes in parallel.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Seconds, newer files are kept (uploads in progress).')
+        parser.add_argument('--workers', type=int, default=8, help='Parallel deletions.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Files checked with one query.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list orphan files.')
+
+    def handle(self, *args, **options):
+        older_than = time() - options['min_age']
+        batch_size = options['batch_size']
+
+        orphans = []
+        for storage, directory, referenced in (
+                (attachments_storage, 'uploads', self.referenced_files),
+                (attachments_storage, 'thumbnails', self.referenced_thumbnails),
+                (blob_storage, 'blobs', self.referenced_blobs)):
+            names = list(self.walk(storage, directory, older_than))
+            for i in range(0, len(names), batch_size):
+                batch = names[i:i + batch_size]
+                alive = referenced(batch)
+                orphans.extend((storage, name) for name in batch if name not in alive)
+
+        if options['dry_run']:
+            for storage, name in orphans:
+                self.stdout.write(name)
+            self.stdout.write(self.style.SUCCESS('Found {} orphan files.'.format(len(orphans))))
+            return
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            deleted = sum(executor.map(self.delete, orphans))
+        self.stdout.write(self.style.SUCCESS('Deleted {} orphan files.'.format(deleted)))
+
+    def walk(self, storage, directory, older_than):
+        """
+        Names (relative to storage) of files in the directory older than given time.
+        """
+        if settings.ATTACHMENTS_STORAGE == 'object':
+            # listing returns modification times, one request per 1000 objects
+            for name, head in storage.store.list(directory + '/'):
+                if head['modified'].timestamp() < older_than:
+                    yield name
+            return
+
+        root = storage.path('')
+        for dirpath, dirnames, filenames in os.walk(storage.path(directory)):
+            for filename in filenames:
+                # .gitignore and other service files
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) >= older_than:
+                        continue
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, root).replace(os.sep, '/')
+
+    def referenced_files(self, names):
+        return set(File.objects.filter(file__in=names).values_list('file', flat=True))
+
+    def referenced_thumbnails(self, names):
+        # file deleted while its thumbnail was generated
+        return set(File.objects.filter(thumbnail__in=names).values_list('thumbnail', flat=True))
+
+    def referenced_blobs(self, names):
+        # blobs/incoming has uploads in progress, they are older than min-age only if upload failed
+        return set(Blob.objects.filter(file__in=names).values_list('file', flat=True))
+
+    def delete(self, orphan):
+        storage, name = orphan
+        try:
+            storage.delete(name)
+        except OSError as e:
+            self.stderr.write('Failed to delete {}: {}'.format(name, e))
+            return 0
+        return 1
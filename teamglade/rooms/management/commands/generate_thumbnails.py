@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from rooms.models import File
+from rooms.thumbnails import IMAGE_CONTENT_TYPES, generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = ("Generates thumbnails of image and PDF attachments uploaded before thumbnails were added "
+            "(run backfill_file_metadata first, content type is needed).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Files read with one query.')
+
+    def handle(self, *args, **options):
+        pks = list(File.objects.filter(thumbnail='', content_type__in=IMAGE_CONTENT_TYPES | {'application/pdf'})
+                   .order_by('pk').values_list('pk', flat=True))
+
+        generated = 0
+        for i in range(0, len(pks), options['batch_size']):
+            generated += generate_thumbnails(pks[i:i + options['batch_size']])
+
+        self.stdout.write(self.style.SUCCESS('Generated {} thumbnails of {} files.'.format(generated, len(pks))))
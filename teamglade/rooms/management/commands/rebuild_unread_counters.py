@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from rooms.models import Room
+from rooms.unread import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuilds unread topics counters of all (or selected) rooms from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=int, nargs='*', help='Id of rooms to rebuild, all rooms by default.')
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.all()
+        if options['room']:
+            rooms = rooms.filter(pk__in=options['room'])
+
+        counters = 0
+        for room in rooms.iterator():
+            counters += rebuild_counters(room)
+
+        self.stdout.write(self.style.SUCCESS('Rebuilt {} unread counters.'.format(counters)))
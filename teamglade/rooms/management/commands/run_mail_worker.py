@@ -0,0 +1,58 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from rooms.outbox import MailDelivery, claim_batch, send_batch
+
+
+class Command(BaseCommand):
+    help = ("Sends emails of the outbox (EMAIL_OUTBOX setting) in batches through one open connection, "
+            "retries failed ones with exponential backoff. Runs until SIGTERM/SIGINT.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_WORKER_BATCH_SIZE,
+                            help='Messages taken at once.')
+        parser.add_argument('--interval', type=float, default=settings.MAIL_WORKER_INTERVAL,
+                            help='Seconds between checks of empty outbox.')
+        parser.add_argument('--once', action='store_true', help='Send messages which are due and exit.')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        if not options['once']:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        # connection to the mail service is kept open while the worker runs
+        delivery = MailDelivery()
+        # running totals, the worker can run for months
+        sent = failed = batches = reconnects = 0
+        seconds = max_seconds = 0.0
+        try:
+            while not self.stopping:
+                # database could be restarted while worker waits
+                close_old_connections()
+                batch = claim_batch(options['batch_size'])
+                if batch:
+                    result = send_batch(batch, delivery)
+                    sent += result.sent
+                    failed += result.failed
+                    batches += 1
+                    reconnects += result.reconnects
+                    seconds += result.seconds
+                    max_seconds = max(max_seconds, result.seconds)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        finally:
+            delivery.close()
+
+        self.stdout.write(self.style.SUCCESS('Sent {} emails, {} failed.'.format(sent, failed)))
+        if batches:
+            self.stdout.write('{} batches: {:.3f}s average, {:.3f}s max, {} reconnects.'.format(
+                batches, seconds / batches, max_seconds, reconnects))
+
+    def stop(self, signum, frame):
+        # current batch is finished
+        self.stopping = True
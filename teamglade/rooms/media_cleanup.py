@@ -0,0 +1,146 @@
+"""
+Deletion of attachment files from storage.
+Files are deleted after the transaction commits (rollback leaves them intact), in batches and,
+with MEDIA_DELETE_IN_BACKGROUND setting, in a background thread of the worker, so a cascading
+delete of a topic, room or user doesn't wait for thousands of unlinks.
+Before unlinking, every batch re-checks that files are still not referenced: content-addressed
+blob could be uploaded again in the meantime. Files left behind (e.g. worker was killed)
+are removed by gc_media command.
+"""
+import atexit
+import logging
+import queue
+import threading
+from time import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Blob, File
+
+logger = logging.getLogger(__name__)
+
+# items are tuples (storage, name, sha256 or None, time of commit)
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def delete_on_commit(storage, name, sha256=None):
+    """
+    Deletes the file from storage after current transaction commits.
+    sha256 is given for blob files (see rooms.storage), None for other files.
+    """
+    transaction.on_commit(lambda: _enqueue((storage, name, sha256, time())))
+
+
+# Deletes file when File instance is deleting
+@receiver(pre_delete, sender=File)
+def auto_delete_file_on_delete(sender, instance, **kwargs):
+    # shared blob is released after File row is deleted (see below)
+    if instance.file and not instance.blob_id:
+        delete_on_commit(instance.file.storage, instance.file.name)
+    if instance.thumbnail:
+        delete_on_commit(instance.thumbnail.storage, instance.thumbnail.name)
+
+
+# Deletes blob when its last File is deleted
+@receiver(post_delete, sender=File)
+def release_blob_on_delete(sender, instance, **kwargs):
+    if instance.blob_id:
+        blob = Blob.objects.release(instance.blob_id)
+        if blob is not None:
+            delete_on_commit(blob.file.storage, blob.file.name, blob.sha256)
+
+
+def _enqueue(item):
+    if not settings.MEDIA_DELETE_IN_BACKGROUND:
+        delete_batch([item])
+        return
+    _queue.put(item)
+    _start_worker()
+
+
+def _start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='media-cleanup', daemon=True)
+            _worker.start()
+
+
+def _work():
+    while True:
+        batch = [_queue.get()]
+        # everything waiting now goes in the same batch
+        while len(batch) < settings.MEDIA_DELETE_BATCH_SIZE:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            delete_batch(batch)
+        except Exception:
+            logger.exception("Deletion of %s media files failed", len(batch))
+        finally:
+            # thread has own DB connection
+            close_old_connections()
+            for item in batch:
+                _queue.task_done()
+
+
+def delete_batch(items):
+    """
+    Deletes files which are still not referenced, returns number of deleted files.
+    Checks references with one query for blobs and one for other files.
+    """
+    shas = [sha256 for storage, name, sha256, deleted_at in items if sha256]
+    names = [name for storage, name, sha256, deleted_at in items if not sha256]
+    alive_shas = set(Blob.objects.filter(sha256__in=shas).values_list('sha256', flat=True)) if shas else set()
+    alive_names = set(File.objects.filter(file__in=names).values_list('file', flat=True)) if names else set()
+
+    deleted = 0
+    for storage, name, sha256, deleted_at in items:
+        if sha256 in alive_shas or name in alive_names:
+            continue
+        if sha256 and reused_after(storage, name, deleted_at):
+            continue
+        storage.delete(name)
+        deleted += 1
+    return deleted
+
+
+def reused_after(storage, name, deleted_at):
+    """
+    Helper function.
+    Upload of the same content touches existing blob (see ContentAddressedStorage.adopt),
+    blob touched after its deletion belongs to a new upload whose Blob row isn't committed yet.
+    """
+    try:
+        return storage.get_modified_time(name).timestamp() >= deleted_at
+    except FileNotFoundError:
+        return True
+
+
+def wait():
+    """
+    Blocks until all queued files are deleted.
+    """
+    if _worker is not None and _worker.is_alive():
+        _queue.join()
+
+
+@atexit.register
+def _drain():
+    # worker is a daemon thread, files still in queue are deleted when the process stops
+    items = []
+    while True:
+        try:
+            items.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if items:
+        try:
+            delete_batch(items)
+        except Exception:
+            logger.exception("Deletion of %s media files failed", len(items))
@@ -0,0 +1,44 @@
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils.functional import SimpleLazyObject
+from .models import Room
+
+
+def resolve_user_room(user):
+    """
+    Helper function.
+    Finds the room in which user can operate and user's role in it with a single query.
+    If user is owner - there is a room with relation to user (Room.created_by), it has priority.
+    If user is invited member - he has a relation to Room (field member_of).
+    Returns tuple (room, is_owner), room is None if user has no room (not standard case).
+    """
+    if not user.is_authenticated:
+        return None, False
+
+    owned = Q(created_by=user)
+    room = (Room.objects.filter(owned | Q(pk=user.member_of_id))
+            .annotate(is_owner=ExpressionWrapper(owned, output_field=BooleanField()))
+            .order_by('-is_owner', 'pk')
+            .first())
+    if room is None:
+        return None, False
+    return room, room.is_owner
+
+
+class UserRoomMiddleware:
+    """
+    Resolves user's room at most once per request, views and templates reuse the result:
+        request.room - Room object in which user can operate (None for anonymous user)
+        request.is_room_owner - True if user is owner of this room, False for invited members
+    Both are lazy (like request.user), query runs on first access only,
+    so check them with "if not request.room", not with "is None".
+    Has to be placed after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        resolved = SimpleLazyObject(lambda: resolve_user_room(request.user))
+        request.room = SimpleLazyObject(lambda: resolved[0])
+        request.is_room_owner = SimpleLazyObject(lambda: resolved[1])
+        return self.get_response(request)
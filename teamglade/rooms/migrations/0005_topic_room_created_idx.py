@@ -0,0 +1,17 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0004_remove_topic_files_file'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['room', '-created_at', '-id'], name='topic_room_created_idx'),
+        ),
+    ]
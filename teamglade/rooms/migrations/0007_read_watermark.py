@@ -0,0 +1,41 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0006_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_until_at', models.DateTimeField(null=True)),
+                ('read_until_id', models.BigIntegerField(null=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_watermarks', to='rooms.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_watermarks', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReadException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_exceptions', to='rooms.topic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_exceptions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='readwatermark',
+            constraint=models.UniqueConstraint(fields=('user', 'room'), name='read_watermark_user_room'),
+        ),
+        migrations.AddConstraint(
+            model_name='readexception',
+            constraint=models.UniqueConstraint(fields=('user', 'topic'), name='read_exception_user_topic'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.2 on 2026-10-18 07:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import rooms.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0007_read_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(storage=rooms.storage.ContentAddressedStorage(), upload_to='')),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='rooms.blob'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 08:03
+
+from django.db import migrations, models
+import rooms.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0009_file_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='file',
+            field=models.FileField(storage=rooms.storage.get_blob_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(storage=rooms.storage.get_attachments_storage, upload_to='uploads/'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.2 on 2026-10-18 08:10
+
+from django.db import migrations, models
+import rooms.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0010_attachments_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='thumbnail',
+            field=models.FileField(blank=True, storage=rooms.storage.get_attachments_storage, upload_to='thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.2 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0012_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomuser',
+            name='invite_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='roomuser',
+            name='invite_token',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_invite_tokens(apps, schema_editor):
+    """
+    Pending invite codes of links sent before invite tokens become tokens (SHA-256 of the code),
+    so these links are checked by rooms.backends.InviteTokenBackend. They are single-use
+    and expire like new ones.
+    invite_code was never cleared: only users who never logged in get a token (changing
+    the password requires login), no password hash is checked per row.
+    """
+    RoomUser = apps.get_model('rooms', 'RoomUser')
+    expires_at = timezone.now() + timedelta(seconds=settings.INVITE_TOKEN_EXPIRES)
+    users = (RoomUser.objects.exclude(invite_code='')
+             .filter(invite_token__isnull=True, last_login__isnull=True, is_active=True).order_by('pk'))
+
+    seen, batch = set(), []
+    for user in users.only('pk', 'invite_code').iterator():
+        # codes are not unique, the old lookup took the first user with the code
+        if user.invite_code in seen:
+            continue
+        seen.add(user.invite_code)
+        user.invite_token = hashlib.sha256(user.invite_code.encode()).hexdigest()
+        user.invite_expires_at = expires_at
+        batch.append(user)
+        if len(batch) == 1000:
+            RoomUser.objects.bulk_update(batch, ['invite_token', 'invite_expires_at'])
+            batch = []
+    RoomUser.objects.bulk_update(batch, ['invite_token', 'invite_expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0013_roomuser_invite_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_invite_tokens, migrations.RunPython.noop),
+    ]
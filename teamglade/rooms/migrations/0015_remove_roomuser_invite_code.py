@@ -0,0 +1,17 @@
+# Generated by Django 4.1.2 on 2026-10-18 08:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0014_backfill_invite_tokens'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='roomuser',
+            name='invite_code',
+        ),
+    ]
@@ -1,11 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, F, OuterRef, Q
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import pre_delete
-from django.dispatch.dispatcher import receiver
+from django.utils import timezone
 from os.path import basename
+from .storage import get_attachments_storage, get_blob_storage
 
 class RoomUser(AbstractUser):
-    invite_code = models.CharField(max_length=10)
+    # SHA-256 of the token from the invite link (rooms.backends.InviteTokenBackend), cleared when it's used
+    invite_token = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    invite_expires_at = models.DateTimeField(null=True, blank=True)
     member_of = models.ForeignKey('Room', null=True, on_delete=models.CASCADE, related_name="members")
 
 class Room(models.Model):
@@ -16,6 +20,39 @@ class Room(models.Model):
     def __str__(self):
         return self.name
 
+def topic_read_condition(user):
+    """
+    Condition "topic was read by the user" for filtering/annotating Topic querysets.
+    Depends on READ_TRACKING setting:
+        'm2m' - row in was_read_by table for every read topic
+        'watermark' - topic is older than user's watermark in the room or read out of order (ReadException)
+    user can be user object, id or OuterRef to user of outer query (for usage inside of subqueries).
+    """
+    # reference to user of outer query is one level deeper inside of subquery
+    user_ref = OuterRef(user) if isinstance(user, OuterRef) else user
+
+    if settings.READ_TRACKING == 'watermark':
+        under_watermark = ReadWatermark.objects.filter(user=user_ref, room=OuterRef('room')).filter(
+            Q(read_until_at__gt=OuterRef('created_at')) |
+            Q(read_until_at=OuterRef('created_at'), read_until_id__gte=OuterRef('pk'))
+        )
+        read_out_of_order = ReadException.objects.filter(user=user_ref, topic=OuterRef('pk'))
+        return Exists(under_watermark) | Exists(read_out_of_order)
+
+    was_read = Topic.was_read_by.through.objects.filter(topic=OuterRef('pk'), roomuser=user_ref)
+    return Exists(was_read)
+
+
+class TopicQuerySet(models.QuerySet):
+    def with_read_state(self, user):
+        """
+        Annotates every topic with is_read flag for the user.
+        It is a correlated EXISTS subquery, so it is evaluated only for the rows that are actually
+        fetched (one page), not for the whole reading history of the user.
+        """
+        return self.annotate(is_read=ExpressionWrapper(topic_read_condition(user), output_field=BooleanField()))
+
+
 class Topic(models.Model):
     title = models.CharField(max_length=100)
     message = models.TextField(max_length=1000)
@@ -25,20 +62,146 @@ class Topic(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="topics")
     was_read_by = models.ManyToManyField(RoomUser, related_name='read_topics')
 
+    objects = TopicQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # room page listing and keyset (cursor) pagination: newest topics of the room first
+            models.Index(fields=['room', '-created_at', '-id'], name='topic_room_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+class UnreadCounter(models.Model):
+    """
+    Number of topics in the room that were not read by the user yet.
+    Denormalized value maintained by rooms.unread helpers, so badges don't scan was_read_by.
+    Row is created lazily on first request of the counter.
+    """
+    user = models.ForeignKey(RoomUser, on_delete=models.CASCADE, related_name='unread_counters')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='unread_counters')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'room'], name='unread_counter_user_room'),
+        ]
+
+
+class ReadWatermark(models.Model):
+    """
+    Compact read state of the room for the user (READ_TRACKING = 'watermark').
+    All topics of the room up to the position (created_at, id) were read by the user.
+    Topics after the watermark that were read out of order are kept in ReadException.
+    """
+    user = models.ForeignKey(RoomUser, on_delete=models.CASCADE, related_name='read_watermarks')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='read_watermarks')
+    read_until_at = models.DateTimeField(null=True)
+    read_until_id = models.BigIntegerField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'room'], name='read_watermark_user_room'),
+        ]
+
+
+class ReadException(models.Model):
+    """
+    Topic newer than user's watermark that was read out of order (READ_TRACKING = 'watermark').
+    Rows are removed when watermark moves over them.
+    """
+    user = models.ForeignKey(RoomUser, on_delete=models.CASCADE, related_name='read_exceptions')
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='read_exceptions')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'topic'], name='read_exception_user_topic'),
+        ]
+
+
+class BlobManager(models.Manager):
+    def acquire(self, sha256, name, size):
+        """
+        Returns blob of the content (creates it if needed) with one more reference to it.
+        name - name of already stored blob file (see rooms.storage.ContentAddressedStorage).
+        """
+        with transaction.atomic():
+            # row lock, concurrent release of the last reference waits for this transaction
+            blob, created = self.select_for_update().get_or_create(
+                sha256=sha256, defaults={'file': name, 'size': size})
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob
+
+    def release(self, blob_id):
+        """
+        Removes one reference to the blob, blob is deleted with the last one.
+        Returns deleted blob (its file has to be deleted by caller) or None.
+        """
+        with transaction.atomic():
+            self.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+            blob = self.filter(pk=blob_id, ref_count__lte=0).first()
+            if blob is not None:
+                blob.delete()
+        return blob
+
+
+class Blob(models.Model):
+    """
+    Unique content of attachments, shared by all File objects with the same content.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(storage=get_blob_storage)
+    size = models.BigIntegerField()
+    # number of File objects referring to this blob
+    ref_count = models.PositiveIntegerField(default=0)
+
+    objects = BlobManager()
+
+
 class File(models.Model):
-    file = models.FileField(upload_to='uploads/')
+    # files are in the storage of attachments (ATTACHMENTS_STORAGE setting)
+    file = models.FileField(upload_to='uploads/', storage=get_attachments_storage)
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='files')
+    # files uploaded before content-addressed storage have no blob (file is their own)
+    blob = models.ForeignKey(Blob, null=True, on_delete=models.PROTECT, related_name='files')
+    # metadata saved at upload, rendering of attachments doesn't touch storage
+    # (null/empty for files uploaded before, see backfill_file_metadata command)
+    original_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    # small WebP image of image/PDF attachments, empty until generated (see rooms.thumbnails)
+    thumbnail = models.FileField(upload_to='thumbnails/', storage=get_attachments_storage, blank=True)
 
     # file name without path for topic template
     def filename(self):
-        return basename(self.file.name)
+        return self.original_name or basename(self.file.name)
+
 
 
-# Deletes file when File instance is deleting
-@receiver(pre_delete, sender=File)
-def auto_delete_file_on_delete(sender, instance, **kwargs):
-    if instance.file:
-        instance.file.delete(save=False)
+class OutboxMessage(models.Model):
+    """
+    Email waiting to be sent by run_mail_worker command (see rooms.outbox).
+    Sent messages are deleted, messages failed MAIL_WORKER_MAX_ATTEMPTS times stay as DEAD.
+    """
+    PENDING = 'pending'
+    DEAD = 'dead'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (DEAD, 'Dead')]
+
+    # serialized EmailMessage
+    message = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # worker takes pending messages with next_attempt_at in the past
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return '{} to {}'.format(self.message.get('subject', ''), ', '.join(self.message.get('to', [])))
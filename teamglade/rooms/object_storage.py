@@ -0,0 +1,300 @@
+"""
+Object storage (S3-compatible) for attachments, ATTACHMENTS_STORAGE = 'object'.
+Web workers don't need a shared disk: files are kept in the bucket, browsers upload and download
+them directly with pre-signed URLs, only access checks go through Django.
+OBJECT_STORAGE['CLIENT'] selects the client:
+    's3' - S3ObjectStore, any S3-compatible service (needs boto3 package)
+    'fake' - InMemoryObjectStore, in-process stand-in for tests and development, its pre-signed
+             URLs are served by fake_object_view (routed only with this client, see rooms.urls)
+"""
+import base64
+import hashlib
+import io
+import threading
+from time import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.views.decorators.csrf import csrf_exempt
+
+
+def sha256_checksum(sha256):
+    """
+    Helper function.
+    Hex digest to the form of x-amz-checksum-sha256 header (base64 of bytes).
+    """
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+
+class S3ObjectStore:
+    """
+    Client of S3-compatible storage.
+    """
+    # system metadata kept when object is touched
+    copied_headers = ('CacheControl', 'ContentDisposition', 'ContentEncoding', 'ContentLanguage', 'ContentType')
+
+    def __init__(self, config):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise ImproperlyConfigured("OBJECT_STORAGE['CLIENT'] = 's3' requires boto3 package.")
+        self.client_error = ClientError
+        self.bucket = config['BUCKET']
+        self.client = boto3.client(
+            's3',
+            endpoint_url=config.get('ENDPOINT_URL') or None,
+            region_name=config.get('REGION') or None,
+            aws_access_key_id=config.get('ACCESS_KEY_ID') or None,
+            aws_secret_access_key=config.get('SECRET_ACCESS_KEY') or None,
+        )
+
+    def put(self, key, content, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        # multipart upload for big files, content is read by chunks
+        self.client.upload_fileobj(content, self.bucket, key, ExtraArgs=extra)
+
+    def get(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except self.client_error as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key)
+            raise
+
+    def head(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client_error as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+        return {'size': response['ContentLength'], 'modified': response['LastModified']}
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def copy(self, key, new_key):
+        # server-side copy, the content isn't transferred
+        self.client.copy_object(Bucket=self.bucket, Key=new_key, CopySource={'Bucket': self.bucket, 'Key': key})
+
+    def touch(self, key):
+        # copy onto itself updates LastModified, the content isn't transferred;
+        # S3 allows it only with MetadataDirective='REPLACE', current metadata is passed back
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        metadata = {name: head[name] for name in self.copied_headers if name in head}
+        self.client.copy_object(Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': key},
+                                MetadataDirective='REPLACE', Metadata=head.get('Metadata', {}), **metadata)
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'], {'size': item['Size'], 'modified': item['LastModified']}
+
+    def presigned_get_url(self, key, expires, content_disposition=None, content_type=None):
+        params = {'Bucket': self.bucket, 'Key': key}
+        if content_disposition:
+            params['ResponseContentDisposition'] = content_disposition
+        if content_type:
+            params['ResponseContentType'] = content_type
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+    def presigned_put_url(self, key, expires, sha256, size, content_type):
+        """
+        Returns (url, headers), the service rejects content with another SHA-256 or size.
+        """
+        checksum = sha256_checksum(sha256)
+        url = self.client.generate_presigned_url('put_object', ExpiresIn=expires, Params={
+            'Bucket': self.bucket, 'Key': key, 'ContentType': content_type, 'ContentLength': size,
+            'ChecksumSHA256': checksum,
+        })
+        return url, {'Content-Type': content_type, 'x-amz-checksum-sha256': checksum}
+
+
+class InMemoryObjectStore:
+    """
+    In-process stand-in of S3-compatible storage (objects are kept in memory of the process).
+    Pre-signed URLs point to fake_object_view.
+    """
+    salt = 'rooms.object_storage.fake'
+
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.objects.clear()
+
+    def put(self, key, content, content_type=None):
+        data = b''.join(content.chunks()) if hasattr(content, 'chunks') else content.read()
+        with self.lock:
+            self.objects[key] = (data, content_type, timezone.now())
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.objects:
+                raise FileNotFoundError(key)
+            return io.BytesIO(self.objects[key][0])
+
+    def head(self, key):
+        with self.lock:
+            if key not in self.objects:
+                return None
+            data, content_type, modified = self.objects[key]
+        return {'size': len(data), 'modified': modified}
+
+    def delete(self, key):
+        with self.lock:
+            self.objects.pop(key, None)
+
+    def copy(self, key, new_key):
+        with self.lock:
+            if key not in self.objects:
+                raise FileNotFoundError(key)
+            data, content_type, modified = self.objects[key]
+            self.objects[new_key] = (data, content_type, timezone.now())
+
+    def touch(self, key):
+        with self.lock:
+            if key not in self.objects:
+                raise FileNotFoundError(key)
+            data, content_type, modified = self.objects[key]
+            self.objects[key] = (data, content_type, timezone.now())
+
+    def list(self, prefix):
+        with self.lock:
+            items = [(key, {'size': len(data), 'modified': modified})
+                     for key, (data, content_type, modified) in self.objects.items() if key.startswith(prefix)]
+        return iter(sorted(items))
+
+    def presigned_url(self, key, **params):
+        token = signing.dumps(dict(params, key=key), salt=self.salt)
+        return '{}?{}'.format(reverse('fake_object_storage', kwargs={'key': key}), urlencode({'token': token}))
+
+    def presigned_get_url(self, key, expires, content_disposition=None, content_type=None):
+        return self.presigned_url(key, method='GET', expires=time() + expires,
+                                  content_disposition=content_disposition, content_type=content_type)
+
+    def presigned_put_url(self, key, expires, sha256, size, content_type):
+        url = self.presigned_url(key, method='PUT', expires=time() + expires, sha256=sha256, size=size)
+        return url, {'Content-Type': content_type, 'x-amz-checksum-sha256': sha256_checksum(sha256)}
+
+
+fake_store = InMemoryObjectStore()
+
+
+def get_object_store():
+    config = settings.OBJECT_STORAGE
+    if config['CLIENT'] == 'fake':
+        return fake_store
+    return S3ObjectStore(config)
+
+
+@csrf_exempt
+def fake_object_view(request, key):
+    """
+    Serves pre-signed URLs of InMemoryObjectStore (GET - download, PUT - upload).
+    """
+    if settings.OBJECT_STORAGE['CLIENT'] != 'fake':
+        raise Http404
+    try:
+        params = signing.loads(request.GET.get('token', ''), salt=InMemoryObjectStore.salt)
+    except signing.BadSignature:
+        return HttpResponseForbidden()
+    if params['key'] != key or params['method'] != request.method or params['expires'] < time():
+        return HttpResponseForbidden()
+
+    if request.method == 'PUT':
+        # request.body is limited by DATA_UPLOAD_MAX_MEMORY_SIZE, files are bigger
+        data = request.read()
+        # like S3 with x-amz-checksum-sha256, content must match signed hash and size
+        if len(data) != params['size'] or hashlib.sha256(data).hexdigest() != params['sha256']:
+            return HttpResponseBadRequest('Checksum mismatch')
+        fake_store.put(key, io.BytesIO(data), request.content_type)
+        return HttpResponse()
+
+    try:
+        content = fake_store.get(key).read()
+    except FileNotFoundError:
+        raise Http404
+    response = HttpResponse(content, content_type=params['content_type'] or 'application/octet-stream')
+    if params['content_disposition']:
+        response['Content-Disposition'] = params['content_disposition']
+    return response
+
+
+fake_object_url = path('fake-object-storage/<path:key>', fake_object_view, name='fake_object_storage')
+
+
+@deconstructible
+class ObjectStorage(Storage):
+    """
+    Django storage on top of object store client (see get_object_store()).
+    """
+
+    def __init__(self, store=None):
+        self.store = store or get_object_store()
+
+    def _open(self, name, mode='rb'):
+        return File(self.store.get(name), name)
+
+    def _save(self, name, content):
+        self.store.put(name, content, getattr(content, 'content_type', None))
+        return name
+
+    def delete(self, name):
+        self.store.delete(name)
+
+    def touch(self, name):
+        self.store.touch(name)
+
+    def exists(self, name):
+        return self.store.head(name) is not None
+
+    def size(self, name):
+        head = self.store.head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['size']
+
+    def get_modified_time(self, name):
+        head = self.store.head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head['modified']
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = set(), []
+        for key, head in self.store.list(prefix):
+            rest = key[len(prefix):]
+            if '/' in rest:
+                directories.add(rest.split('/', 1)[0])
+            else:
+                files.append(rest)
+        return sorted(directories), files
+
+    def url(self, name):
+        return self.store.presigned_get_url(name, settings.OBJECT_STORAGE_URL_EXPIRES)
+
+    def download_url(self, name, content_disposition, content_type):
+        """
+        Pre-signed URL, the browser downloads the file from storage directly.
+        """
+        return self.store.presigned_get_url(name, settings.OBJECT_STORAGE_URL_EXPIRES,
+                                            content_disposition=content_disposition, content_type=content_type)
+
+    def upload_url(self, name, sha256, size, content_type):
+        """
+        Pre-signed URL and headers for direct upload of content with given SHA-256 and size.
+        """
+        return self.store.presigned_put_url(name, settings.OBJECT_STORAGE_URL_EXPIRES, sha256, size, content_type)
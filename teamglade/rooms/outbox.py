@@ -0,0 +1,199 @@
+"""
+Outbox of emails.
+With EMAIL_OUTBOX setting (off by default) EMAIL_BACKEND is OutboxEmailBackend: messages (invites, confirmations,
+password resets, contact form) are saved to OutboxMessage table, the response doesn't wait
+for the mail service. Message saved in a transaction which is rolled back is never sent.
+run_mail_worker command has to run, it sends them with MAIL_WORKER_EMAIL_BACKEND in batches, through one
+connection kept open by the worker (MailDelivery), time of every batch is logged. Failed message
+is retried with exponential backoff, after MAIL_WORKER_MAX_ATTEMPTS attempts it's DEAD (kept for
+inspection, can be requeued in admin). Delivery is at least once: message sent by a worker
+killed before it deleted the row is sent again when its lease expires.
+"""
+import base64
+import logging
+import random
+import time
+from collections import namedtuple
+from datetime import timedelta
+from smtplib import SMTPServerDisconnected
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    Saves messages to the outbox instead of sending them.
+    """
+
+    def send_messages(self, email_messages):
+        rows = [OutboxMessage(message=serialize_message(message)) for message in email_messages
+                if message.recipients()]
+        OutboxMessage.objects.bulk_create(rows)
+        return len(rows)
+
+
+def serialize_message(message):
+    """
+    Helper function.
+    EmailMessage to JSON-compatible dict.
+    """
+    attachments = []
+    for attachment in message.attachments:
+        if not isinstance(attachment, tuple):
+            raise ValueError('MIME attachments are not supported by the outbox.')
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode()
+        attachments.append([filename, base64.b64encode(content).decode(), mimetype])
+
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': list(message.to),
+        'cc': list(message.cc),
+        'bcc': list(message.bcc),
+        'reply_to': list(message.reply_to),
+        'headers': dict(message.extra_headers),
+        'content_subtype': message.content_subtype,
+        'alternatives': [list(alternative) for alternative in getattr(message, 'alternatives', [])],
+        'attachments': attachments,
+    }
+
+
+def deserialize_message(data):
+    """
+    Helper function.
+    EmailMessage from the dict made by serialize_message().
+    """
+    message = EmailMultiAlternatives(
+        subject=data['subject'], body=data['body'], from_email=data['from_email'],
+        to=data['to'], cc=data['cc'], bcc=data['bcc'], reply_to=data['reply_to'], headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in data['alternatives']],
+    )
+    message.content_subtype = data['content_subtype']
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def claim_batch(size):
+    """
+    Pending messages which are due, oldest first. They are leased for MAIL_WORKER_LEASE seconds,
+    other workers don't take them while they are sent.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(OutboxMessage.objects.select_for_update(skip_locked=True)
+                     .filter(status=OutboxMessage.PENDING, next_attempt_at__lte=now)
+                     .order_by('next_attempt_at')[:size])
+        OutboxMessage.objects.filter(pk__in=[m.pk for m in batch]).update(
+            next_attempt_at=now + timedelta(seconds=settings.MAIL_WORKER_LEASE))
+    return batch
+
+
+# errors of a broken connection (server closed idle session, network error), the message wasn't sent
+RECONNECT_ERRORS = (SMTPServerDisconnected, ConnectionError)
+
+
+class MailDelivery:
+    """
+    Connection of the worker to the mail service (SMTP session or HTTP session of Anymail),
+    opened once and kept between batches, so the handshake and TLS negotiation are not repeated
+    for every message. Broken connection (RECONNECT_ERRORS) is reopened and the message is sent
+    again before it's counted as failed, other errors fail the message without resending.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or settings.MAIL_WORKER_EMAIL_BACKEND
+        self.connection = None
+        self.reconnects = 0
+
+    def open(self):
+        if self.connection is None:
+            self.connection = get_connection(self.backend)
+            self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def send(self, message):
+        try:
+            self.open().send_messages([message])
+        except RECONNECT_ERRORS:
+            # connection was lost before the message was sent, it's sent again on a new one
+            self.close()
+            self.reconnects += 1
+            self.open().send_messages([message])
+        except Exception:
+            # the message could be accepted already (e.g. timeout of the response), it's not sent
+            # again now but retried later; state of the connection is unknown, next message opens a new one
+            self.close()
+            raise
+
+
+# result of send_batch(), seconds - time of the batch delivery
+BatchResult = namedtuple('BatchResult', 'sent failed seconds reconnects')
+
+
+def send_batch(batch, delivery):
+    """
+    Sends claimed messages through the connection of MailDelivery.
+    Sent messages are deleted, failed ones are scheduled for retry or become DEAD.
+    Each message is a separate send_messages() call on the open connection: a batch call
+    failed in the middle doesn't tell which messages were already sent.
+    """
+    started = time.monotonic()
+    reconnects = delivery.reconnects
+    sent, failed = [], []
+    for outbox_message in batch:
+        try:
+            delivery.send(deserialize_message(outbox_message.message))
+        except Exception as e:
+            schedule_retry(outbox_message, e)
+            failed.append(outbox_message)
+        else:
+            sent.append(outbox_message.pk)
+
+    OutboxMessage.objects.filter(pk__in=sent).delete()
+    OutboxMessage.objects.bulk_update(failed, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+
+    result = BatchResult(len(sent), len(failed), time.monotonic() - started, delivery.reconnects - reconnects)
+    logger.info("Email batch: %s sent, %s failed in %.3fs (%.1f ms per message), %s reconnects",
+                result.sent, result.failed, result.seconds, result.seconds * 1000 / len(batch), result.reconnects)
+    return result
+
+
+def schedule_retry(outbox_message, error):
+    outbox_message.attempts += 1
+    outbox_message.last_error = '{}: {}'.format(type(error).__name__, error)
+    if outbox_message.attempts >= settings.MAIL_WORKER_MAX_ATTEMPTS:
+        outbox_message.status = OutboxMessage.DEAD
+        logger.error("Email %s is dead after %s attempts: %s",
+                     outbox_message.pk, outbox_message.attempts, outbox_message.last_error)
+    else:
+        outbox_message.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(outbox_message.attempts))
+        logger.warning("Email %s failed (attempt %s): %s",
+                       outbox_message.pk, outbox_message.attempts, outbox_message.last_error)
+
+
+def retry_delay(attempts):
+    """
+    Helper function.
+    Seconds before the next attempt: doubled after every failure, up to MAIL_WORKER_MAX_RETRY_DELAY,
+    with random jitter, so messages failed together are not retried together.
+    """
+    delay = min(settings.MAIL_WORKER_RETRY_DELAY * 2 ** (attempts - 1), settings.MAIL_WORKER_MAX_RETRY_DELAY)
+    return delay * random.uniform(0.5, 1)
@@ -0,0 +1,87 @@
+from datetime import datetime
+from django.db.models import Q
+from django.http import Http404
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+
+
+class CursorPage:
+    """
+    One page of objects returned by CursorPaginator.
+    Mimics the part of django.core.paginator.Page interface used by ListView and templates.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset (cursor) paginator for querysets ordered by newest first (created_at, id).
+    Unlike offset pagination it doesn't run COUNT(*) and doesn't skip rows with OFFSET,
+    so every page costs the same index range scan no matter how deep it is.
+    Cursors are opaque url-safe strings, they keep direction and position of the boundary row.
+    """
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def encode_cursor(self, direction, obj):
+        raw = '{0}|{1}|{2}'.format(direction, obj.created_at.isoformat(), obj.pk)
+        return urlsafe_base64_encode(force_bytes(raw))
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, created_at, pk = urlsafe_base64_decode(cursor).decode().split('|')
+            if direction not in (self.NEXT, self.PREVIOUS):
+                raise ValueError
+            return direction, datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            # broken or malicious cursor typed in address bar
+            raise Http404('Invalid cursor')
+
+    def page(self, cursor=None):
+        size = self.per_page
+
+        if not cursor:
+            rows = list(self.queryset.order_by('-created_at', '-id')[:size + 1])
+            has_next, has_previous = len(rows) > size, False
+            rows = rows[:size]
+        else:
+            direction, created_at, pk = self.decode_cursor(cursor)
+            if direction == self.NEXT:
+                # rows older than the last row of the previous page
+                older = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                rows = list(self.queryset.filter(older).order_by('-created_at', '-id')[:size + 1])
+                has_next, has_previous = len(rows) > size, True
+                rows = rows[:size]
+            else:
+                # rows newer than the first row of the next page, fetched in reverse order
+                newer = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                rows = list(self.queryset.filter(newer).order_by('created_at', 'id')[:size + 1])
+                has_next, has_previous = True, len(rows) > size
+                rows = rows[:size][::-1]
+
+        next_cursor = self.encode_cursor(self.NEXT, rows[-1]) if has_next and rows else None
+        previous_cursor = self.encode_cursor(self.PREVIOUS, rows[0]) if has_previous and rows else None
+        return CursorPage(rows, next_cursor, previous_cursor)
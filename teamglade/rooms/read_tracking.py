@@ -0,0 +1,266 @@
+"""
+Marking topics as read by users.
+Callers know read state of the topic from with_read_state() annotation and call mark_read()
+only for unread topics, so repeated opening of a topic doesn't touch the DB at all.
+Marks are written with INSERT ... ON CONFLICT DO NOTHING (no SELECT before INSERT), concurrent
+requests can't fail on the unique (topic, user) pair.
+Storage of marks is selected by READ_TRACKING setting (see models.topic_read_condition()):
+'m2m' - was_read_by table, 'watermark' - ReadWatermark per user and room plus ReadException.
+With READ_MARKS_DEFERRED setting marks are buffered in the worker and written in batches
+after responses were sent (request_finished signal), or by a timer READ_MARKS_FLUSH_INTERVAL
+after the first buffered mark when the worker goes idle, see flush_read_marks(). Room page writes
+pending marks of its user first. Buffered marks are lost if the worker is killed (SIGKILL, OOM),
+these topics stay unread for the user.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from time import monotonic
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.dispatch import receiver
+from .models import ReadException, ReadWatermark, Topic
+from . import unread
+
+logger = logging.getLogger(__name__)
+
+# pending marks of this worker - set of (topic_id, room_id, user_id)
+_pending = set()
+_pending_lock = threading.Lock()
+_last_flush = monotonic()
+
+
+def mark_read(topic, user):
+    """
+    Marks the unread topic as read by the user and decreases unread counter.
+    """
+    if settings.READ_MARKS_DEFERRED:
+        with _pending_lock:
+            if not _pending:
+                # idle worker doesn't finish requests, timer writes the marks
+                timer = threading.Timer(settings.READ_MARKS_FLUSH_INTERVAL, _flush_by_timer)
+                timer.daemon = True
+                timer.start()
+            _pending.add((topic.pk, topic.room_id, user.pk))
+        return
+
+    write_new_marks([(topic.pk, topic.room_id, user.pk)])
+
+
+def write_new_marks(marks):
+    """
+    Writes marks - list of (topic_id, room_id, user_id) - of topics which are still unread
+    and decreases unread counters by their number. Counter rows are locked first, so concurrent
+    requests marking the same topic (refresh of the page, other workers) wait and see the mark
+    of each other: the counter is decreased once. Marks of deleted topics are skipped.
+    Returns number of new marks.
+    """
+    topics_of_user = defaultdict(set)
+    for topic_id, room_id, user_id in marks:
+        topics_of_user[user_id].add(topic_id)
+
+    with transaction.atomic():
+        unread.lock_counters({(room_id, user_id) for topic_id, room_id, user_id in marks})
+
+        unread_topics = set()
+        for user_id, topic_ids in topics_of_user.items():
+            # deleted topics are not found
+            unread_topics.update(
+                (topic_id, user_id) for topic_id in
+                Topic.objects.filter(pk__in=topic_ids).with_read_state(user_id).filter(is_read=False)
+                .values_list('pk', flat=True)
+            )
+        new_marks = [(topic_id, room_id, user_id) for topic_id, room_id, user_id in marks
+                     if (topic_id, user_id) in unread_topics]
+
+        write_marks(new_marks)
+        read_count = Counter((room_id, user_id) for topic_id, room_id, user_id in new_marks)
+        for (room_id, user_id), count in read_count.items():
+            unread.topics_read(room_id, user_id, count)
+
+    return len(new_marks)
+
+
+def mark_own_topic(topic):
+    """
+    New topic is read by its author (unread counter of the author doesn't change).
+    """
+    write_marks([(topic.pk, topic.room_id, topic.created_by_id)])
+
+
+def write_marks(marks):
+    """
+    Writes read marks - list of (topic_id, room_id, user_id) - to the storage selected by READ_TRACKING setting.
+    Rows are inserted with INSERT ... ON CONFLICT DO NOTHING.
+    """
+    if settings.READ_TRACKING == 'watermark':
+        ReadException.objects.bulk_create(
+            [ReadException(topic_id=topic_id, user_id=user_id) for topic_id, room_id, user_id in marks],
+            ignore_conflicts=True,
+        )
+        for room_id, user_id in {(room_id, user_id) for topic_id, room_id, user_id in marks}:
+            advance_watermark(user_id, room_id)
+    else:
+        through = Topic.was_read_by.through
+        through.objects.bulk_create(
+            [through(topic_id=topic_id, roomuser_id=user_id) for topic_id, room_id, user_id in marks],
+            ignore_conflicts=True,
+        )
+
+
+def advance_watermark(user_id, room_id):
+    """
+    Moves watermark of the user in the room over all topics that were read in a row
+    and removes exceptions that are under the watermark now.
+    User who reads out of order (e.g. newest first) keeps at most READ_EXCEPTIONS_MAX exceptions:
+    watermark is moved over the oldest of them and unread topics before them are treated as read
+    (unread counter decreases).
+    """
+    with transaction.atomic():
+        watermark, created = (ReadWatermark.objects.select_for_update()
+                              .get_or_create(user_id=user_id, room_id=room_id))
+
+        topics = Topic.objects.filter(room_id=room_id).order_by('created_at', 'id')
+        if watermark.read_until_at is not None:
+            topics = topics.filter(after(watermark.read_until_at, watermark.read_until_id))
+
+        read_out_of_order = ReadException.objects.filter(user_id=user_id, topic=OuterRef('pk'))
+        last_read = None
+        exceptions = ReadException.objects.filter(user_id=user_id, topic__room_id=room_id)
+        over_limit = exceptions.count() - settings.READ_EXCEPTIONS_MAX
+        if over_limit > 0:
+            last_read = (exceptions.order_by('topic__created_at', 'topic_id')
+                         .values_list('topic__created_at', 'topic_id')[over_limit - 1])
+            unread.lock_counters({(room_id, user_id)})
+            skipped = topics.exclude(Exists(read_out_of_order)).exclude(after(*last_read)).count()
+            unread.topics_read(room_id, user_id, skipped)
+            topics = topics.filter(after(*last_read))
+
+        first_unread = topics.exclude(Exists(read_out_of_order)).values_list('created_at', 'id').first()
+        if first_unread is None:
+            # all topics of the room were read
+            last_read = topics.values_list('created_at', 'id').last() or last_read
+        else:
+            last_read = (topics.exclude(after(*first_unread)).exclude(pk=first_unread[1])
+                         .values_list('created_at', 'id').last()) or last_read
+        if last_read is None:
+            return
+
+        watermark.read_until_at, watermark.read_until_id = last_read
+        watermark.save(update_fields=['read_until_at', 'read_until_id'])
+        read_until_at, read_until_id = last_read
+        (ReadException.objects.filter(user_id=user_id, topic__room_id=room_id)
+         .filter(Q(topic__created_at__lt=read_until_at) | Q(topic__created_at=read_until_at, topic__id__lte=read_until_id))
+         .delete())
+
+
+def after(created_at, topic_id):
+    """
+    Condition "topic is after the position (created_at, id)".
+    """
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=topic_id)
+
+
+def flush_read_marks():
+    """
+    Writes all pending marks of this worker in one batch, marks of topics deleted in meantime
+    and marks already written by other workers are skipped.
+    Returns number of new marks.
+    """
+    global _last_flush
+    with _pending_lock:
+        marks = list(_pending)
+        _pending.clear()
+        _last_flush = monotonic()
+    if not marks:
+        return 0
+
+    return write_new_marks(marks)
+
+
+def flush_marks_of_user(user_id):
+    """
+    Writes pending marks of this worker if some of them are of the user,
+    so the user sees topics read a moment ago as read.
+    """
+    with _pending_lock:
+        has_marks = any(mark_user_id == user_id for topic_id, room_id, mark_user_id in _pending)
+    if has_marks:
+        flush_read_marks()
+
+
+def convert_m2m_marks(room_ids=None):
+    """
+    Converts read marks of was_read_by table to watermarks and exceptions of rooms (all by default),
+    see convert_read_marks command.
+    Returns number of (watermarks, exceptions) created.
+    """
+    through = Topic.was_read_by.through
+    if room_ids is None:
+        room_ids = Topic.objects.order_by().values_list('room_id', flat=True).distinct()
+
+    created = [0, 0]
+    for room_id in list(room_ids):
+        # all topics of the room in reading order
+        positions = list(Topic.objects.filter(room_id=room_id)
+                         .order_by('created_at', 'id').values_list('created_at', 'id'))
+        position_of = {topic_id: (created_at, topic_id) for created_at, topic_id in positions}
+
+        read_by = defaultdict(set)
+        for topic_id, user_id in (through.objects.filter(topic__room_id=room_id)
+                                  .values_list('topic_id', 'roomuser_id').iterator()):
+            read_by[user_id].add(topic_id)
+
+        watermarks, exceptions = [], []
+        for user_id, read_ids in read_by.items():
+            last_read = None
+            for position in positions:
+                if position[1] not in read_ids:
+                    break
+                last_read = position
+            if last_read is not None:
+                watermarks.append(ReadWatermark(user_id=user_id, room_id=room_id,
+                                                  read_until_at=last_read[0], read_until_id=last_read[1]))
+            exceptions.extend(ReadException(user_id=user_id, topic_id=topic_id) for topic_id in read_ids
+                              if last_read is None or position_of[topic_id] > last_read)
+
+        with transaction.atomic():
+            ReadWatermark.objects.filter(room_id=room_id).delete()
+            ReadException.objects.filter(topic__room_id=room_id).delete()
+            ReadWatermark.objects.bulk_create(watermarks)
+            ReadException.objects.bulk_create(exceptions, batch_size=1000)
+        created[0] += len(watermarks)
+        created[1] += len(exceptions)
+
+    return tuple(created)
+
+
+@receiver(request_finished)
+def flush_read_marks_after_response(sender, **kwargs):
+    """
+    Flushes pending marks in batches: when there are enough of them or they wait too long.
+    """
+    if not _pending:
+        return
+    if len(_pending) >= settings.READ_MARKS_BATCH_SIZE or \
+            monotonic() - _last_flush >= settings.READ_MARKS_FLUSH_INTERVAL:
+        _safe_flush()
+
+
+@atexit.register
+def _safe_flush():
+    # response is already sent (or worker is stopping), error can only be logged
+    # marks left in buffer are written when worker stops
+    try:
+        flush_read_marks()
+    except Exception:
+        logger.exception("Flush of read marks failed")
+
+
+def _flush_by_timer():
+    _safe_flush()
+    # timer thread has own DB connection
+    close_old_connections()
@@ -0,0 +1,172 @@
+"""
+Content-addressed storage of attachments.
+Every unique content is stored once, under the name made of its SHA-256 (blobs/ab/cd/abcd...).
+Topics attaching the same document share the blob, rooms.models.Blob counts references to it.
+ATTACHMENTS_STORAGE setting selects where blobs are kept:
+    'filesystem' - MEDIA_ROOT (ContentAddressedStorage)
+    'object' - S3-compatible object storage (ContentAddressedObjectStorage, see rooms.object_storage)
+Uploads passing through Django are written to an incoming file first (open_incoming()),
+complete file gets its blob name with adopt().
+"""
+import hashlib
+import os
+import tempfile
+from uuid import uuid4
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+from .object_storage import ObjectStorage
+
+
+class ContentAddressedMixin:
+    def blob_name(self, sha256):
+        return 'blobs/{}/{}/{}'.format(sha256[:2], sha256[2:4], sha256)
+
+    def _save(self, name, content):
+        # name is ignored, content defines it
+        sha256 = getattr(content, 'sha256', None) or file_sha256(content)
+        blob_name = self.blob_name(sha256)
+        if self.exists(blob_name):
+            return blob_name
+
+        saved_name = super()._save(blob_name, content)
+        if saved_name != blob_name:
+            # the same content was saved concurrently, storage gave another name to this copy
+            self.delete(saved_name)
+        return blob_name
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    # not yet hashed uploads are written here, then moved to their blob name
+    incoming_dir = 'blobs/incoming'
+
+    def open_incoming(self):
+        """
+        Returns (name, file opened for writing) for a new upload.
+        """
+        name = '{}/{}'.format(self.incoming_dir, uuid4().hex)
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return name, open(path, 'xb')
+
+    def discard_incoming(self, name):
+        self.delete(name)
+
+    def touch(self, name):
+        os.utime(self.path(name))
+
+    def adopt(self, name, sha256):
+        """
+        Moves already written file (name in this storage) to its blob name, without copying.
+        If the blob already exists, the file is just removed and the blob is touched
+        (its deletion scheduled before is cancelled, see rooms.media_cleanup).
+        Returns the blob name.
+        """
+        blob_name = self.blob_name(sha256)
+        blob_path = self.path(blob_name)
+        if self.exists(blob_name):
+            self.touch(blob_name)
+            self.delete(name)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            # atomic, concurrent upload of the same content overwrites it with the same bytes
+            os.replace(self.path(name), blob_path)
+        return blob_name
+
+
+class ContentAddressedObjectStorage(ContentAddressedMixin, ObjectStorage):
+    """
+    Browsers upload files directly to new names in incoming_dir (see rooms.views.upload_url),
+    checked uploads are copied to their blob names (adopt_upload()). Uploads passing through
+    Django are written to a local temporary file and then put to the bucket.
+    """
+    incoming_dir = 'blobs/incoming'
+
+    def new_upload_name(self):
+        return '{}/{}'.format(self.incoming_dir, uuid4().hex)
+
+    def adopt_upload(self, name, sha256):
+        """
+        Copies the file uploaded by the browser (its SHA-256 was checked by the storage service)
+        to its blob name, or touches existing blob. The uploaded file is left, caller deletes it.
+        Returns the blob name.
+        """
+        blob_name = self.blob_name(sha256)
+        if self.exists(blob_name):
+            self.touch(blob_name)
+        else:
+            self.store.copy(name, blob_name)
+        return blob_name
+
+    def open_incoming(self):
+        # name of incoming file is its local path
+        file = tempfile.NamedTemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False)
+        return file.name, file
+
+    def discard_incoming(self, name):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+    def adopt(self, name, sha256):
+        blob_name = self.blob_name(sha256)
+        try:
+            if self.exists(blob_name):
+                self.touch(blob_name)
+            else:
+                with open(name, 'rb') as content:
+                    self.store.put(blob_name, content)
+        finally:
+            os.remove(name)
+        return blob_name
+
+
+class AttachmentsStorage(LazyObject):
+    """
+    Storage selected by ATTACHMENTS_STORAGE setting, created on first use.
+    """
+    storage_classes = {'filesystem': FileSystemStorage, 'object': ObjectStorage}
+
+    def _setup(self):
+        self._wrapped = self.storage_classes[settings.ATTACHMENTS_STORAGE]()
+
+
+class BlobStorage(AttachmentsStorage):
+    storage_classes = {'filesystem': ContentAddressedStorage, 'object': ContentAddressedObjectStorage}
+
+
+# File.file (also files uploaded before blobs) and Blob.file, blob names are the same in both
+attachments_storage = AttachmentsStorage()
+blob_storage = BlobStorage()
+
+
+# callable storages of FileFields, migrations don't depend on the setting
+def get_attachments_storage():
+    return attachments_storage
+
+
+def get_blob_storage():
+    return blob_storage
+
+
+@receiver(setting_changed)
+def reset_storages(setting, **kwargs):
+    if setting in ('ATTACHMENTS_STORAGE', 'OBJECT_STORAGE', 'MEDIA_ROOT'):
+        attachments_storage._wrapped = empty
+        blob_storage._wrapped = empty
+
+
+def file_sha256(content):
+    """
+    Helper function.
+    SHA-256 hex digest of the file, read by chunks.
+    """
+    sha256 = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
@@ -0,0 +1,22 @@
+import shutil
+import tempfile
+from pathlib import Path
+from django.test import TestCase, override_settings
+
+
+class MediaRootTestCase(TestCase):
+    """
+    TestCase with MEDIA_ROOT in a temporary directory, removed with all uploaded files after each test.
+    Subclasses call super().setUp() before creating files.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        return sorted(path.name for path in Path(self.media_root).rglob('*') if path.is_file())
@@ -0,0 +1,36 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class _AssertMaxQueriesContext(CaptureQueriesContext):
+    def __init__(self, test_case, num, connection):
+        self.test_case = test_case
+        self.num = num
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        self.test_case.assertLessEqual(
+            executed, self.num,
+            "%d queries executed, not more than %d expected\nCaptured queries were:\n%s" % (
+                executed, self.num,
+                '\n'.join('%d. %s' % (i, query['sql']) for i, query in enumerate(self.captured_queries, start=1))
+            )
+        )
+
+
+class QueryBudgetMixin:
+    """
+    Mixin for TestCase. Pins the upper limit of DB queries that a view (or any code) may run.
+    Usage:
+        with self.assertMaxQueries(5):
+            self.client.get(url)
+    Unlike assertNumQueries a view that becomes cheaper doesn't fail the test,
+    but any N+1 regression does.
+    """
+
+    def assertMaxQueries(self, num, using=DEFAULT_DB_ALIAS):
+        return _AssertMaxQueriesContext(self, num, connections[using])
@@ -0,0 +1,46 @@
+import hashlib
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from ..models import Room, Topic, RoomUser, File
+from .media_root import MediaRootTestCase
+
+
+class FileMetadataTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=user)
+        self.topic = Topic.objects.create(title='Title', message='Text', created_by=user, room=self.room)
+        self.client.login(username='usr', password='111')
+
+    def test_metadata_saved_at_upload(self):
+        data = {'title': 'Test title', 'message': 'Test Message',
+                'files': [SimpleUploadedFile('doc.pdf', b'%PDF-1.4', content_type='application/pdf')]}
+        self.client.post(reverse('new_topic', kwargs={'pk': self.room.pk}), data)
+        file = File.objects.get()
+        self.assertEquals(file.original_name, 'doc.pdf')
+        self.assertEquals(file.size, 8)
+        self.assertEquals(file.content_type, 'application/pdf')
+        self.assertEquals(file.sha256, hashlib.sha256(b'%PDF-1.4').hexdigest())
+
+    def test_topic_rendered_without_storage(self):
+        File.objects.create(file='uploads/missing.txt', original_name='missing.txt', size=2048, topic=self.topic)
+        response = self.client.get(reverse('topic', kwargs={'pk': self.topic.pk}))
+        self.assertContains(response, 'missing.txt')
+        self.assertContains(response, '(2.0\xa0KB)')
+
+    def test_backfill_command(self):
+        legacy = File.objects.create(file=SimpleUploadedFile('old.txt', b'old content'), topic=self.topic)
+        File.objects.create(file='uploads/missing.txt', topic=self.topic)
+        out, err = StringIO(), StringIO()
+        call_command('backfill_file_metadata', stdout=out, stderr=err)
+
+        legacy.refresh_from_db()
+        self.assertEquals(legacy.original_name, 'old.txt')
+        self.assertEquals(legacy.size, 11)
+        self.assertEquals(legacy.content_type, 'text/plain')
+        self.assertEquals(legacy.sha256, hashlib.sha256(b'old content').hexdigest())
+        self.assertIn('Updated 1 files, 1 missing in storage.', out.getvalue())
+        self.assertIn('uploads/missing.txt', err.getvalue())
@@ -0,0 +1,34 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils.datastructures import MultiValueDict
+from ..forms import NewTopicForm
+
+
+@override_settings(TOPIC_FILES_MAX_COUNT=2, TOPIC_FILE_MAX_SIZE=10)
+class NewTopicFormTests(TestCase):
+    def make_form(self, files, **kwargs):
+        data = {'title': 'Test title', 'message': 'Test Message'}
+        return NewTopicForm(data, MultiValueDict({'files': files}), **kwargs)
+
+    def test_files_within_limits(self):
+        form = self.make_form([SimpleUploadedFile('doc1.txt', b'1' * 10), SimpleUploadedFile('doc2.txt', b'2')])
+        self.assertTrue(form.is_valid())
+        self.assertEquals(len(form.cleaned_data['files']), 2)
+
+    def test_too_many_files(self):
+        form = self.make_form([SimpleUploadedFile('doc{}.txt'.format(i), b'ok') for i in range(3)])
+        self.assertFalse(form.is_valid())
+        self.assertEquals(form.errors['files'], ['Too many files, you can attach up to 2 files.'])
+
+    def test_too_big_file(self):
+        form = self.make_form([SimpleUploadedFile('doc.txt', b'x' * 11)])
+        self.assertFalse(form.is_valid())
+        self.assertEquals(form.errors['files'], ['File "doc.txt" is too big, you can attach files up to 10\xa0bytes.'])
+
+    def test_upload_error(self):
+        form = self.make_form([], upload_error='Upload was stopped.')
+        self.assertFalse(form.is_valid())
+        self.assertEquals(form.errors['files'], ['Upload was stopped.'])
+
+    def test_help_text(self):
+        self.assertEquals(NewTopicForm().fields['files'].help_text, 'Up to 2 files, up to 10\xa0bytes each.')
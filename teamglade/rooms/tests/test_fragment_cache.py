@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.urls import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+from ..checks import check_shared_cache
+from ..fragment_cache import get_room_version
+from ..models import Room, RoomUser, Topic
+
+
+class RoomFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=self.owner)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        self.topic = Topic.objects.create(title='First title', message='Text', created_by=self.owner, room=self.room)
+        self.topic.was_read_by.add(self.owner)
+        self.url = reverse('room')
+        self.client.login(username='usr', password='111')
+
+    def test_rows_are_cached(self):
+        self.client.get(self.url)
+        # update() doesn't send signals - version is the same, cached row is shown
+        Topic.objects.filter(pk=self.topic.pk).update(title='Second title')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'First title')
+
+    def test_version_bumped_on_topic_save_and_delete(self):
+        version = get_room_version(self.room.pk)
+        self.topic.title = 'Second title'
+        self.topic.save()
+        self.assertNotEquals(get_room_version(self.room.pk), version)
+
+        version = get_room_version(self.room.pk)
+        self.topic.delete()
+        self.assertNotEquals(get_room_version(self.room.pk), version)
+
+    def test_changed_topic_is_rendered(self):
+        self.client.get(self.url)
+        self.topic.title = 'Second title'
+        self.topic.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Second title')
+        self.assertNotContains(response, 'First title')
+
+    def test_read_styling_is_per_user(self):
+        # owner caches rows, member reuses them with own read state
+        self.assertNotContains(self.client.get(self.url), 'color: #444; font-weight: bold;')
+        self.client.login(username='usr2', password='222')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'color: #444; font-weight: bold;', count=1)
+        self.assertContains(response, 'First title')
+
+    def test_delete_controls_are_per_user(self):
+        self.client.get(self.url)
+        self.client.login(username='usr2', password='222')
+        response = self.client.get(self.url)
+        self.assertNotContains(response, reverse('delete_topic', kwargs={'pk': self.topic.pk}))
+
+    def test_version_bumped_on_username_change(self):
+        version = get_room_version(self.room.pk)
+        data = {'username': 'usr3', 'email': 'usr@test.com', 'roomname': 'Room name'}
+        self.client.post(reverse('my_account'), data)
+        self.assertNotEquals(get_room_version(self.room.pk), version)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def test_locmem_warning(self):
+        self.assertEquals([w.id for w in check_shared_cache(None)], ['rooms.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://127.0.0.1:6379'}})
+    def test_shared_cache(self):
+        self.assertEquals(check_shared_cache(None), [])
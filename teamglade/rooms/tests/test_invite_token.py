@@ -0,0 +1,59 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.urls import reverse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from ..backends import hash_invite_token, new_invite_token
+from ..models import Room, RoomUser
+
+
+class InviteTokenTests(TestCase):
+    def setUp(self):
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room = Room.objects.create(name='Room name', created_by=owner)
+        self.token, token_hash, expires_at = new_invite_token()
+        self.user = RoomUser.objects.create_user(username='inv@test.com', email='inv@test.com', member_of=room,
+                                                 invite_token=token_hash, invite_expires_at=expires_at)
+        self.url = reverse('login_invite', kwargs={'code': self.token})
+        self.request = RequestFactory().get(self.url)
+
+    def test_token_stored_hashed(self):
+        self.assertEquals(self.user.invite_token, hash_invite_token(self.token))
+        self.assertNotEquals(self.user.invite_token, self.token)
+
+    def test_login(self):
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('password_set'))
+        self.assertEquals(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_no_password_hashing(self):
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode') as encode, \
+                mock.patch.object(PBKDF2PasswordHasher, 'verify') as verify:
+            self.assertEquals(authenticate(self.request, invite_token=self.token), self.user)
+        encode.assert_not_called()
+        verify.assert_not_called()
+
+    def test_single_use(self):
+        self.client.get(self.url)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.invite_token)
+        self.assertIsNone(self.user.invite_expires_at)
+
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 404)
+
+    def test_expired(self):
+        RoomUser.objects.filter(pk=self.user.pk).update(invite_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(authenticate(self.request, invite_token=self.token))
+        self.assertEquals(self.client.get(self.url).status_code, 404)
+
+    def test_inactive_user(self):
+        RoomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(authenticate(self.request, invite_token=self.token))
+
+    def test_wrong_token(self):
+        self.assertIsNone(authenticate(self.request, invite_token=self.token[:-1]))
+        self.assertEquals(self.client.get(reverse('login_invite', kwargs={'code': 'x' * 43})).status_code, 404)
@@ -0,0 +1,96 @@
+import os
+from io import StringIO
+from pathlib import Path
+from time import time
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from ..media_cleanup import delete_batch
+from ..models import Room, Topic, RoomUser, File, Blob
+from ..storage import blob_storage
+from .media_root import MediaRootTestCase
+
+
+@override_settings(MEDIA_DELETE_IN_BACKGROUND=False)
+class MediaTestCase(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=user)
+        self.topic = Topic.objects.create(title='Title', message='Text', created_by=user, room=self.room)
+
+    def make_blob_file(self, content):
+        name = blob_storage.save('doc.txt', ContentFile(content))
+        blob = Blob.objects.acquire(Path(name).name, name, len(content))
+        return File.objects.create(file=name, blob=blob, topic=self.topic)
+
+    def make_old(self, name):
+        old = time() - 7200
+        os.utime(default_storage.path(name), (old, old))
+
+
+class DeleteOnCommitTests(MediaTestCase):
+    def test_deleted_after_commit(self):
+        file = File.objects.create(file=SimpleUploadedFile('doc.txt', b'ok'), topic=self.topic)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.topic.delete()
+        # transaction is not committed yet
+        self.assertTrue(default_storage.exists(file.file.name))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(default_storage.exists(file.file.name))
+
+    def test_rollback_keeps_files(self):
+        file = self.make_blob_file(b'ok')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                self.topic.delete()
+                transaction.set_rollback(True)
+        self.assertEquals(callbacks, [])
+        self.assertTrue(blob_storage.exists(file.file.name))
+        self.assertTrue(Blob.objects.exists())
+
+    def test_reuploaded_blob_kept(self):
+        file = self.make_blob_file(b'ok')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.topic.delete()
+        # the same content uploaded again before deletion
+        Blob.objects.acquire(file.blob.sha256, file.file.name, 2)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(blob_storage.exists(file.file.name))
+
+    def test_delete_batch(self):
+        referenced = File.objects.create(file=SimpleUploadedFile('doc1.txt', b'1'), topic=self.topic)
+        orphan = default_storage.save('uploads/doc2.txt', ContentFile(b'2'))
+        items = [(default_storage, referenced.file.name, None, time()), (default_storage, orphan, None, time())]
+        self.assertEquals(delete_batch(items), 1)
+        self.assertTrue(default_storage.exists(referenced.file.name))
+        self.assertFalse(default_storage.exists(orphan))
+
+
+class GcMediaTests(MediaTestCase):
+    def test_orphans_deleted(self):
+        referenced = File.objects.create(file=SimpleUploadedFile('doc1.txt', b'1'), topic=self.topic)
+        referenced_blob = self.make_blob_file(b'blob')
+        orphan = default_storage.save('uploads/doc2.txt', ContentFile(b'2'))
+        orphan_blob = blob_storage.save('doc.txt', ContentFile(b'orphan'))
+        new_orphan = default_storage.save('uploads/doc3.txt', ContentFile(b'3'))
+        for name in (referenced.file.name, referenced_blob.file.name, orphan, orphan_blob):
+            self.make_old(name)
+
+        out = StringIO()
+        call_command('gc_media', '--dry-run', stdout=out)
+        self.assertIn('Found 2 orphan files.', out.getvalue())
+        self.assertTrue(default_storage.exists(orphan))
+
+        out = StringIO()
+        call_command('gc_media', stdout=out)
+        self.assertIn('Deleted 2 orphan files.', out.getvalue())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertFalse(blob_storage.exists(orphan_blob))
+        for name in (referenced.file.name, referenced_blob.file.name, new_orphan):
+            self.assertTrue(default_storage.exists(name))
@@ -0,0 +1,40 @@
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from ..middleware import UserRoomMiddleware
+from ..models import Room, RoomUser
+
+
+class UserRoomMiddlewareTests(TestCase):
+    def setUp(self):
+        self.owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=self.owner)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        self.middleware = UserRoomMiddleware(lambda request: request)
+
+    def get_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return self.middleware(request)
+
+    def test_owner(self):
+        request = self.get_request(self.owner)
+        with self.assertNumQueries(1):
+            self.assertEquals(request.room, self.room)
+            self.assertTrue(request.is_room_owner)
+
+    def test_invited_member(self):
+        request = self.get_request(self.member)
+        with self.assertNumQueries(1):
+            self.assertEquals(request.room, self.room)
+            self.assertFalse(request.is_room_owner)
+
+    def test_anonymous_user(self):
+        request = self.get_request(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertFalse(request.room)
+            self.assertFalse(request.is_room_owner)
+
+    def test_lazy(self):
+        with self.assertNumQueries(0):
+            self.get_request(self.owner)
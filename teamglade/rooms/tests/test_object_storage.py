@@ -0,0 +1,205 @@
+import hashlib
+import json
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import Resolver404, resolve, reverse
+from django.test import TestCase, override_settings
+from ..media_cleanup import delete_batch
+from ..models import Room, Topic, RoomUser, File, Blob
+from ..forms import sign_upload
+from ..object_storage import S3ObjectStore, fake_store
+from ..storage import blob_storage
+
+
+@override_settings(ATTACHMENTS_STORAGE='object', OBJECT_STORAGE={'CLIENT': 'fake'}, MEDIA_DELETE_IN_BACKGROUND=False,
+                   ROOT_URLCONF='rooms.tests.urls')
+class ObjectStorageTests(TestCase):
+    def setUp(self):
+        fake_store.clear()
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=owner)
+        self.client.login(username='usr', password='111')
+
+    def test_storage_api(self):
+        name = blob_storage.save('doc.txt', ContentFile(b'content'))
+        self.assertEquals(name, blob_storage.blob_name(hashlib.sha256(b'content').hexdigest()))
+        self.assertTrue(blob_storage.exists(name))
+        self.assertEquals(blob_storage.size(name), 7)
+        with blob_storage.open(name) as f:
+            self.assertEquals(f.read(), b'content')
+        self.assertEquals(blob_storage.listdir('blobs'), ([name.split('/')[1]], []))
+        blob_storage.delete(name)
+        self.assertFalse(blob_storage.exists(name))
+
+    def test_upload_through_django(self):
+        url = reverse('new_topic', kwargs={'pk': self.room.pk})
+        data = {'title': 'Title', 'message': 'Text', 'files': [SimpleUploadedFile('doc.txt', b'content')]}
+        response = self.client.post(url, data)
+        self.assertRedirects(response, reverse('room'))
+        file = File.objects.get()
+        self.assertEquals(file.file.name, blob_storage.blob_name(hashlib.sha256(b'content').hexdigest()))
+        self.assertEquals(fake_store.get(file.file.name).read(), b'content')
+
+    def upload(self, content, name='doc.txt'):
+        """
+        Uploads the file as the browser does, returns response of upload_url view.
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        response = self.client.post(reverse('upload_url', kwargs={'pk': self.room.pk}),
+                                    {'sha256': sha256, 'size': len(content), 'name': name,
+                                     'content_type': 'text/plain'})
+        if response.status_code == 200 and not response.json()['exists']:
+            put = self.client.generic('PUT', response.json()['url'], content, content_type='text/plain')
+            self.assertEquals(put.status_code, 200)
+        return response
+
+    def post_topic(self, *uploads):
+        uploaded = [{'upload': response.json()['upload'], 'name': 'Report.txt', 'content_type': 'text/plain'}
+                    for response in uploads]
+        url = reverse('new_topic', kwargs={'pk': self.room.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {'title': 'Title', 'message': 'Text', 'uploaded': json.dumps(uploaded)})
+
+    def test_direct_upload(self):
+        response = self.upload(b'content')
+        self.assertEquals(response.status_code, 200)
+
+        response = self.post_topic(response)
+        self.assertRedirects(response, reverse('room'))
+        file = File.objects.get()
+        self.assertEquals(file.file.name, blob_storage.blob_name(hashlib.sha256(b'content').hexdigest()))
+        self.assertEquals(fake_store.get(file.file.name).read(), b'content')
+        self.assertEquals(file.original_name, 'Report.txt')
+        self.assertEquals(file.size, 7)
+        self.assertEquals(file.blob.ref_count, 1)
+        # uploaded file is copied to the blob and deleted
+        self.assertEquals([key for key, head in fake_store.list('')], [file.file.name])
+
+    def test_same_content_not_uploaded_again(self):
+        self.post_topic(self.upload(b'content'))
+        response = self.upload(b'content')
+        self.assertTrue(response.json()['exists'])
+        self.assertRedirects(self.post_topic(response), reverse('room'))
+        self.assertEquals(Blob.objects.get().ref_count, 2)
+
+    def test_content_of_other_room_not_given_by_hash(self):
+        self.post_topic(self.upload(b'secret'))
+        other = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222')
+        other_room = Room.objects.create(name='Other room', created_by=other)
+        self.client.login(username='usr2', password='222')
+        self.room = other_room
+
+        # stored content is not reported, it has to be uploaded
+        sha256 = hashlib.sha256(b'secret').hexdigest()
+        response = self.client.post(reverse('upload_url', kwargs={'pk': other_room.pk}),
+                                    {'sha256': sha256, 'size': 6, 'name': 'doc.txt'})
+        self.assertFalse(response.json()['exists'])
+        # ticket without upload of the content
+        self.assertContains(self.post_topic(response), 'was not uploaded')
+        # forged tickets
+        forged = [{'upload': sign_upload(other, sha256, None), 'name': 'doc.txt'}]
+        response = self.client.post(reverse('new_topic', kwargs={'pk': other_room.pk}),
+                                    {'title': 'Title', 'message': 'Text', 'uploaded': json.dumps(forged)})
+        self.assertContains(response, 'was not uploaded')
+        forged = [{'sha256': sha256, 'name': 'doc.txt'}]
+        response = self.client.post(reverse('new_topic', kwargs={'pk': other_room.pk}),
+                                    {'title': 'Title', 'message': 'Text', 'uploaded': json.dumps(forged)})
+        self.assertContains(response, 'Invalid list of uploaded files.')
+        self.assertEquals(Topic.objects.filter(room=other_room).count(), 0)
+
+    def test_ticket_of_other_user_rejected(self):
+        response = self.upload(b'content')
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222', member_of=self.room)
+        self.client.login(username='usr2', password='222')
+        self.assertContains(self.post_topic(response), 'Invalid list of uploaded files.')
+
+    def test_upload_too_big(self):
+        with self.settings(TOPIC_FILE_MAX_SIZE=5):
+            response = self.upload(b'content')
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(list(fake_store.list('')), [])
+
+    def test_upload_other_room_not_found(self):
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222')
+        self.client.login(username='usr2', password='222')
+        self.assertEquals(self.upload(b'content').status_code, 404)
+
+    def test_put_checksum_mismatch(self):
+        sha256 = hashlib.sha256(b'content').hexdigest()
+        response = self.client.post(reverse('upload_url', kwargs={'pk': self.room.pk}),
+                                    {'sha256': sha256, 'size': 7, 'name': 'doc.txt'})
+        put = self.client.generic('PUT', response.json()['url'], b'another', content_type='text/plain')
+        self.assertEquals(put.status_code, 400)
+        self.assertEquals(list(fake_store.list('')), [])
+
+    def test_not_uploaded_file_rejected(self):
+        sha256 = hashlib.sha256(b'content').hexdigest()
+        response = self.client.post(reverse('upload_url', kwargs={'pk': self.room.pk}),
+                                    {'sha256': sha256, 'size': 7, 'name': 'doc.txt'})
+        response = self.post_topic(response)
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, 'was not uploaded')
+        self.assertFalse(Topic.objects.exists())
+
+    def test_too_many_files_rejected(self):
+        uploads = [self.upload(b'content %d' % i) for i in range(3)]
+        with self.settings(TOPIC_FILES_MAX_COUNT=2):
+            response = self.post_topic(*uploads)
+        self.assertContains(response, 'Too many files')
+        self.assertFalse(Topic.objects.exists())
+
+    def test_download_redirects_to_storage(self):
+        self.post_topic(self.upload(b'content'))
+        response = self.client.get(reverse('download_file', kwargs={'pk': File.objects.get().pk}))
+        self.assertEquals(response.status_code, 302)
+
+        response = self.client.get(response['Location'])
+        self.assertEquals(response.content, b'content')
+        self.assertEquals(response['Content-Type'], 'text/plain')
+        self.assertEquals(response['Content-Disposition'], 'attachment; filename="Report.txt"')
+
+    def test_download_url_tampered(self):
+        name = blob_storage.save('doc.txt', ContentFile(b'content'))
+        url = blob_storage.url(name)
+        response = self.client.get(url.replace(name, blob_storage.blob_name('0' * 64)))
+        self.assertEquals(response.status_code, 403)
+
+    def test_blob_deleted_with_last_file(self):
+        self.post_topic(self.upload(b'content'))
+        file = File.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            file.topic.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(blob_storage.exists(file.file.name))
+
+    def test_reused_blob_not_deleted(self):
+        name = blob_storage.save('doc.txt', ContentFile(b'content'))
+        sha256 = hashlib.sha256(b'content').hexdigest()
+        # deletion of the blob was queued before it was uploaded again
+        self.assertEquals(delete_batch([(blob_storage, name, sha256, 0)]), 0)
+        self.assertTrue(blob_storage.exists(name))
+
+    def test_gc_media(self):
+        orphan = blob_storage.save('doc.txt', ContentFile(b'orphan'))
+        call_command('gc_media', '--min-age', '-60', stdout=open('/dev/null', 'w'))
+        self.assertFalse(blob_storage.exists(orphan))
+
+
+class S3ObjectStoreTests(TestCase):
+    def test_touch_keeps_metadata(self):
+        store = S3ObjectStore.__new__(S3ObjectStore)
+        store.bucket = 'teamglade'
+        store.client = mock.Mock()
+        store.client.head_object.return_value = {'ContentLength': 7, 'ContentType': 'text/plain',
+                                                 'Metadata': {'name': 'doc.txt'}}
+        store.touch('blobs/abc')
+        store.client.copy_object.assert_called_once_with(
+            Bucket='teamglade', Key='blobs/abc', CopySource={'Bucket': 'teamglade', 'Key': 'blobs/abc'},
+            MetadataDirective='REPLACE', Metadata={'name': 'doc.txt'}, ContentType='text/plain')
+
+    def test_fake_storage_not_routed(self):
+        with self.assertRaises(Resolver404):
+            resolve('/fake-object-storage/blobs/abc')
+
@@ -0,0 +1,198 @@
+import io
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from ..models import OutboxMessage, Room, RoomUser
+from ..outbox import MailDelivery, claim_batch, retry_delay, send_batch
+
+
+@override_settings(EMAIL_BACKEND='rooms.outbox.OutboxEmailBackend',
+                   MAIL_WORKER_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   MAIL_WORKER_MAX_ATTEMPTS=3, MAIL_WORKER_RETRY_DELAY=30, MAIL_WORKER_MAX_RETRY_DELAY=3600,
+                   MAIL_WORKER_LEASE=300)
+class OutboxTests(TestCase):
+    def run_worker(self):
+        out = io.StringIO()
+        call_command('run_mail_worker', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_message_queued_not_sent(self):
+        EmailMessage('Subject', 'Text', to=['usr@test.com']).send()
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(OutboxMessage.objects.get().status, OutboxMessage.PENDING)
+
+    def test_worker_sends_and_deletes(self):
+        message = EmailMultiAlternatives('Subject', 'Text', 'from@test.com', ['usr@test.com'], cc=['cc@test.com'],
+                                         reply_to=['reply@test.com'], headers={'X-Tag': 'invite'})
+        message.attach_alternative('<b>Text</b>', 'text/html')
+        message.attach('notes.txt', b'notes', 'text/plain')
+        message.send()
+
+        self.assertIn('Sent 1 emails, 0 failed.', self.run_worker())
+        self.assertFalse(OutboxMessage.objects.exists())
+        sent = mail.outbox[0]
+        self.assertEquals(sent.subject, 'Subject')
+        self.assertEquals(sent.from_email, 'from@test.com')
+        self.assertEquals(sent.to, ['usr@test.com'])
+        self.assertEquals(sent.cc, ['cc@test.com'])
+        self.assertEquals(sent.reply_to, ['reply@test.com'])
+        self.assertEquals(sent.extra_headers, {'X-Tag': 'invite'})
+        self.assertEquals(sent.alternatives, [('<b>Text</b>', 'text/html')])
+        self.assertEquals(sent.attachments, [('notes.txt', 'notes', 'text/plain')])
+
+    def test_html_content_subtype_kept(self):
+        message = EmailMessage('Subject', '<b>Text</b>', to=['usr@test.com'])
+        message.content_subtype = 'html'
+        message.send()
+        self.run_worker()
+        self.assertEquals(mail.outbox[0].content_subtype, 'html')
+
+    def test_invite_queued(self):
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room = Room.objects.create(name='Room name', created_by=owner)
+        self.client.login(username='usr', password='111')
+        self.client.post(reverse('send_invite', kwargs={'pk': room.pk}), {'email': 'new@test.com'})
+        self.assertEquals(len(mail.outbox), 0)
+        self.run_worker()
+        self.assertEquals(mail.outbox[0].to, ['new@test.com'])
+
+    def test_failed_message_retried_with_backoff(self):
+        EmailMessage('Subject', 'Text', to=['usr@test.com']).send()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=ConnectionError('timeout')):
+            self.assertIn('Sent 0 emails, 1 failed.', self.run_worker())
+
+        message = OutboxMessage.objects.get()
+        self.assertEquals(message.status, OutboxMessage.PENDING)
+        self.assertEquals(message.attempts, 1)
+        self.assertEquals(message.last_error, 'ConnectionError: timeout')
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=10))
+
+        # not due yet
+        self.run_worker()
+        self.assertEquals(len(mail.outbox), 0)
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.run_worker()
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_dead_after_max_attempts(self):
+        EmailMessage('Subject', 'Text', to=['usr@test.com']).send()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=ConnectionError('timeout')):
+            for i in range(3):
+                OutboxMessage.objects.update(next_attempt_at=timezone.now())
+                self.run_worker()
+
+        message = OutboxMessage.objects.get()
+        self.assertEquals(message.status, OutboxMessage.DEAD)
+        self.assertEquals(message.attempts, 3)
+        # dead messages are not taken again
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEquals(claim_batch(10), [])
+
+    def test_claimed_messages_leased(self):
+        EmailMessage('Subject', 'Text', to=['usr@test.com']).send()
+        batch = claim_batch(10)
+        self.assertEquals(len(batch), 1)
+        # another worker doesn't take the message being sent
+        self.assertEquals(claim_batch(10), [])
+        result = send_batch(batch, MailDelivery())
+        self.assertEquals((result.sent, result.failed), (1, 0))
+
+    def test_batch_size(self):
+        for i in range(5):
+            EmailMessage('Subject', 'Text', to=['usr{}@test.com'.format(i)]).send()
+        self.assertEquals(len(claim_batch(2)), 2)
+
+    def test_retry_delay(self):
+        self.assertTrue(15 <= retry_delay(1) <= 30)
+        self.assertTrue(60 <= retry_delay(3) <= 120)
+        self.assertTrue(1800 <= retry_delay(20) <= 3600)
+
+
+@override_settings(EMAIL_BACKEND='rooms.outbox.OutboxEmailBackend')
+class OutboxTransactionTests(TransactionTestCase):
+    def test_rolled_back_message_not_queued(self):
+        try:
+            with transaction.atomic():
+                EmailMessage('Subject', 'Text', to=['usr@test.com']).send()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class FakeConnection:
+    """
+    Backend connection counting opens, first send after drop_after messages fails with error
+    (disconnected by default).
+    """
+    opened = 0
+    sent = []
+    drop_after = None
+    error = ConnectionResetError('disconnected')
+
+    def __init__(self, **kwargs):
+        self.is_open = False
+
+    def open(self):
+        FakeConnection.opened += 1
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        if len(FakeConnection.sent) == FakeConnection.drop_after:
+            FakeConnection.drop_after = None
+            raise FakeConnection.error
+        FakeConnection.sent.extend(messages)
+        return len(messages)
+
+
+@override_settings(EMAIL_BACKEND='rooms.outbox.OutboxEmailBackend',
+                   MAIL_WORKER_EMAIL_BACKEND='rooms.tests.test_outbox.FakeConnection')
+class MailDeliveryTests(TestCase):
+    def setUp(self):
+        FakeConnection.opened = 0
+        FakeConnection.sent = []
+        FakeConnection.drop_after = None
+        FakeConnection.error = ConnectionResetError('disconnected')
+        for i in range(6):
+            EmailMessage('Subject', 'Text', to=['usr{}@test.com'.format(i)]).send()
+
+    def test_connection_kept_between_batches(self):
+        out = io.StringIO()
+        call_command('run_mail_worker', '--once', '--batch-size', '2', stdout=out)
+        self.assertEquals(len(FakeConnection.sent), 6)
+        self.assertEquals(FakeConnection.opened, 1)
+        self.assertIn('Sent 6 emails, 0 failed.', out.getvalue())
+        self.assertIn('3 batches:', out.getvalue())
+
+    def test_reconnects_transparently(self):
+        FakeConnection.drop_after = 3
+        delivery = MailDelivery()
+        result = send_batch(claim_batch(10), delivery)
+        self.assertEquals((result.sent, result.failed, result.reconnects), (6, 0, 1))
+        self.assertEquals(FakeConnection.opened, 2)
+        self.assertEquals(len(FakeConnection.sent), 6)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_other_errors_not_resent(self):
+        # the service could accept the message before the response timed out
+        FakeConnection.drop_after = 3
+        FakeConnection.error = TimeoutError('read timeout')
+        result = send_batch(claim_batch(10), MailDelivery())
+        self.assertEquals((result.sent, result.failed, result.reconnects), (5, 1, 0))
+        self.assertEquals(len(FakeConnection.sent), 5)
+        failed = OutboxMessage.objects.get()
+        self.assertEquals(failed.last_error, 'TimeoutError: read timeout')
+        self.assertEquals(failed.status, OutboxMessage.PENDING)
@@ -0,0 +1,118 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.test import override_settings
+from ..backends import new_invite_token
+from ..models import Room, Topic, RoomUser, File
+from ..unread import rebuild_counters
+from .media_root import MediaRootTestCase
+from .query_budget import QueryBudgetMixin
+
+
+@override_settings(READ_TRACKING='m2m')
+class RoomsQueryBudgetTestCase(QueryBudgetMixin, MediaRootTestCase):
+    """
+    Query count of every rooms view. Budgets don't depend on number of topics, authors or files,
+    so adding rows to the room must not change the result.
+    """
+
+    def setUp(self):
+        # files of deleted topics are removed after commit, tests never commit
+        super().setUp()
+        self.owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=self.owner)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        for i in range(15):
+            author = self.owner if i % 2 else self.member
+            topic = Topic.objects.create(title='Topic #{}'.format(i), message='ok', created_by=author, room=self.room)
+            topic.was_read_by.add(author)
+        self.topic = topic
+        for i in range(3):
+            File.objects.create(file=SimpleUploadedFile('budget_{}.txt'.format(i), b'data'), topic=self.topic)
+        rebuild_counters(self.room)
+        self.client.login(username='usr', password='111')
+
+
+class RoomsQueryBudgetTests(RoomsQueryBudgetTestCase):
+    def test_home(self):
+        with self.assertMaxQueries(3):
+            self.client.get(reverse('home'))
+
+    def test_policy_and_terms(self):
+        with self.assertMaxQueries(3):
+            self.client.get(reverse('policy'))
+        with self.assertMaxQueries(3):
+            self.client.get(reverse('terms'))
+
+    def test_message(self):
+        data = {'name': 'Test Name', 'email': 'test@test.com', 'phone': '1234', 'message': 'Test Message'}
+        with self.assertMaxQueries(3):
+            self.client.post(reverse('message'), data)
+
+    def test_room(self):
+        with self.assertMaxQueries(6):
+            self.client.get(reverse('room'))
+
+    def test_room_second_page(self):
+        with self.assertMaxQueries(6):
+            self.client.get(reverse('room'), {'page': 2})
+
+    def test_room_invited_member(self):
+        self.client.login(username='usr2', password='222')
+        with self.assertMaxQueries(6):
+            self.client.get(reverse('room'))
+
+    def test_topic(self):
+        # first read locks the unread counter and checks the mark again
+        with self.assertMaxQueries(11):
+            self.client.get(reverse('topic', kwargs={'pk': self.topic.pk}))
+
+    def test_topic_already_read(self):
+        url = reverse('topic', kwargs={'pk': self.topic.pk})
+        self.client.get(url)
+        # session, user, room, topic with author and room, attachments
+        with self.assertMaxQueries(5):
+            self.client.get(url)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_download_file(self):
+        url = reverse('download_file', kwargs={'pk': self.topic.files.first().pk})
+        # session, user, file with access check
+        with self.assertMaxQueries(3):
+            self.client.get(url)
+
+    def test_new_topic(self):
+        url = reverse('new_topic', kwargs={'pk': self.room.pk})
+        with self.assertMaxQueries(4):
+            self.client.get(url)
+        with self.assertMaxQueries(9):
+            self.client.post(url, {'title': 'Test title', 'message': 'Test Message'})
+
+    def test_delete_topic(self):
+        url = reverse('delete_topic', kwargs={'pk': self.topic.pk})
+        with self.assertMaxQueries(4):
+            self.client.get(url)
+        with self.assertMaxQueries(12):
+            self.client.post(url)
+
+    def test_delete_topics(self):
+        url = reverse('delete_topics', kwargs={'pk': self.room.pk})
+        topics = Topic.objects.values_list('pk', flat=True)
+        with self.assertMaxQueries(14):
+            self.client.post(url, {'topics': list(topics)})
+
+    def test_send_invite(self):
+        url = reverse('send_invite', kwargs={'pk': self.room.pk})
+        with self.assertMaxQueries(3):
+            self.client.get(url)
+        # lookup of registered addresses, user INSERT in a transaction (savepoint in tests)
+        with self.assertMaxQueries(7):
+            self.client.post(url, {'email': 'test@test.com'})
+
+    def test_login_invited(self):
+        code, token_hash, expires_at = new_invite_token()
+        RoomUser.objects.create_user(username='inv@test.com', email='inv@test.com', invite_token=token_hash,
+                                     invite_expires_at=expires_at, member_of=self.room)
+        self.client.logout()
+        with self.assertMaxQueries(10):
+            self.client.get(reverse('login_invite', kwargs={'code': code}))
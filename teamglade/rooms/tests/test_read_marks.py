@@ -0,0 +1,85 @@
+from unittest import mock
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from ..models import Room, Topic, RoomUser, UnreadCounter
+from ..read_tracking import flush_read_marks
+from .. import read_tracking
+from ..unread import rebuild_counters
+
+
+@override_settings(READ_TRACKING='m2m')
+class ReadMarksTestCase(TestCase):
+    def setUp(self):
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=owner)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        self.topics = [Topic.objects.create(title='Title', message='Text', created_by=owner, room=self.room)
+                       for i in range(3)]
+        rebuild_counters(self.room)
+        self.client.login(username='usr2', password='222')
+
+    def open_topic(self, topic):
+        return self.client.get(reverse('topic', kwargs={'pk': topic.pk}))
+
+    def unread_count(self):
+        return UnreadCounter.objects.get(user=self.member, room=self.room).count
+
+
+class ReadMarksTests(ReadMarksTestCase):
+    def test_first_read_marks_topic(self):
+        self.open_topic(self.topics[0])
+        self.assertTrue(self.topics[0].was_read_by.filter(pk=self.member.pk).exists())
+        self.assertEquals(self.unread_count(), 2)
+
+    def test_next_reads_dont_write(self):
+        self.open_topic(self.topics[0])
+        with self.assertNumQueries(5):
+            # session, user, room, topic with read state, files - no writes
+            self.open_topic(self.topics[0])
+        self.assertEquals(self.unread_count(), 2)
+
+
+@override_settings(READ_TRACKING='m2m', READ_MARKS_DEFERRED=True, READ_MARKS_BATCH_SIZE=3, READ_MARKS_FLUSH_INTERVAL=3600)
+class DeferredReadMarksTests(ReadMarksTestCase):
+    def tearDown(self):
+        # nothing is left in buffer of the worker for other tests
+        flush_read_marks()
+
+    def test_marks_written_in_batch(self):
+        self.open_topic(self.topics[0])
+        self.open_topic(self.topics[1])
+        self.assertFalse(self.member.read_topics.exists())
+        self.assertEquals(self.unread_count(), 3)
+
+        # batch size is reached, marks are written after response
+        self.open_topic(self.topics[2])
+        self.assertEquals(self.member.read_topics.count(), 3)
+        self.assertEquals(self.unread_count(), 0)
+
+    def test_idle_worker_flushes_by_timer(self):
+        with mock.patch.object(read_tracking.threading, 'Timer') as timer:
+            self.open_topic(self.topics[0])
+            self.open_topic(self.topics[1])
+        # one timer for the first buffered mark
+        timer.assert_called_once_with(3600, read_tracking._flush_by_timer)
+        self.assertFalse(self.member.read_topics.exists())
+
+        with mock.patch.object(read_tracking, 'close_old_connections'):
+            timer.call_args[0][1]()
+        self.assertEquals(self.member.read_topics.count(), 2)
+        self.assertEquals(self.unread_count(), 1)
+
+    def test_room_page_writes_marks_of_its_user(self):
+        self.open_topic(self.topics[0])
+        response = self.client.get(reverse('room'))
+        self.assertEquals(self.member.read_topics.count(), 1)
+        self.assertEquals(response.context['unread_count'], 2)
+
+    def test_flush_skips_deleted_and_already_read_topics(self):
+        self.open_topic(self.topics[0])
+        self.open_topic(self.topics[1])
+        self.topics[0].was_read_by.add(self.member)
+        self.topics[1].delete()
+        self.assertEquals(flush_read_marks(), 0)
+        self.assertEquals(self.unread_count(), 3)
@@ -0,0 +1,87 @@
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from ..models import Room, Topic, RoomUser, ReadException, ReadWatermark, UnreadCounter
+from ..read_tracking import convert_m2m_marks
+from ..unread import count_unread, rebuild_counters
+
+
+@override_settings(READ_TRACKING='watermark')
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=owner)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        self.topics = [Topic.objects.create(title='Title', message='Text', created_by=owner, room=self.room)
+                       for i in range(4)]
+        rebuild_counters(self.room)
+        self.client.login(username='usr2', password='222')
+
+    def open_topic(self, index):
+        self.client.get(reverse('topic', kwargs={'pk': self.topics[index].pk}))
+
+    def read_state(self):
+        topics = Topic.objects.with_read_state(self.member).order_by('created_at', 'id')
+        return [topic.is_read for topic in topics]
+
+    def watermark(self):
+        return ReadWatermark.objects.filter(user=self.member, room=self.room).values_list('read_until_id', flat=True).first()
+
+    def test_read_out_of_order(self):
+        self.open_topic(3)
+        self.open_topic(1)
+        self.assertEquals(self.read_state(), [False, True, False, True])
+        self.assertIsNone(self.watermark())
+        self.assertEquals(ReadException.objects.count(), 2)
+
+    def test_watermark_moves_over_read_topics(self):
+        self.open_topic(3)
+        self.open_topic(1)
+        self.open_topic(0)
+        self.assertEquals(self.read_state(), [True, True, False, True])
+        self.assertEquals(self.watermark(), self.topics[1].pk)
+        # topics under watermark don't need exceptions
+        self.assertEquals(list(ReadException.objects.values_list('topic', flat=True)), [self.topics[3].pk])
+
+        self.open_topic(2)
+        self.assertEquals(self.read_state(), [True, True, True, True])
+        self.assertEquals(self.watermark(), self.topics[3].pk)
+        self.assertFalse(ReadException.objects.exists())
+
+    @override_settings(READ_EXCEPTIONS_MAX=2)
+    def test_newest_first_reading(self):
+        self.topics += [Topic.objects.create(title='Title', message='Text', created_by=self.topics[0].created_by,
+                                             room=self.room) for i in range(2)]
+        rebuild_counters(self.room)
+        for index in (5, 3, 2):
+            self.open_topic(index)
+        # watermark is moved over the oldest exception and unread topics before it
+        self.assertEquals(self.watermark(), self.topics[3].pk)
+        self.assertEquals(list(ReadException.objects.values_list('topic', flat=True)), [self.topics[5].pk])
+        self.assertEquals(self.read_state(), [True, True, True, True, False, True])
+        self.assertEquals(UnreadCounter.objects.get(user=self.member).count, 1)
+        self.assertEquals(count_unread(self.member.pk, self.room.pk), 1)
+
+    def test_new_topic_read_by_author(self):
+        for index in range(4):
+            self.open_topic(index)
+        self.client.post(reverse('new_topic', kwargs={'pk': self.room.pk}), {'title': 'Title', 'message': 'Text'})
+        self.assertEquals(self.watermark(), Topic.objects.latest('pk').pk)
+        self.assertFalse(ReadException.objects.exists())
+
+    def test_unread_counters(self):
+        self.open_topic(2)
+        self.open_topic(2)
+        self.assertEquals(UnreadCounter.objects.get(user=self.member).count, 3)
+        self.client.login(username='usr', password='111')
+        self.client.post(reverse('delete_topic', kwargs={'pk': self.topics[0].pk}))
+        self.client.post(reverse('delete_topic', kwargs={'pk': self.topics[2].pk}))
+        self.assertEquals(UnreadCounter.objects.get(user=self.member).count, 2)
+        self.assertEquals(count_unread(self.member.pk, self.room.pk), 2)
+
+    def test_convert_m2m_marks(self):
+        for index in (0, 1, 3):
+            self.topics[index].was_read_by.add(self.member)
+        self.assertEquals(convert_m2m_marks(), (1, 1))
+        self.assertEquals(self.read_state(), [True, True, False, True])
+        self.assertEquals(self.watermark(), self.topics[1].pk)
@@ -0,0 +1,42 @@
+import hashlib
+from pathlib import Path
+from django.core.files.base import ContentFile
+from ..storage import ContentAddressedStorage
+from .media_root import MediaRootTestCase
+
+
+class ContentAddressedStorageTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage(location=self.media_root)
+
+    def test_name_is_content_hash(self):
+        sha256 = hashlib.sha256(b'content').hexdigest()
+        name = self.storage.save('doc.txt', ContentFile(b'content'))
+        self.assertEquals(name, 'blobs/{}/{}/{}'.format(sha256[:2], sha256[2:4], sha256))
+        self.assertEquals(self.storage.open(name).read(), b'content')
+
+    def test_same_content_stored_once(self):
+        first = self.storage.save('doc1.txt', ContentFile(b'content'))
+        second = self.storage.save('doc2.txt', ContentFile(b'content'))
+        self.assertEquals(first, second)
+        self.assertEquals(self.storage.listdir(first.rsplit('/', 1)[0])[1], [first.rsplit('/', 1)[1]])
+
+    def test_adopt(self):
+        # file written by upload handler under a temporary name
+        incoming = 'blobs/incoming/upload'
+        Path(self.storage.path('blobs/incoming')).mkdir(parents=True)
+        Path(self.storage.path(incoming)).write_bytes(b'content')
+
+        name = self.storage.adopt(incoming, hashlib.sha256(b'content').hexdigest())
+        self.assertFalse(self.storage.exists(incoming))
+        self.assertEquals(self.storage.open(name).read(), b'content')
+
+    def test_adopt_existing_blob(self):
+        name = self.storage.save('doc.txt', ContentFile(b'content'))
+        incoming = 'blobs/incoming/upload'
+        Path(self.storage.path('blobs/incoming')).mkdir(parents=True)
+        Path(self.storage.path(incoming)).write_bytes(b'content')
+
+        self.assertEquals(self.storage.adopt(incoming, hashlib.sha256(b'content').hexdigest()), name)
+        self.assertFalse(self.storage.exists(incoming))
@@ -0,0 +1,96 @@
+import io
+from unittest import skipIf
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import override_settings
+from ..models import Room, Topic, RoomUser, File
+from ..thumbnails import Image, generate_thumbnails
+from .media_root import MediaRootTestCase
+
+
+def image_file(name, size=(800, 600), image_format='PNG'):
+    content = io.BytesIO()
+    Image.new('RGB', size, 'green').save(content, image_format)
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/' + image_format.lower())
+
+
+@skipIf(Image is None, 'Pillow is not installed')
+@override_settings(THUMBNAILS_IN_BACKGROUND=False, MEDIA_DELETE_IN_BACKGROUND=False, MEDIA_ACCEL_REDIRECT=False,
+                   THUMBNAIL_SIZE=256)
+class ThumbnailTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=owner)
+        self.client.login(username='usr', password='111')
+
+    def create_topic(self, *files):
+        url = reverse('new_topic', kwargs={'pk': self.room.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'title': 'Title', 'message': 'Text', 'files': list(files)})
+        return Topic.objects.get()
+
+    def test_generated_after_upload(self):
+        topic = self.create_topic(image_file('photo.png'), SimpleUploadedFile('doc.txt', b'text'))
+        photo = topic.files.get(original_name='photo.png')
+        self.assertEquals(photo.thumbnail.name, 'thumbnails/{}.webp'.format(photo.pk))
+        with photo.thumbnail.open('rb') as f:
+            with Image.open(f) as thumbnail:
+                self.assertEquals(thumbnail.format, 'WEBP')
+                self.assertEquals(thumbnail.size, (256, 192))
+        self.assertEquals(topic.files.get(original_name='doc.txt').thumbnail.name, '')
+
+    def test_not_generated_before_commit(self):
+        url = reverse('new_topic', kwargs={'pk': self.room.pk})
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.post(url, {'title': 'Title', 'message': 'Text', 'files': [image_file('photo.png')]})
+        self.assertEquals(File.objects.get().thumbnail.name, '')
+        self.assertEquals(len(callbacks), 1)
+
+    def test_broken_image_skipped(self):
+        topic = self.create_topic(SimpleUploadedFile('photo.png', b'not an image', content_type='image/png'))
+        self.assertEquals(topic.files.get().thumbnail.name, '')
+
+    def test_served_with_long_cache(self):
+        topic = self.create_topic(image_file('photo.png'))
+        response = self.client.get(reverse('file_thumbnail', kwargs={'pk': topic.files.get().pk}))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'image/webp')
+        self.assertEquals(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+    def test_topic_shows_thumbnail(self):
+        topic = self.create_topic(image_file('photo.png'))
+        response = self.client.get(reverse('topic', kwargs={'pk': topic.pk}))
+        self.assertContains(response, reverse('file_thumbnail', kwargs={'pk': topic.files.get().pk}))
+
+    def test_without_thumbnail_not_found(self):
+        topic = self.create_topic(SimpleUploadedFile('doc.txt', b'text'))
+        response = self.client.get(reverse('file_thumbnail', kwargs={'pk': topic.files.get().pk}))
+        self.assertEquals(response.status_code, 404)
+
+    def test_other_room_not_found(self):
+        topic = self.create_topic(image_file('photo.png'))
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222')
+        self.client.login(username='usr2', password='222')
+        response = self.client.get(reverse('file_thumbnail', kwargs={'pk': topic.files.get().pk}))
+        self.assertEquals(response.status_code, 404)
+
+    def test_deleted_with_file(self):
+        topic = self.create_topic(image_file('photo.png'))
+        thumbnail = topic.files.get().thumbnail
+        with self.captureOnCommitCallbacks(execute=True):
+            topic.delete()
+        self.assertFalse(thumbnail.storage.exists(thumbnail.name))
+
+    def test_command_generates_missing(self):
+        topic = Topic.objects.create(title='Title', message='Text', created_by=self.room.created_by, room=self.room)
+        file = File.objects.create(file=image_file('old.jpg', image_format='JPEG'), original_name='old.jpg',
+                                   content_type='image/jpeg', topic=topic)
+        out = io.StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Generated 1 thumbnails of 1 files.', out.getvalue())
+        file.refresh_from_db()
+        self.assertTrue(file.thumbnail.storage.exists(file.thumbnail.name))
+        # already generated are skipped
+        self.assertEquals(generate_thumbnails([file.pk]), 0)
@@ -0,0 +1,100 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase
+from ..models import Room, Topic, RoomUser, UnreadCounter
+from ..unread import count_unread, get_unread_count
+from .. import read_tracking, unread
+
+
+class UnreadCountersTests(TestCase):
+    def setUp(self):
+        self.owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=self.owner)
+        self.member = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222',
+                                                   member_of=self.room)
+        # counters of both users are created on first request of the room page
+        for username, password in (('usr2', '222'), ('usr', '111')):
+            self.client.login(username=username, password=password)
+            self.client.get(reverse('room'))
+
+    def new_topic(self):
+        self.client.post(reverse('new_topic', kwargs={'pk': self.room.pk}), {'title': 'Title', 'message': 'Text'})
+        return Topic.objects.latest('pk')
+
+    def assertCounters(self, owner, member):
+        self.assertEquals(UnreadCounter.objects.get(user=self.owner).count, owner)
+        self.assertEquals(UnreadCounter.objects.get(user=self.member).count, member)
+        # denormalized values are the same as computed from scratch
+        self.assertEquals(count_unread(self.owner.pk, self.room.pk), owner)
+        self.assertEquals(count_unread(self.member.pk, self.room.pk), member)
+
+    def test_new_topic_unread_for_other_members(self):
+        self.new_topic()
+        self.new_topic()
+        self.assertCounters(owner=0, member=2)
+
+    def test_first_read(self):
+        topic = self.new_topic()
+        self.client.login(username='usr2', password='222')
+        self.client.get(reverse('topic', kwargs={'pk': topic.pk}))
+        self.client.get(reverse('topic', kwargs={'pk': topic.pk}))
+        self.assertCounters(owner=0, member=0)
+
+    def test_concurrent_first_reads_counted_once(self):
+        topics = [self.new_topic(), self.new_topic()]
+        # two requests saw the topic unread (refresh of the page), both mark it
+        for topic, mode, unread_left in ((topics[0], 'm2m', 1), (topics[1], 'watermark', 0)):
+            with self.subTest(mode=mode), self.settings(READ_TRACKING=mode):
+                read_tracking.mark_read(topic, self.member)
+                read_tracking.mark_read(topic, self.member)
+                self.assertEquals(UnreadCounter.objects.get(user=self.member).count, unread_left)
+
+    def test_delete_topic(self):
+        topic = self.new_topic()
+        self.new_topic()
+        self.client.post(reverse('delete_topic', kwargs={'pk': topic.pk}))
+        self.assertCounters(owner=0, member=1)
+
+    def test_delete_topics(self):
+        topics = [self.new_topic().pk for i in range(3)]
+        self.client.post(reverse('delete_topics', kwargs={'pk': self.room.pk}), {'topics': topics[:2]})
+        self.assertCounters(owner=0, member=1)
+
+    def test_lazy_counter_of_new_member(self):
+        self.new_topic()
+        user3 = RoomUser.objects.create_user(username='usr3', email='usr3@test.com', password='333',
+                                             member_of=self.room)
+        self.assertFalse(UnreadCounter.objects.filter(user=user3).exists())
+        self.assertEquals(get_unread_count(user3, self.room), 1)
+        self.assertEquals(UnreadCounter.objects.get(user=user3).count, 1)
+
+    def test_topic_created_while_counter_is_created(self):
+        user3 = RoomUser.objects.create_user(username='usr3', email='usr3@test.com', password='333',
+                                             member_of=self.room)
+        count_unread = unread.count_unread
+
+        def count_then_create_topic(user_id, room_id):
+            # concurrent request creates a topic after the first count, before the insert of the row
+            counter = count_unread(user_id, room_id)
+            if not Topic.objects.exists():
+                self.new_topic()
+            return counter
+
+        with mock.patch.object(unread, 'count_unread', count_then_create_topic):
+            self.assertEquals(get_unread_count(user3, self.room), 1)
+        self.assertEquals(UnreadCounter.objects.get(user=user3).count, 1)
+
+    def test_room_page_badge(self):
+        self.new_topic()
+        self.client.login(username='usr2', password='222')
+        response = self.client.get(reverse('room'))
+        self.assertEquals(response.context['unread_count'], 1)
+        self.assertContains(response, 'title="Unread topics">1</span>')
+
+    def test_rebuild_command(self):
+        self.new_topic()
+        UnreadCounter.objects.update(count=7)
+        call_command('rebuild_unread_counters', stdout=StringIO())
+        self.assertCounters(owner=0, member=1)
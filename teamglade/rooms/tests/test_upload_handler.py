@@ -0,0 +1,159 @@
+import hashlib
+import io
+from pathlib import Path
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import RequestFactory, override_settings
+from ..models import Room, Topic, RoomUser, File, Blob
+from ..storage import blob_storage
+from ..uploadhandlers import StreamingFileUploadHandler, StreamedUploadedFile
+from .media_root import MediaRootTestCase
+
+
+def remove_orphans():
+    call_command('gc_media', '--min-age', '-60', stdout=io.StringIO())
+
+
+class StreamingFileUploadHandlerTests(MediaRootTestCase):
+    def parse(self, files):
+        request = RequestFactory().post('/', {'files': files})
+        handler = StreamingFileUploadHandler(request)
+        request.upload_handlers = [handler]
+        return request.FILES.getlist('files'), handler
+
+    def test_files_written_to_storage(self):
+        content = b'x' * 100000
+        files, handler = self.parse([SimpleUploadedFile('doc.txt', content), SimpleUploadedFile('doc.txt', b'ok')])
+        self.assertTrue(all(isinstance(f, StreamedUploadedFile) for f in files))
+        self.assertEquals(files[0].size, len(content))
+        self.assertEquals(files[0].sha256, hashlib.sha256(content).hexdigest())
+        self.assertEquals(files[0].name, 'doc.txt')
+        self.assertEquals(files[0].stored_name, blob_storage.blob_name(files[0].sha256))
+        self.assertEquals(Path(self.media_root, files[0].stored_name).read_bytes(), content)
+        self.assertEquals(self.stored_files(), sorted([files[0].sha256, files[1].sha256]))
+
+    def test_duplicates_stored_once(self):
+        files, handler = self.parse([SimpleUploadedFile('doc1.txt', b'ok'), SimpleUploadedFile('doc2.txt', b'ok')])
+        self.assertEquals(files[0].stored_name, files[1].stored_name)
+        self.assertEquals(self.stored_files(), [files[0].sha256])
+
+    def test_discard_unsaved(self):
+        files, handler = self.parse([SimpleUploadedFile('doc1.txt', b'1'), SimpleUploadedFile('doc2.txt', b'2')])
+        files[0].saved = True
+        Blob.objects.acquire(files[0].sha256, files[0].stored_name, files[0].size)
+        handler.discard_unsaved()
+        # complete blob could be taken by concurrent upload, it's removed later by gc_media
+        self.assertEquals(self.stored_files(), sorted([files[0].sha256, files[1].sha256]))
+        remove_orphans()
+        self.assertEquals(self.stored_files(), [files[0].sha256])
+
+    def test_discard_incomplete(self):
+        file = StreamedUploadedFile('doc.txt', 'text/plain', None, None)
+        file.write(b'o')
+        self.assertEquals(len(self.stored_files()), 1)
+        file.discard()
+        self.assertEquals(self.stored_files(), [])
+
+    def test_discard_keeps_existing_blob(self):
+        files, handler = self.parse([SimpleUploadedFile('doc.txt', b'ok')])
+        Blob.objects.acquire(files[0].sha256, files[0].stored_name, files[0].size)
+        handler.discard_unsaved()
+        self.assertEquals(self.stored_files(), [files[0].sha256])
+
+    @override_settings(TOPIC_FILES_MAX_COUNT=2)
+    def test_too_many_files(self):
+        files, handler = self.parse([SimpleUploadedFile('doc{}.txt'.format(i), b'ok') for i in range(3)])
+        self.assertIn('Too many files', handler.request.upload_error)
+
+    @override_settings(TOPIC_FILE_MAX_SIZE=1000)
+    def test_too_big_file_stopped(self):
+        files, handler = self.parse([SimpleUploadedFile('doc.txt', b'x' * 1001)])
+        self.assertEquals(files, [])
+        self.assertIn('too big', handler.request.upload_error)
+        # partially written file is removed
+        self.assertEquals(self.stored_files(), [])
+
+    @override_settings(TOPIC_FILES_MAX_COUNT=2, TOPIC_FILE_MAX_SIZE=100)
+    def test_content_length_checked_before_reading(self):
+        request = RequestFactory().post('/', {'title': 'Title', 'files': [SimpleUploadedFile('doc.txt', b'x' * 70000)]})
+        handler = StreamingFileUploadHandler(request)
+        request.upload_handlers = [handler]
+        self.assertEquals(request.FILES.getlist('files'), [])
+        self.assertNotIn('title', request.POST)
+        self.assertIn('Files are too big', handler.request.upload_error)
+        self.assertEquals(self.stored_files(), [])
+
+
+class NewTopicUploadTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=user)
+        self.client.login(username='usr', password='111')
+        self.url = reverse('new_topic', kwargs={'pk': self.room.pk})
+
+    def test_files_saved(self):
+        data = {'title': 'Test title', 'message': 'Test Message', 'files': [SimpleUploadedFile('doc.txt', b'ok')]}
+        self.client.post(self.url, data)
+        file = File.objects.get()
+        self.assertEquals(file.file.read(), b'ok')
+        self.assertEquals(file.filename(), 'doc.txt')
+        self.assertEquals(self.stored_files(), [file.blob.sha256])
+
+    def test_same_file_shared_by_topics(self):
+        for i in range(2):
+            data = {'title': 'Test title', 'message': 'Test Message', 'files': [SimpleUploadedFile('doc.txt', b'ok')]}
+            self.client.post(self.url, data)
+        blob = Blob.objects.get()
+        self.assertEquals(blob.ref_count, 2)
+        self.assertEquals(File.objects.filter(blob=blob).count(), 2)
+        self.assertEquals(self.stored_files(), [blob.sha256])
+
+        # blob is deleted with its last reference
+        first, second = Topic.objects.all()
+        with self.settings(MEDIA_DELETE_IN_BACKGROUND=False), self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEquals(Blob.objects.get().ref_count, 1)
+        self.assertEquals(self.stored_files(), [blob.sha256])
+        with self.settings(MEDIA_DELETE_IN_BACKGROUND=False), self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertEquals(self.stored_files(), [])
+
+    @override_settings(TOPIC_FILES_MAX_COUNT=2)
+    def test_too_many_files(self):
+        files = [SimpleUploadedFile('doc{}.txt'.format(i), b'ok') for i in range(3)]
+        response = self.client.post(self.url, {'title': 'Test title', 'message': 'Test Message', 'files': files})
+        self.assertContains(response, 'Too many files')
+        self.assertFalse(Topic.objects.exists())
+        remove_orphans()
+        self.assertEquals(self.stored_files(), [])
+
+    def test_invalid_form(self):
+        data = {'title': '', 'message': 'Test Message', 'files': [SimpleUploadedFile('doc.txt', b'ok')]}
+        self.client.post(self.url, data)
+        self.assertFalse(Topic.objects.exists())
+        remove_orphans()
+        self.assertEquals(self.stored_files(), [])
+
+    def test_csrf_failure(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.login(username='usr', password='111')
+        data = {'title': 'Test title', 'message': 'Test Message', 'files': [SimpleUploadedFile('doc.txt', b'ok')]}
+        response = client.post(self.url, data)
+        self.assertEquals(response.status_code, 403)
+        remove_orphans()
+        self.assertEquals(self.stored_files(), [])
+
+    @override_settings(TOPIC_FILES_MAX_COUNT=2, TOPIC_FILE_MAX_SIZE=100)
+    def test_content_length_over_limits_with_csrf_checks(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.login(username='usr', password='111')
+        client.get(self.url)
+        data = {'title': 'Test title', 'message': 'Test Message', 'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+                'files': [SimpleUploadedFile('doc.txt', b'x' * 70000)]}
+        response = client.post(self.url, data)
+        self.assertContains(response, 'Files are too big', status_code=413)
+        self.assertFalse(Topic.objects.exists())
+        self.assertEquals(self.stored_files(), [])
@@ -0,0 +1,99 @@
+import json
+import re
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from ..backends import hash_invite_token
+from ..forms import BulkInviteForm
+from ..models import Room, RoomUser
+
+
+def invite_link_code(message):
+    return re.search(r'rooms/invite/([\w-]+)/', message.body).group(1)
+
+
+class BulkInviteViewTests(TestCase):
+    def setUp(self):
+        self.owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room = Room.objects.create(name='Room name', created_by=self.owner)
+        self.client.login(username='usr', password='111')
+        self.url = reverse('bulk_invite', kwargs={'pk': self.room.pk})
+
+    def test_get(self):
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        self.assertIsInstance(response.context.get('form'), BulkInviteForm)
+
+    def test_invite_list(self):
+        response = self.client.post(self.url, {'emails': 'a@test.com, b@test.com\nc@test.com;A@test.com'})
+        self.assertEquals(response.context['invited'], ['a@test.com', 'b@test.com', 'c@test.com'])
+
+        users = RoomUser.objects.filter(member_of=self.room).order_by('username')
+        self.assertEquals([u.username for u in users], ['a@test.com', 'b@test.com', 'c@test.com'])
+        for user in users:
+            self.assertFalse(user.has_usable_password())
+            self.assertIsNotNone(user.invite_token)
+
+        self.assertEquals(len(mail.outbox), 3)
+        self.assertEquals(mail.outbox[0].to, ['a@test.com'])
+        self.assertEquals(hash_invite_token(invite_link_code(mail.outbox[0])), users[0].invite_token)
+
+    def test_invite_csv(self):
+        csv_file = SimpleUploadedFile('class.csv', b'Name,Email\nAnn,ann@test.com\nBob,bob@test.com\n')
+        response = self.client.post(self.url, {'csv_file': csv_file})
+        self.assertEquals(response.context['invited'], ['ann@test.com', 'bob@test.com'])
+
+    def test_existing_users_skipped(self):
+        RoomUser.objects.create_user(username='other', email='Taken@test.com', password='222')
+        response = self.client.post(self.url, {'emails': 'usr@test.com taken@test.com new@test.com'})
+        self.assertEquals(response.context['invited'], ['new@test.com'])
+        self.assertEquals(response.context['skipped'], ['usr@test.com', 'taken@test.com'])
+        self.assertEquals(len(mail.outbox), 1)
+
+    def test_invalid_address(self):
+        response = self.client.post(self.url, {'emails': 'a@test.com not-an-address'})
+        self.assertContains(response, 'Invalid addresses: not-an-address.')
+        self.assertFalse(RoomUser.objects.filter(member_of=self.room).exists())
+
+    def test_empty(self):
+        response = self.client.post(self.url, {'emails': ''})
+        self.assertContains(response, 'Enter email addresses or choose a CSV file.')
+
+    @override_settings(BULK_INVITE_MAX_COUNT=2)
+    def test_too_many(self):
+        response = self.client.post(self.url, {'emails': 'a@test.com b@test.com c@test.com'})
+        self.assertContains(response, 'You can invite up to 2 people at once.')
+
+    def test_json_api(self):
+        response = self.client.post(self.url, json.dumps({'emails': ['a@test.com', 'usr@test.com']}),
+                                    content_type='application/json')
+        self.assertEquals(response.json(), {'invited': ['a@test.com'], 'skipped': ['usr@test.com']})
+
+        response = self.client.post(self.url, json.dumps({'emails': ['wrong']}), content_type='application/json')
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json(), {'errors': ['Invalid addresses: wrong.']})
+
+    def test_one_insert_for_users(self):
+        emails = ' '.join('user{}@test.com'.format(i) for i in range(50))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'emails': emails})
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEquals(len(inserts), 1)
+        self.assertEquals(RoomUser.objects.filter(member_of=self.room).count(), 50)
+
+    def test_member_no_permission(self):
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222', member_of=self.room)
+        self.client.login(username='usr2', password='222')
+        response = self.client.post(self.url, {'emails': 'a@test.com'})
+        self.assertEquals(response.status_code, 404)
+
+    def test_invited_user_logs_in_by_link(self):
+        self.client.post(self.url, {'emails': 'a@test.com'})
+        self.client.logout()
+        user = RoomUser.objects.get(username='a@test.com')
+        response = self.client.get(reverse('login_invite', kwargs={'code': invite_link_code(mail.outbox[0])}))
+        self.assertRedirects(response, reverse('password_set'))
+        self.assertEquals(int(self.client.session['_auth_user_id']), user.pk)
@@ -0,0 +1,150 @@
+import os
+from time import time
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils.http import http_date
+from django.test import override_settings
+from ..models import Room, Topic, RoomUser, File
+from .media_root import MediaRootTestCase
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT=False)
+class DownloadFileTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room = Room.objects.create(name='Room name', created_by=owner)
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222', member_of=room)
+        topic = Topic.objects.create(title='Title', message='Text', created_by=owner, room=room)
+        self.file = File.objects.create(file=SimpleUploadedFile('doc.txt', b'content'), original_name='Report.txt',
+                                        content_type='text/plain', size=7, sha256='abc', topic=topic)
+        self.url = reverse('download_file', kwargs={'pk': self.file.pk})
+
+    def test_owner_downloads(self):
+        self.client.login(username='usr', password='111')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(b''.join(response.streaming_content), b'content')
+        self.assertEquals(response['Content-Type'], 'text/plain')
+        self.assertEquals(response['Content-Disposition'], 'attachment; filename="Report.txt"')
+
+    def test_member_downloads(self):
+        self.client.login(username='usr2', password='222')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+
+    def test_other_room_not_found(self):
+        user3 = RoomUser.objects.create_user(username='usr3', email='usr3@test.com', password='333')
+        Room.objects.create(name='Other room', created_by=user3)
+        self.client.login(username='usr3', password='333')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 404)
+
+    def test_login_required(self):
+        response = self.client.get(self.url)
+        self.assertRedirects(response, '{}?next={}'.format(reverse('login'), self.url))
+
+    def test_missing_file_not_found(self):
+        self.file.file.storage.delete(self.file.file.name)
+        self.client.login(username='usr', password='111')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True, MEDIA_ACCEL_REDIRECT_LOCATION='/protected-media/')
+    def test_accel_redirect(self):
+        self.client.login(username='usr', password='111')
+        response = self.client.get(self.url)
+        self.assertEquals(response['X-Accel-Redirect'], '/protected-media/' + self.file.file.name)
+        self.assertEquals(response.content, b'')
+        self.assertEquals(response['Content-Disposition'], 'attachment; filename="Report.txt"')
+
+    def test_non_ascii_name(self):
+        File.objects.filter(pk=self.file.pk).update(original_name='Отчёт.txt')
+        self.client.login(username='usr', password='111')
+        response = self.client.get(self.url)
+        self.assertEquals(response['Content-Disposition'],
+                          "attachment; filename*=utf-8''%D0%9E%D1%82%D1%87%D1%91%D1%82.txt")
+
+    def test_control_characters_in_name(self):
+        File.objects.filter(pk=self.file.pk).update(original_name='Report\r\n.txt')
+        self.client.login(username='usr', password='111')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Disposition'], "attachment; filename*=utf-8''Report%0D%0A.txt")
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT=False)
+class ConditionalRangeDownloadTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room = Room.objects.create(name='Room name', created_by=owner)
+        topic = Topic.objects.create(title='Title', message='Text', created_by=owner, room=room)
+        self.file = File.objects.create(file=SimpleUploadedFile('doc.txt', b'0123456789'), original_name='doc.txt',
+                                        content_type='text/plain', size=10, sha256='abc', topic=topic)
+        self.url = reverse('download_file', kwargs={'pk': self.file.pk})
+        self.client.login(username='usr', password='111')
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_validators(self):
+        response, body = self.get()
+        self.assertEquals(body, b'0123456789')
+        self.assertEquals(response['ETag'], '"abc"')
+        self.assertEquals(response['Accept-Ranges'], 'bytes')
+        self.assertEquals(response['Content-Length'], '10')
+        self.assertIn('Last-Modified', response)
+
+    def test_if_none_match(self):
+        response, body = self.get(HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(body, b'')
+        response, body = self.get(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEquals(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.get()[0]['Last-Modified']
+        response, body = self.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEquals(response.status_code, 304)
+
+    def test_last_modified_is_upload_time(self):
+        last_modified = self.get()[0]['Last-Modified']
+        self.assertEquals(last_modified, http_date(self.file.topic.created_at.timestamp()))
+        # blob is touched when the same content is uploaded again
+        future = time() + 3600
+        os.utime(self.file.file.path, (future, future))
+        response, body = self.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEquals(response.status_code, 304)
+
+    def test_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEquals(response.status_code, 206)
+        self.assertEquals(body, b'2345')
+        self.assertEquals(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEquals(response['Content-Length'], '4')
+
+    def test_open_and_suffix_ranges(self):
+        self.assertEquals(self.get(HTTP_RANGE='bytes=7-')[1], b'789')
+        self.assertEquals(self.get(HTTP_RANGE='bytes=-3')[1], b'789')
+        self.assertEquals(self.get(HTTP_RANGE='bytes=8-100')[1], b'89')
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEquals(response.status_code, 416)
+        self.assertEquals(response['Content-Range'], 'bytes */10')
+
+    def test_multiple_ranges_ignored(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-1,3-4')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(body, b'0123456789')
+
+    def test_if_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=5-', HTTP_IF_RANGE='"abc"')
+        self.assertEquals(response.status_code, 206)
+        # file changed, whole file is sent
+        response, body = self.get(HTTP_RANGE='bytes=5-', HTTP_IF_RANGE='"old"')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(body, b'0123456789')
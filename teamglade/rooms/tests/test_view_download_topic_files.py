@@ -0,0 +1,83 @@
+import io
+import zipfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from ..models import Room, Topic, RoomUser, File
+from ..zipstream import archive_names, is_compressed
+from .media_root import MediaRootTestCase
+
+
+class DownloadTopicFilesTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room = Room.objects.create(name='Room name', created_by=owner)
+        self.topic = Topic.objects.create(title='Title', message='Text', created_by=owner, room=room)
+        self.add_file('doc.txt', b'text ' * 1000, 'text/plain')
+        self.add_file('doc.txt', b'another text', 'text/plain')
+        self.add_file('photo.jpg', b'\xff\xd8 jpeg', 'image/jpeg')
+        self.url = reverse('download_topic_files', kwargs={'pk': self.topic.pk})
+        self.client.login(username='usr', password='111')
+
+    def add_file(self, name, content, content_type):
+        return File.objects.create(file=SimpleUploadedFile(name, content), original_name=name,
+                                   content_type=content_type, size=len(content), topic=self.topic)
+
+    def get_archive(self, response):
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_archive(self):
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEquals(response['Content-Type'], 'application/zip')
+        self.assertEquals(response['Content-Disposition'], 'attachment; filename="Title.zip"')
+
+        archive = self.get_archive(response)
+        self.assertIsNone(archive.testzip())
+        self.assertEquals(archive.namelist(), ['doc.txt', 'doc (2).txt', 'photo.jpg'])
+        self.assertEquals(archive.read('doc.txt'), b'text ' * 1000)
+        self.assertEquals(archive.read('doc (2).txt'), b'another text')
+        self.assertEquals(archive.getinfo('doc.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEquals(archive.getinfo('photo.jpg').compress_type, zipfile.ZIP_STORED)
+
+    def test_newline_in_title(self):
+        Topic.objects.filter(pk=self.topic.pk).update(title='First\nsecond')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Disposition'], "attachment; filename*=utf-8''First%0Asecond.zip")
+
+    def test_missing_file_skipped(self):
+        file = File.objects.get(original_name='photo.jpg')
+        file.file.storage.delete(file.file.name)
+        archive = self.get_archive(self.client.get(self.url))
+        self.assertEquals(archive.namelist(), ['doc.txt', 'doc (2).txt'])
+
+    def test_no_files_not_found(self):
+        self.topic.files.all().delete()
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 404)
+
+    def test_other_room_not_found(self):
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222')
+        self.client.login(username='usr2', password='222')
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 404)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, '{}?next={}'.format(reverse('login'), self.url))
+
+    def test_topic_contains_link(self):
+        response = self.client.get(reverse('topic', kwargs={'pk': self.topic.pk}))
+        self.assertContains(response, 'href="{}"'.format(self.url))
+
+    def test_archive_names(self):
+        self.assertEquals(archive_names(['a.txt', 'A.txt', 'a.txt', '../b.txt']),
+                          ['a.txt', 'A (2).txt', 'a (3).txt', '.._b.txt'])
+
+    def test_is_compressed(self):
+        self.assertTrue(is_compressed('report.PDF', ''))
+        self.assertTrue(is_compressed('movie', 'video/mp4'))
+        self.assertFalse(is_compressed('notes.txt', 'text/plain'))
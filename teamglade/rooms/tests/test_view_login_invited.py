@@ -1,17 +1,18 @@
 from django.urls import reverse, resolve
 from django.test import TestCase
+from ..backends import new_invite_token
 from ..models import Room, RoomUser
 from ..views import LoginInvitedView
 
 
 class LoginInvitedViewTestCase(TestCase):
     def setUp(self):
-        code = '111'
+        code, token_hash, expires_at = new_invite_token()
         self.user = RoomUser.objects.create_user(
             username='usr@test.com',
             email='usr@test.com',
-            password=code,
-            invite_code=code,
+            invite_token=token_hash,
+            invite_expires_at=expires_at,
         )
         room_obj = Room.objects.create(name='Room name', created_by=self.user)
         self.url = reverse('login_invite', kwargs={'code': code})
@@ -25,6 +26,5 @@ class LoginInvitedViewTestCase(TestCase):
         self.assertTrue(self.user.is_authenticated)
 
     def test_redirection(self):
-        # A successful login invited user should redirect
-        room_url = reverse('room')
-        self.assertRedirects(self.response, room_url)
+        # A successful login invited user should redirect to set a password, the link is single-use
+        self.assertRedirects(self.response, reverse('password_set'))
@@ -1,7 +1,7 @@
 from pathlib import Path
 from django.urls import reverse
 from django.test import TestCase
-from ..models import Room, Topic, RoomUser
+from ..models import Room, Topic, RoomUser, File
 
 
 class NewTopicTests(TestCase):
@@ -46,15 +46,15 @@ class NewTopicTests(TestCase):
         f2.close()
 
         self.assertTrue(Topic.objects.exists())
-        self.assertTrue(Path("media/uploads/Upload_Test_File_1.txt").exists())
-        self.assertTrue(Path("media/uploads/Upload_Test_File_2.txt").exists())
+        # files are stored under content-addressed names, original names are kept
+        files = File.objects.order_by('original_name')
+        self.assertEquals([f.filename() for f in files], ['Upload_Test_File_1.txt', 'Upload_Test_File_2.txt'])
+        self.assertTrue(all(Path(f.file.path).exists() for f in files))
 
     def tearDown(self):
         # removing uploaded files (if exist)
-        p1 = Path("media/uploads/Upload_Test_File_1.txt")
-        p1.unlink(missing_ok=True)
-        p2 = Path("media/uploads/Upload_Test_File_2.txt")
-        p2.unlink(missing_ok=True)
+        for f in File.objects.all():
+            Path(f.file.path).unlink(missing_ok=True)
 
 
 class LoginRequiredNewTopicTests(TestCase):
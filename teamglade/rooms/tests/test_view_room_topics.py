@@ -1,6 +1,6 @@
 from django.urls import reverse, resolve
-from django.test import TestCase
-from ..models import Room, RoomUser
+from django.test import TestCase, override_settings
+from ..models import Room, RoomUser, Topic
 from ..views import RoomView
 
 
@@ -22,3 +22,57 @@ class RoomViewTests(TestCase):
     def test_url_resolves_correct_view(self):
         view = resolve(self.url)
         self.assertEquals(view.func.view_class, RoomView)
+
+
+@override_settings(TOPICS_PAGINATION='cursor')
+class RoomViewCursorPaginationTests(TestCase):
+    def setUp(self):
+        user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room_obj = Room.objects.create(name='Room name', created_by=user)
+        for i in range(30):
+            Topic.objects.create(title='Topic #{}'.format(i), message='ok', created_by=user, room=room_obj)
+        self.client.login(username='usr', password='111')
+        self.url = reverse('room')
+
+    def test_first_page(self):
+        response = self.client.get(self.url)
+        page = response.context['page_obj']
+        self.assertEquals([t.title for t in page], ['Topic #{}'.format(i) for i in range(29, 17, -1)])
+        self.assertFalse(page.has_previous())
+        self.assertContains(response, '?cursor={}'.format(page.next_cursor))
+
+    def test_next_and_previous_cursors(self):
+        first = self.client.get(self.url).context['page_obj']
+        second = self.client.get(self.url, {'cursor': first.next_cursor}).context['page_obj']
+        third = self.client.get(self.url, {'cursor': second.next_cursor}).context['page_obj']
+        self.assertEquals(len(third), 6)
+        self.assertFalse(third.has_next())
+
+        back = self.client.get(self.url, {'cursor': third.previous_cursor}).context['page_obj']
+        self.assertEquals(list(back), list(second))
+        back = self.client.get(self.url, {'cursor': back.previous_cursor}).context['page_obj']
+        self.assertEquals(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'broken'})
+        self.assertEquals(response.status_code, 404)
+
+
+@override_settings(READ_TRACKING='m2m')
+class RoomViewReadStateTests(TestCase):
+    def setUp(self):
+        self.user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        room_obj = Room.objects.create(name='Room name', created_by=self.user)
+        self.read_topic = Topic.objects.create(title='Read', message='ok', created_by=self.user, room=room_obj)
+        self.unread_topic = Topic.objects.create(title='Unread', message='ok', created_by=self.user, room=room_obj)
+        self.read_topic.was_read_by.add(self.user)
+        self.client.login(username='usr', password='111')
+        self.response = self.client.get(reverse('room'))
+
+    def test_topics_annotated_with_read_state(self):
+        read_state = {t.pk: t.is_read for t in self.response.context['topics']}
+        self.assertEquals(read_state, {self.read_topic.pk: True, self.unread_topic.pk: False})
+
+    def test_unread_topic_is_bold(self):
+        self.assertContains(self.response, 'color: #444; font-weight: bold;', count=1)
@@ -61,8 +61,8 @@ class SuccessfulSendInviteViewTests(SendInviteViewTestCase):
         self.assertEqual('[TeamGlade] You are invited to join TeamGlade room', self.email.subject)
 
     def test_email_body(self):
-        # has a link with code (8 symbols)
-        self.assertRegex(self.email.body, r'rooms/invite/[a-z0-9]{8}/')
+        # has a link with token (43 symbols)
+        self.assertRegex(self.email.body, r'rooms/invite/[\w-]{43}/')
 
     def test_invited_user(self):
         users = RoomUser.objects.all()
@@ -0,0 +1,61 @@
+from django.urls import reverse, resolve
+from django.test import TestCase
+from ..models import Room, Topic, RoomUser
+from ..views import DeleteTopicsView
+
+
+class DeleteTopicsViewTests(TestCase):
+    def setUp(self):
+        user = RoomUser.objects.create_user(username='usr', email='usr@test.com', password='111')
+        self.room_obj = Room.objects.create(name='Room name', created_by=user)
+        self.topics = [
+            Topic.objects.create(title='Test title', message='Test message', created_by=user, room=self.room_obj)
+            for i in range(3)
+        ]
+        self.client.login(username='usr', password='111')  # view has a @login_required
+        self.url = reverse('delete_topics', kwargs={'pk': self.room_obj.pk})
+
+    def test_url_resolves_correct_view(self):
+        view = resolve(self.url)
+        self.assertEquals(view.func.view_class, DeleteTopicsView)
+
+    def test_topics_delete(self):
+        response = self.client.post(self.url, {'topics': [self.topics[0].pk, self.topics[2].pk]})
+        self.assertRedirects(response, reverse('room'))
+        self.assertEquals(list(Topic.objects.all()), [self.topics[1]])
+
+    def test_nothing_selected(self):
+        response = self.client.post(self.url, {})
+        self.assertRedirects(response, reverse('room'))
+        self.assertEquals(Topic.objects.count(), 3)
+
+    def test_topics_delete_another_room(self):
+        # topic of another's room can't be deleted, nothing is deleted at all
+        user2 = RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222')
+        room_obj2 = Room.objects.create(name='Room name', created_by=user2)
+        topic_obj2 = Topic.objects.create(title='Test title', message='Test message', created_by=user2, room=room_obj2)
+        response = self.client.post(self.url, {'topics': [self.topics[0].pk, topic_obj2.pk]})
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(Topic.objects.count(), 4)
+
+    def test_topics_delete_no_permission(self):
+        # invited user can't delete topics in bulk
+        RoomUser.objects.create_user(username='usr2', email='usr2@test.com', password='222', member_of=self.room_obj)
+        self.client.login(username='usr2', password='222')
+        response = self.client.post(self.url, {'topics': [self.topics[0].pk]})
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(Topic.objects.count(), 3)
+
+    def test_get_not_allowed(self):
+        response = self.client.get(self.url)
+        self.assertEquals(response.status_code, 405)
+
+
+class LoginRequiredDeleteTopicsTests(TestCase):
+    def setUp(self):
+        self.url = reverse('delete_topics', kwargs={'pk': 1})
+        self.response = self.client.post(self.url)
+
+    def test_redirection(self):
+        login_url = reverse('login')
+        self.assertRedirects(self.response, '{login_url}?next={url}'.format(login_url=login_url, url=self.url))
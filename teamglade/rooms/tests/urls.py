@@ -0,0 +1,8 @@
+from django.urls import include, path
+from ..object_storage import fake_object_url
+
+# URLs of the site with pre-signed URLs of in-process object storage
+urlpatterns = [
+    fake_object_url,
+    path('', include('teamglade.urls')),
+]
@@ -0,0 +1,134 @@
+"""
+Thumbnails of attachments: small WebP images shown in topic.html instead of the file icon.
+They are generated after the topic is committed, in a pool of worker threads of the process
+(THUMBNAILS_IN_BACKGROUND setting), the request doesn't wait for image decoding.
+Images are read with Pillow (optional package, without it thumbnails are not generated),
+first page of PDF is rendered by pdftoppm (poppler-utils) if it is installed.
+Thumbnail is saved to File.thumbnail and served by rooms.views.file_thumbnail with long
+cache lifetime (content of a File never changes).
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from .models import File
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+# formats Pillow decodes, others (svg, icons, raw photos) keep the file icon
+IMAGE_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+
+
+def can_preview(file):
+    """
+    Helper function.
+    True if thumbnail of the file can be generated.
+    """
+    if Image is None:
+        return False
+    if file.content_type in IMAGE_CONTENT_TYPES:
+        return True
+    return file.content_type == 'application/pdf' and shutil.which('pdftoppm') is not None
+
+
+def generate_on_commit(files):
+    """
+    Generates thumbnails of File objects after current transaction commits.
+    """
+    pks = [file.pk for file in files if can_preview(file)]
+    if pks:
+        transaction.on_commit(lambda: _submit(pks))
+
+
+def _submit(pks):
+    global _executor
+    if not settings.THUMBNAILS_IN_BACKGROUND:
+        generate_thumbnails(pks)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    _executor.submit(_work, pks)
+
+
+def _work(pks):
+    try:
+        generate_thumbnails(pks)
+    except Exception:
+        logger.exception("Generation of thumbnails of files %s failed", pks)
+    finally:
+        # thread has own DB connection
+        close_old_connections()
+
+
+def generate_thumbnails(pks):
+    """
+    Generates and saves thumbnails of files, returns number of generated thumbnails.
+    Files which can't be read or decoded keep no thumbnail.
+    """
+    generated = 0
+    for file in File.objects.filter(pk__in=pks, thumbnail='').only('file', 'content_type'):
+        try:
+            with file.file.storage.open(file.file.name, 'rb') as content:
+                data = make_thumbnail(content, file.content_type)
+        except Exception as e:
+            logger.warning("Thumbnail of file %s is not generated: %s", file.pk, e)
+            continue
+        name = file.thumbnail.storage.save('thumbnails/{}.webp'.format(file.pk), ContentFile(data))
+        # only this column, topic could be edited in the meantime
+        File.objects.filter(pk=file.pk).update(thumbnail=name)
+        generated += 1
+    return generated
+
+
+def make_thumbnail(content, content_type):
+    """
+    Helper function.
+    WebP thumbnail (bytes) of opened file, not bigger than THUMBNAIL_SIZE on each side.
+    """
+    if content_type == 'application/pdf':
+        image = render_pdf_page(content)
+    else:
+        image = Image.open(content)
+    size = (settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE)
+    with image:
+        # draft mode decodes JPEG at reduced scale, much faster for big photos
+        image.draft('RGB', size)
+        # photos are shown as they were taken, not as they are stored
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        output = io.BytesIO()
+        image.save(output, 'WEBP', quality=80)
+    return output.getvalue()
+
+
+def render_pdf_page(content):
+    """
+    Helper function.
+    First page of PDF as an image, rendered by pdftoppm.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'source.pdf')
+        with open(source, 'wb') as f:
+            shutil.copyfileobj(content, f)
+        subprocess.run(['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-png',
+                        '-scale-to', str(settings.THUMBNAIL_SIZE), source, os.path.join(directory, 'page')],
+                       check=True, capture_output=True, timeout=30)
+        with open(os.path.join(directory, 'page.png'), 'rb') as f:
+            image = Image.open(io.BytesIO(f.read()))
+            image.load()
+    return image
@@ -0,0 +1,103 @@
+"""
+Helpers maintaining UnreadCounter - denormalized number of unread topics per user and room.
+Views call them in the same transaction as the change of topics or read marks.
+Counter row is created lazily (computed from scratch on first request), changes are applied
+only to existing rows, so users without row (e.g. just invited) get correct value later.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from .models import Topic, UnreadCounter, topic_read_condition
+
+
+def count_unread(user_id, room_id):
+    """
+    Counts unread topics from scratch (aggregate over read marks).
+    """
+    return Topic.objects.filter(room_id=room_id).exclude(topic_read_condition(user_id)).count()
+
+
+def get_unread_count(user, room):
+    """
+    Returns number of unread topics in the room for the user, reads one row.
+    """
+    counter = UnreadCounter.objects.filter(user=user, room=room).values_list('count', flat=True).first()
+    if counter is None:
+        counter = create_counter(user.pk, room.pk)
+    return counter
+
+
+def create_counter(user_id, room_id):
+    """
+    Creates missing counter. Row is inserted first, so topic_created() of concurrent requests
+    finds it, then it's locked and counted again - topics created between the first count
+    and the insert are not lost.
+    """
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=user_id, room_id=room_id, count=count_unread(user_id, room_id))],
+        ignore_conflicts=True,
+    )
+    with transaction.atomic():
+        lock_counters({(room_id, user_id)})
+        counter = count_unread(user_id, room_id)
+        UnreadCounter.objects.filter(user_id=user_id, room_id=room_id).update(count=counter)
+    return counter
+
+
+def topic_created(topic):
+    """
+    New topic is unread for all members of the room except the author.
+    """
+    (UnreadCounter.objects.filter(room_id=topic.room_id)
+     .exclude(user_id=topic.created_by_id)
+     .update(count=F('count') + 1))
+
+
+def lock_counters(pairs):
+    """
+    Locks counters of (room_id, user_id) pairs until the end of transaction, in order of pk
+    (concurrent transactions don't deadlock). Missing counters are not locked.
+    """
+    if not pairs:
+        return
+    condition = Q()
+    for room_id, user_id in pairs:
+        condition |= Q(room_id=room_id, user_id=user_id)
+    list(UnreadCounter.objects.select_for_update().filter(condition).order_by('pk').values_list('pk', flat=True))
+
+
+def topics_read(room_id, user_id, count):
+    """
+    Has to be called only for topics read first time by the user,
+    with the counter locked (see lock_counters()).
+    """
+    (UnreadCounter.objects.filter(room_id=room_id, user_id=user_id)
+     .update(count=Greatest(F('count') - count, 0)))
+
+
+def topics_deleted(room_id, topic_ids):
+    """
+    Has to be called before deleting of topics (read marks are deleted with them).
+    Every counter of the room decreases by number of deleted topics that were not read by its user.
+    """
+    unread_deleted = (Topic.objects.filter(pk__in=topic_ids, room_id=room_id)
+                      .exclude(topic_read_condition(OuterRef('user')))
+                      .order_by()
+                      .values('room')
+                      .annotate(unread=Count('pk'))
+                      .values('unread'))
+    (UnreadCounter.objects.filter(room_id=room_id)
+     .update(count=Greatest(F('count') - Coalesce(Subquery(unread_deleted), 0), 0)))
+
+
+def rebuild_counters(room):
+    """
+    Recomputes counters of all members (owner and invited users) of the room from scratch.
+    """
+    users = [room.created_by_id] + list(room.members.values_list('pk', flat=True))
+    with transaction.atomic():
+        UnreadCounter.objects.filter(room=room).delete()
+        UnreadCounter.objects.bulk_create(
+            UnreadCounter(user_id=user_id, room=room, count=count_unread(user_id, room.pk)) for user_id in users
+        )
+    return len(users)
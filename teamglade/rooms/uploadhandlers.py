@@ -0,0 +1,148 @@
+"""
+Upload handler for topic attachments.
+Default Django handlers buffer every file in memory or in a temporary file and then
+the storage copies it to MEDIA_ROOT. StreamingFileUploadHandler writes chunks straight to
+the incoming file of attachments storage and computes size and SHA-256 on the fly, complete file
+gets its content-addressed name (see rooms.storage), duplicates are dropped.
+Memory usage doesn't depend on size and number of uploads.
+Handler has to be installed before request.POST/FILES are read (see rooms.views.new_topic).
+"""
+import hashlib
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.http import QueryDict
+from django.template.defaultfilters import filesizeformat
+from django.utils.datastructures import MultiValueDict
+from .storage import blob_storage
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    File which is already written to the storage:
+        name - original file name (as for other uploaded files)
+        stored_name - name of the file in the storage, blob name when the file is complete
+        sha256 - hex digest of the content
+        saved - True when File object refers to it, otherwise it's removed after the request
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra):
+        self.stored_name, file = blob_storage.open_incoming()
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.hash = hashlib.sha256()
+        self.complete = False
+        self.saved = False
+
+    def write(self, data):
+        self.file.write(data)
+        self.hash.update(data)
+
+    @property
+    def sha256(self):
+        return self.hash.hexdigest()
+
+    def finish(self, size):
+        """
+        Moves complete file to its blob name.
+        """
+        self.file.close()
+        self.size = size
+        self.stored_name = blob_storage.adopt(self.stored_name, self.sha256)
+        self.complete = True
+
+    def discard(self):
+        """
+        Removes the incoming file (upload was stopped or topic wasn't created).
+        Complete file is already a blob which a concurrent upload of the same content can be
+        taking (adopted, Blob row not committed yet), it's left for gc_media command (its
+        --min-age keeps blobs of uploads in progress).
+        """
+        self.file.close()
+        if not self.complete:
+            blob_storage.discard_incoming(self.stored_name)
+
+
+class StreamingFileUploadHandler(FileUploadHandler):
+    """
+    Writes uploaded files straight to the storage and stops the upload as soon as
+    the number of files or size of a file exceeds limits of topic attachments.
+    Request with Content-Length over the limits is rejected before reading of the body
+    (the view checks content_too_big() first, the CSRF token in the body can't be checked then).
+    Reason of the stop is saved to request.upload_error (None if there was no stop).
+    View has to call discard_unsaved() at the end of request.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.max_files = settings.TOPIC_FILES_MAX_COUNT
+        self.max_file_size = settings.TOPIC_FILE_MAX_SIZE
+        self.files_count = 0
+        self.current_file = None
+        self.files = []
+        request.upload_error = None
+
+    # space for other form fields and multipart headers
+    body_overhead = 64 * 1024
+
+    def content_too_big(self, content_length):
+        """
+        Error message if request body can't fit the limits, otherwise None.
+        """
+        if content_length > self.max_files * self.max_file_size + self.body_overhead:
+            return 'Files are too big, you can attach up to {} files, up to {} each.'.format(
+                self.max_files, filesizeformat(self.max_file_size))
+        return None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        error = self.content_too_big(content_length)
+        if error:
+            self.request.upload_error = error
+            # body is not read, form gets no data at all
+            return QueryDict(), MultiValueDict()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.files_count += 1
+        if self.files_count > self.max_files:
+            self.stop('Too many files, you can attach up to {} files.'.format(self.max_files))
+        if content_length is not None and content_length > self.max_file_size:
+            self.stop_too_big()
+
+        self.current_file = StreamedUploadedFile(file_name, content_type, charset, content_type_extra)
+        # other handlers don't get this file
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_file_size:
+            self.stop_too_big()
+        self.current_file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.current_file.finish(file_size)
+        self.files.append(self.current_file)
+        file, self.current_file = self.current_file, None
+        return file
+
+    def upload_interrupted(self):
+        if self.current_file:
+            self.current_file.discard()
+            self.current_file = None
+
+    def stop_too_big(self):
+        self.stop('File "{}" is too big, you can attach files up to {}.'.format(
+            self.file_name, filesizeformat(self.max_file_size)))
+
+    def stop(self, error):
+        self.upload_interrupted()
+        self.request.upload_error = error
+        # the rest of request body is not read at all
+        raise StopUpload(connection_reset=True)
+
+    def discard_unsaved(self):
+        """
+        Discards written files which didn't get File object (invalid form, failed CSRF check, errors).
+        """
+        for file in self.files:
+            if not file.saved:
+                file.discard()
+        self.upload_interrupted()
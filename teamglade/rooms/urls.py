@@ -1,16 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import object_storage, views
 
 urlpatterns = [
     path('', views.index, name='home'),
     #path('rooms/', views.room, name='room'),
     path('rooms/', views.RoomView.as_view(), name='room'),
     path('rooms/<int:pk>/new/', views.new_topic, name='new_topic'),
+    path('rooms/<int:pk>/uploads/', views.upload_url, name='upload_url'),
     path('rooms/<int:pk>/invite/', views.SendInviteView.as_view(), name='send_invite'),
+    path('rooms/<int:pk>/invite/bulk/', views.BulkInviteView.as_view(), name='bulk_invite'),
+    path('rooms/<int:pk>/delete/', views.DeleteTopicsView.as_view(), name='delete_topics'),
     path('rooms/invite/<str:code>/', views.LoginInvitedView.as_view(), name='login_invite'),
     path('topic/<int:pk>/', views.topic, name='topic'),
     path('topic/<int:pk>/delete/', views.DeleteTopicView.as_view(), name='delete_topic'),
+    path('topic/<int:pk>/files.zip', views.download_topic_files, name='download_topic_files'),
+    path('files/<int:pk>/', views.download_file, name='download_file'),
+    path('files/<int:pk>/thumbnail/', views.file_thumbnail, name='file_thumbnail'),
     path('message/', views.message, name='message'),
     path('policy/', views.policy, name='policy'),
     path('terms/', views.terms, name='terms'),
 ]
+
+# pre-signed URLs of in-process object storage (development), never routed with real storage
+if settings.OBJECT_STORAGE['CLIENT'] == 'fake':
+    urlpatterns.append(object_storage.fake_object_url)
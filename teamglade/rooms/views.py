@@ -1,16 +1,29 @@
-from uuid import uuid4
+import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.http import Http404
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.exceptions import NON_FIELD_ERRORS
 from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import F, Q
+from django.template.defaultfilters import filesizeformat
 from django.urls import reverse, reverse_lazy
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DeleteView
 from django.utils.decorators import method_decorator
-from .models import Topic, Room, RoomUser, File
-from .forms import NewTopicForm, SendInviteForm
+from .models import Topic, Room, File, Blob
+from .forms import NewTopicForm, SendInviteForm, BulkInviteForm, DeleteTopicsForm, is_email, sha256_re, sign_upload
+from .downloads import content_disposition, serve_file, serve_thumbnail
+from .fragment_cache import get_room_version
+from .pagination import CursorPaginator
+from .storage import blob_storage
+from .uploadhandlers import StreamingFileUploadHandler
+from .zipstream import zip_files
+from . import invites, media_cleanup, read_tracking, thumbnails, unread
 import logging
 
 # Set up logging for bot detection
@@ -25,22 +38,43 @@ class RoomView(ListView):
     paginate_by = 12
 
     def get_context_data(self, **kwargs):
-        my_user = self.request.user
         user_room = get_user_room(self.request)
 
-        # list with id of all topics that was read by this user
-        was_read = list(my_user.read_topics.all().values_list("id", flat=True))
-
-        kwargs = {'room': user_room, 'was_read': was_read}
+        kwargs = {
+            'room': user_room,
+            'unread_count': unread.get_unread_count(self.request.user, user_room),
+            'pagination_mode': self.get_pagination_mode(),
+            # rows of topics are cached per room version, see rooms.fragment_cache
+            'fragments_version': get_room_version(user_room.pk),
+            'fragments_timeout': settings.ROOM_FRAGMENTS_CACHE_TIMEOUT,
+        }
 
         return super().get_context_data(**kwargs)
 
     def get_queryset(self):
         user_room = get_user_room(self.request)
-
-        queryset = user_room.topics.all().order_by('-created_at')
+        # with READ_MARKS_DEFERRED topics just read by the user are shown as read
+        read_tracking.flush_marks_of_user(self.request.user.pk)
+
+        # id is a tiebreaker for topics created at the same moment (stable order for both pagination modes)
+        # every topic of the page gets is_read flag (was this topic read by this user)
+        queryset = (user_room.topics.with_read_state(self.request.user)
+                    .select_related('created_by')
+                    .order_by('-created_at', '-id'))
         return queryset
 
+    def get_pagination_mode(self):
+        # 'page' - numbered pages (offset), 'cursor' - next/previous links (keyset), fast for deep pages in big rooms
+        return settings.TOPICS_PAGINATION
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != 'cursor':
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
 
 # @login_required
 # def room_FBV_version(request):
@@ -57,21 +91,109 @@ class RoomView(ListView):
 def topic(request, pk):
     user_room = get_user_room(request)
 
-    the_topic = get_object_or_404(Topic, pk=pk)
-
+    # topic is looked up by primary key within the room, topic of another room is not found
     # if user is not owner/member of this room (no permission to read topic)
-    if the_topic not in user_room.topics.all():
-        raise Http404
+    # two queries: topic joined with author and room, then its attachments (prefetch),
+    # template doesn't hit DB per related object
+    topics = (Topic.objects.filter(room=user_room).with_read_state(request.user)
+              .select_related('created_by', 'room').prefetch_related('files'))
+    the_topic = get_object_or_404(topics, pk=pk)
 
-    # topic marked as was read by this user
-    the_topic.was_read_by.add(request.user)
+    # topic marked as was read by this user (on first read only, no writes on next openings)
+    if not the_topic.is_read:
+        read_tracking.mark_read(the_topic, request.user)
 
     context = {'topic': the_topic}
     return render(request, 'topic.html', context)
 
 
 @login_required
+def download_file(request, pk):
+    # one query: file by primary key, joined with its topic and room (primary keys),
+    # file of a room user is not owner/member of is not found
+    # files are uploaded with their topic and never replaced, it's the time of the upload
+    user = request.user
+    files = (File.objects.filter(Q(topic__room__created_by=user) | Q(topic__room_id=user.member_of_id))
+             .only('file', 'original_name', 'content_type', 'sha256')
+             .annotate(uploaded_at=F('topic__created_at')))
+    the_file = get_object_or_404(files, pk=pk)
+
+    try:
+        return serve_file(request, the_file)
+    except FileNotFoundError:
+        raise Http404
+
+
+@login_required
+def file_thumbnail(request, pk):
+    # same access check as download_file, file without thumbnail is not found
+    user = request.user
+    files = (File.objects.filter(Q(topic__room__created_by=user) | Q(topic__room_id=user.member_of_id))
+             .exclude(thumbnail='').only('thumbnail').annotate(uploaded_at=F('topic__created_at')))
+    the_file = get_object_or_404(files, pk=pk)
+
+    try:
+        return serve_thumbnail(request, the_file)
+    except FileNotFoundError:
+        raise Http404
+
+
+@login_required
+def download_topic_files(request, pk):
+    """
+    All attachments of the topic in one ZIP archive, generated while it is sent (see rooms.zipstream).
+    """
+    user_room = get_user_room(request)
+    the_topic = get_object_or_404(Topic.objects.filter(room=user_room).only('title', 'created_at'), pk=pk)
+    files = list(the_topic.files.only('file', 'original_name', 'content_type', 'size').order_by('pk'))
+    if not files:
+        raise Http404
+
+    response = StreamingHttpResponse(zip_files(files, the_topic.created_at), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition('{}.zip'.format(the_topic.title))
+    response['Cache-Control'] = 'private, no-cache'
+    # nginx sends bytes to the browser as they come, without buffering the whole archive
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
 def new_topic(request, pk):
+    # upload handler has to be set before request body is read, CSRF check reads it,
+    # so CSRF protection is applied after (inside of _new_topic)
+    upload_handler = StreamingFileUploadHandler(request)
+    request.upload_handlers = [upload_handler]
+
+    # body over the limits is not read, so its CSRF token can't be checked:
+    # nothing is changed, the form is shown again with the error
+    if request.method == 'POST':
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        error = upload_handler.content_too_big(content_length)
+        if error:
+            return _upload_too_big(request, pk, error)
+
+    try:
+        return _new_topic(request, pk)
+    finally:
+        upload_handler.discard_unsaved()
+
+
+@login_required
+def _upload_too_big(request, pk, error):
+    if get_user_room(request).pk != pk:
+        raise Http404
+    # the form is not bound (fields are not received), the error is shown above them
+    form = NewTopicForm()
+    form.errors[NON_FIELD_ERRORS] = form.error_class([error], error_class='nonfield')
+    return render(request, 'new_topic.html', new_topic_context(form, pk), status=413)
+
+
+@login_required
+@csrf_protect
+def _new_topic(request, pk):
     room_obj = get_object_or_404(Room, pk=pk)
 
     # if user is not owner/invited of this room (no permission to create new topic here)
@@ -81,35 +203,104 @@ def new_topic(request, pk):
         raise Http404
 
     if request.method == 'POST':
-        form = NewTopicForm(request.POST, request.FILES)
+        form = NewTopicForm(request.POST, request.FILES, upload_error=request.upload_error,
+                            user=request.user, room=room_obj)
         if form.is_valid():
             user = request.user
 
-            topic = Topic.objects.create(
-                room=room_obj,
-                title=form.cleaned_data['title'],
-                message=form.cleaned_data['message'],
-                # files=request.FILES['files'],
-                created_by=user,
-            )
-
-            # adding files
-            files = request.FILES.getlist('files')
-
-            for f in files:
-                file = File.objects.create(
-                    file=f,
-                    topic=topic
+            with transaction.atomic():
+                topic = Topic.objects.create(
+                    room=room_obj,
+                    title=form.cleaned_data['title'],
+                    message=form.cleaned_data['message'],
+                    # files=request.FILES['files'],
+                    created_by=user,
                 )
 
-            # new topic marked as was read by creator
-            topic.was_read_by.add(user)
+                # adding files, they are already in the storage (see rooms.uploadhandlers),
+                # with object storage the browser could upload them directly (see upload_url)
+                files = request.FILES.getlist('files')
+
+                # the same content is stored once, File objects share its blob
+                created = []
+                for f in files + form.cleaned_data['uploaded']:
+                    blob = Blob.objects.acquire(f.sha256, f.stored_name, f.size)
+                    created.append(File.objects.create(
+                        file=blob.file.name,
+                        blob=blob,
+                        original_name=f.name,
+                        size=f.size,
+                        content_type=f.content_type or 'application/octet-stream',
+                        sha256=f.sha256,
+                        topic=topic
+                    ))
+                # thumbnails are generated in background after commit
+                thumbnails.generate_on_commit(created)
+                # direct uploads are copied to blobs, uploaded files are not needed
+                for f in form.cleaned_data['uploaded']:
+                    if f.upload_name:
+                        media_cleanup.delete_on_commit(blob_storage, f.upload_name)
+
+                # new topic marked as was read by creator, for other members it is unread
+                read_tracking.mark_own_topic(topic)
+                unread.topic_created(topic)
+
+            # topic is saved, files are kept
+            for f in files:
+                f.saved = True
 
             return redirect('room')
     else:
         form = NewTopicForm()
 
-    return render(request, 'new_topic.html', {'form': form})
+    return render(request, 'new_topic.html', new_topic_context(form, pk))
+
+
+def new_topic_context(form, pk):
+    """
+    Helper function.
+    Context of new_topic.html.
+    """
+    context = {'form': form}
+    if settings.ATTACHMENTS_STORAGE == 'object':
+        context['upload_url'] = reverse('upload_url', kwargs={'pk': pk})
+    return context
+
+
+@login_required
+@require_POST
+def upload_url(request, pk):
+    """
+    Pre-signed URL for direct upload of a topic attachment to object storage.
+    Accepts sha256, size, name and content_type of the file, returns JSON:
+        upload - ticket of the upload, it's sent with the form (NewTopicForm.uploaded field)
+        exists - True if the same content is already attached in the room, then it's not uploaded again
+        url, headers - PUT request to send the file with
+    The file is uploaded to a new name, not to its blob: the form takes it only if it was
+    uploaded there, so SHA-256 of a content stored for another room doesn't give the content.
+    """
+    if settings.ATTACHMENTS_STORAGE != 'object' or get_user_room(request).pk != pk:
+        raise Http404
+
+    sha256 = request.POST.get('sha256', '')
+    content_type = request.POST.get('content_type') or 'application/octet-stream'
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = -1
+    if not sha256_re.match(sha256) or size < 0:
+        return JsonResponse({'error': 'Invalid file.'}, status=400)
+    if size > settings.TOPIC_FILE_MAX_SIZE:
+        return JsonResponse({'error': 'File "{}" is too big, you can attach files up to {}.'.format(
+            request.POST.get('name', ''), filesizeformat(settings.TOPIC_FILE_MAX_SIZE))}, status=400)
+
+    if File.objects.filter(topic__room_id=pk, sha256=sha256, blob__isnull=False).exists():
+        # members of the room can download it anyway
+        return JsonResponse({'upload': sign_upload(request.user, sha256, None), 'exists': True})
+    name = blob_storage.new_upload_name()
+    url, headers = blob_storage.upload_url(name, sha256, size, content_type)
+    return JsonResponse({'upload': sign_upload(request.user, sha256, name), 'exists': False,
+                         'url': url, 'headers': headers})
 
 
 @method_decorator(login_required, name='dispatch')
@@ -119,55 +310,67 @@ class DeleteTopicView(DeleteView):
     success_url = reverse_lazy('room')
     template_name = "topic_confirm_delete.html"
 
-    def form_valid(self, form):
-        my_user = self.request.user
-        user_room = get_user_room(self.request)
-
+    def get_queryset(self):
         # if user is not owner/invited of this room - no permission to delete in another's room
         # prevent malicious deleting by user typing in the address bar
-        if self.kwargs['pk'] not in user_room.topics.all().values_list("id", flat=True):
-            raise Http404
+        # topic is looked up by pk within this queryset, not permitted topic is not found (404)
+        topics = Topic.objects.filter(room=get_user_room(self.request))
 
         # if user is not owner of this room (invited user)
-        if my_user.rooms.first() is None:
+        if not self.request.is_room_owner:
             # he can delete only own topics
-            if self.kwargs['pk'] not in my_user.topics.all().values_list("id", flat=True):
-                raise Http404
+            topics = topics.filter(created_by=self.request.user)
+
+        return topics
 
-        return super(DeleteTopicView, self).form_valid(form)
+    def form_valid(self, form):
+        with transaction.atomic():
+            unread.topics_deleted(self.object.room_id, [self.object.pk])
+            return super().form_valid(form)
 
 
 @method_decorator(login_required, name='dispatch')
-class SendInviteView(View):
-    def create_invited_user(self, request, invite_email, invite_code):
-        user = RoomUser.objects.create_user(
-            username=invite_email,
-            email=invite_email,
-            password=invite_code,
-            invite_code=invite_code,
-            member_of=request.user.rooms.first()
-        )
-
-    def send_invite_mail(self, request, email, invite_code):
-        # generate link with identifier to login_invite view
-        context = request.build_absolute_uri('/')[:-1] + reverse('login_invite', kwargs={'code': invite_code})
-        html_message = render_to_string('invite_email.html', {'context': context, })
-        subject = "[TeamGlade] You are invited to join TeamGlade room"
-        message = EmailMessage(subject, html_message, to=[email])  # FROM field will be DEFAULT_FROM_EMAIL
-        message.send()
+class DeleteTopicsView(View):
+    """
+    Bulk deleting of selected topics (with their files) in one transaction. Only for owner of the room.
+    """
 
+    def post(self, request, pk):
+        user_room = get_user_room(request)
+
+        # if user is not owner of this room (invited user) or it is another's room
+        if not request.is_room_owner or user_room.pk != pk:
+            raise Http404
+
+        form = DeleteTopicsForm(request.POST, room=user_room)
+        # not valid if some of topics are not from this room - malicious request
+        if not form.is_valid():
+            raise Http404
+
+        topics = form.cleaned_data['topics']
+        # "Delete Selected" without selected topics does nothing
+        if topics:
+            with transaction.atomic():
+                unread.topics_deleted(user_room.pk, [topic.pk for topic in topics])
+                topics.delete()
+
+        return redirect('room')
+
+
+@method_decorator(login_required, name='dispatch')
+class SendInviteView(View):
     def post(self, request, pk):
         # if user is not owner of this room (invited user)
-        if self.request.user.rooms.first() is None:
+        if not request.is_room_owner:
             raise Http404
 
         form = SendInviteForm(request.POST)
         if form.is_valid():
             email = form.cleaned_data["email"]
-            invite_code = uuid4().hex[:8]  # generate random identifier - letters and digits
-            self.create_invited_user(request, email, invite_code)
-            self.send_invite_mail(request, email, invite_code)
-            return redirect('room')
+            invited, skipped = invites.invite_users(request.room, [email], request.build_absolute_uri('/')[:-1])
+            if invited:
+                return redirect('room')
+            form.add_error('email', 'User with this email is already registered.')
         return render(request, 'send_invite.html', {'form': form})
 
     def get(self, request, pk):
@@ -175,16 +378,53 @@ class SendInviteView(View):
         return render(request, 'send_invite.html', {'form': form})
 
 
+@method_decorator(login_required, name='dispatch')
+class BulkInviteView(View):
+    """
+    Invites a list of addresses (text or CSV file) at once.
+    JSON request {"emails": [...]} gets JSON response {"invited": [...], "skipped": [...]}.
+    """
+
+    def post(self, request, pk):
+        # if user is not owner of this room (invited user)
+        if not request.is_room_owner:
+            raise Http404
+
+        if request.content_type == 'application/json':
+            try:
+                emails = json.loads(request.body)['emails']
+                form = BulkInviteForm({'emails': '\n'.join(emails)})
+            except (ValueError, KeyError, TypeError):
+                return JsonResponse({'errors': ['Expected {"emails": [...]}.']}, status=400)
+            if not form.is_valid():
+                return JsonResponse({'errors': list(form.non_field_errors()) + list(form.errors.get('emails', []))},
+                                    status=400)
+        else:
+            form = BulkInviteForm(request.POST, request.FILES)
+            if not form.is_valid():
+                return render(request, 'bulk_invite.html', {'form': form})
+
+        invited, skipped = invites.invite_users(request.room, form.cleaned_data['addresses'],
+                                                request.build_absolute_uri('/')[:-1])
+        if request.content_type == 'application/json':
+            return JsonResponse({'invited': invited, 'skipped': skipped})
+        return render(request, 'bulk_invite.html', {'form': BulkInviteForm(), 'invited': invited, 'skipped': skipped})
+
+    def get(self, request, pk):
+        return render(request, 'bulk_invite.html', {'form': BulkInviteForm()})
+
+
 class LoginInvitedView(View):
     def get(self, request, code):
-        invited_user_obj = RoomUser.objects.filter(invite_code=code).first()
-
-        if invited_user_obj is None:
+        # token of the link, checked by rooms.backends.InviteTokenBackend
+        invited_user = authenticate(request, invite_token=code)
+        if invited_user is None:
             raise Http404
 
-        invited_user = authenticate(username=invited_user_obj.username, password=invited_user_obj.invite_code)
-        if invited_user is not None:
-            login(request, invited_user)
+        login(request, invited_user)
+        if not invited_user.has_usable_password():
+            # the link is single-use, next time user logs in with a password
+            return redirect('password_set')
         return redirect('room')
 
 
@@ -278,25 +518,11 @@ def get_user_room(request):
     """
     Helper function.
     User has to have room in which he can operate.
-    If user is owner - there is a room with relation to user (Room.created_by).
-    If user is invited member - he has a relation to Room (field member_of).
+    Room is resolved once per request by UserRoomMiddleware (owned room or room user is invited to).
     Function returns Room object in which user can operate.
     """
-    my_user = request.user
-    user_room = my_user.rooms.first()
-    if user_room is None:
-        user_room = my_user.member_of
-        if user_room is None:
-            # not standard case
-            raise Http404
+    user_room = request.room
+    if not user_room:
+        # not standard case
+        raise Http404
     return (user_room)
-
-
-def is_email(email_string: str):
-    from django.core.validators import validate_email
-    from django.core.exceptions import ValidationError
-    try:
-        validate_email(email_string)
-    except ValidationError:
-        return False
-    return True
@@ -0,0 +1,108 @@
+"""
+ZIP archive generated while it is sent (rooms.views.download_topic_files).
+zipfile writes to an unseekable buffer (sizes and CRC go to data descriptors after every file),
+generator yields written bytes after every chunk of a file: memory usage doesn't depend on
+number and size of files, the browser gets first bytes at once.
+Already compressed formats (images, video, archives, office documents) are stored as is,
+other files are deflated.
+"""
+import logging
+import os
+import zipfile
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+COMPRESSED_EXTENSIONS = {
+    '.7z', '.apk', '.avi', '.bz2', '.docx', '.epub', '.flac', '.gif', '.gz', '.heic', '.jar', '.jpeg', '.jpg',
+    '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.odp', '.ods', '.odt', '.ogg', '.pdf', '.png', '.pptx', '.rar',
+    '.tgz', '.webm', '.webp', '.xlsx', '.xz', '.zip',
+}
+COMPRESSED_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp', 'video/', 'audio/',
+                            'application/zip', 'application/gzip', 'application/pdf')
+
+
+class StreamBuffer:
+    """
+    Unseekable file object zipfile writes to, written bytes are taken with pop().
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def is_compressed(name, content_type):
+    """
+    Helper function.
+    True if the format is already compressed, deflating it only wastes CPU.
+    """
+    return (os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS
+            or (content_type or '').startswith(COMPRESSED_CONTENT_TYPES))
+
+
+def archive_names(names):
+    """
+    Helper function.
+    Unique names of archive members, in the same order ("doc.txt", "doc (2).txt", ...).
+    """
+    result, used = [], set()
+    for name in names:
+        # no directories and path traversal in the archive
+        name = name.replace('/', '_').replace('\\', '_') or 'file'
+        unique, number = name, 1
+        while unique.lower() in used:
+            number += 1
+            root, ext = os.path.splitext(name)
+            unique = '{} ({}){}'.format(root, number, ext)
+        used.add(unique.lower())
+        result.append(unique)
+    return result
+
+
+def zip_files(files, modified):
+    """
+    Generator of ZIP archive bytes with content of File objects (modified - datetime of members).
+    Missing files are skipped (response is already started, it can't be an error).
+    """
+    date_time = timezone.localtime(modified).timetuple()[:6]
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for file, name in zip(files, archive_names([f.filename() for f in files])):
+            try:
+                content = file.file.storage.open(file.file.name, 'rb')
+            except FileNotFoundError:
+                logger.warning("File %s of archive is missing", file.file.name)
+                continue
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.compress_type = zipfile.ZIP_STORED if is_compressed(name, file.content_type) else zipfile.ZIP_DEFLATED
+            # known size lets zipfile choose between ZIP and ZIP64 headers
+            info.file_size = file.size or 0
+            with content, archive.open(info, 'w') as member:
+                for chunk in iter(lambda: content.read(CHUNK_SIZE), b''):
+                    member.write(chunk)
+                    # deflate keeps some data until the end of the member
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    # central directory
+    yield buffer.pop()
@@ -64,6 +64,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rooms.middleware.UserRoomMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -105,6 +106,46 @@ DATABASES = {
 }
 
 
+# Limits of attachments of a topic, enforced while request body is read (rooms.uploadhandlers)
+TOPIC_FILES_MAX_COUNT = int(os.environ.get('TOPIC_FILES_MAX_COUNT', 5))
+TOPIC_FILE_MAX_SIZE = int(os.environ.get('TOPIC_FILE_MAX_SIZE', 5 * 1024 * 1024))  # bytes
+
+# Addresses invited with one request (rooms.views.BulkInviteView)
+BULK_INVITE_MAX_COUNT = int(os.environ.get('BULK_INVITE_MAX_COUNT', 500))
+# Lifetime of the invite link, seconds
+INVITE_TOKEN_EXPIRES = int(os.environ.get('INVITE_TOKEN_EXPIRES', 14 * 24 * 3600))
+
+# Files of deleted attachments are removed after commit, in batches, in a background thread
+# of the worker (False - right after commit, in the request)
+MEDIA_DELETE_IN_BACKGROUND = os.environ.get('MEDIA_DELETE_IN_BACKGROUND', 'True') == 'True'
+MEDIA_DELETE_BATCH_SIZE = int(os.environ.get('MEDIA_DELETE_BATCH_SIZE', 500))
+
+# Thumbnails of image and PDF attachments (rooms.thumbnails), generated after commit
+# by a pool of worker threads (False - right after commit, in the request)
+THUMBNAILS_IN_BACKGROUND = os.environ.get('THUMBNAILS_IN_BACKGROUND', 'True') == 'True'
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', 256))  # pixels, longer side
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# locmem (default) is per process - fine for tests and development only. Production needs a cache
+# shared by all workers (compose.yaml runs Redis), `manage.py check --deploy` warns about locmem:
+#   file-based: CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache CACHE_LOCATION=/var/tmp/teamglade_cache
+#   Redis: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Rendered rows of room topics table are cached for this time (seconds),
+# it limits how stale "created ... ago" can be
+ROOM_FRAGMENTS_CACHE_TIMEOUT = int(os.environ.get('ROOM_FRAGMENTS_CACHE_TIMEOUT', 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -125,10 +166,32 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = "rooms.RoomUser"
 
+AUTHENTICATION_BACKENDS = [
+    'django.contrib.auth.backends.ModelBackend',
+    # login by the invite link, without password hashing
+    'rooms.backends.InviteTokenBackend',
+]
+
 LOGIN_REDIRECT_URL = 'room'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 
+# Room topics pagination mode: 'page' (numbered pages) or 'cursor' (keyset, next/previous only)
+TOPICS_PAGINATION = os.environ.get('TOPICS_PAGINATION', 'page')
+
+# Storage of read state of topics: 'm2m' (row per read topic and user) or
+# 'watermark' (row per user and room plus topics read out of order),
+# existing marks are converted by `manage.py convert_read_marks` before switching to 'watermark'
+READ_TRACKING = os.environ.get('READ_TRACKING', 'm2m')
+# exceptions kept per user and room, topics older than the oldest of them are treated as read
+READ_EXCEPTIONS_MAX = int(os.environ.get('READ_EXCEPTIONS_MAX', 200))
+
+# Read marks of topics can be buffered in worker and written in batches after responses were sent
+# (at latest READ_MARKS_FLUSH_INTERVAL after the first one), marks of a killed worker are lost
+READ_MARKS_DEFERRED = os.environ.get('READ_MARKS_DEFERRED', 'False') == 'True'
+READ_MARKS_BATCH_SIZE = int(os.environ.get('READ_MARKS_BATCH_SIZE', 100))
+READ_MARKS_FLUSH_INTERVAL = float(os.environ.get('READ_MARKS_FLUSH_INTERVAL', 2))  # seconds
+
 
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 # EMAIL_HOST = 'smtp.mailgun.org'
@@ -154,6 +217,21 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@mg.teamglade.com')
 #SERVER_EMAIL = "noreply@mg.teamglade.com"
 
+# True - emails are saved to outbox and sent by run_mail_worker command (rooms.outbox) with the backend above,
+# the worker has to run (mail_worker service of compose.yaml), otherwise nothing is sent.
+# False (default) - sent in the request
+EMAIL_OUTBOX = os.environ.get('EMAIL_OUTBOX', 'False') == 'True'
+MAIL_WORKER_EMAIL_BACKEND = EMAIL_BACKEND
+if EMAIL_OUTBOX:
+    EMAIL_BACKEND = 'rooms.outbox.OutboxEmailBackend'
+MAIL_WORKER_BATCH_SIZE = int(os.environ.get('MAIL_WORKER_BATCH_SIZE', 50))
+MAIL_WORKER_INTERVAL = float(os.environ.get('MAIL_WORKER_INTERVAL', 1))  # seconds
+MAIL_WORKER_LEASE = int(os.environ.get('MAIL_WORKER_LEASE', 300))  # seconds
+# failed message is retried after 30s, 60s, 120s... up to an hour, dead after 8 attempts
+MAIL_WORKER_MAX_ATTEMPTS = int(os.environ.get('MAIL_WORKER_MAX_ATTEMPTS', 8))
+MAIL_WORKER_RETRY_DELAY = int(os.environ.get('MAIL_WORKER_RETRY_DELAY', 30))  # seconds
+MAIL_WORKER_MAX_RETRY_DELAY = int(os.environ.get('MAIL_WORKER_MAX_RETRY_DELAY', 3600))  # seconds
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -176,6 +254,28 @@ STATIC_URL = os.environ.get('STATIC_URL', '/static/')
 MEDIA_ROOT = os.environ.get('MEDIA_ROOT', 'media/')
 MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 
+# Attachments are downloaded through rooms.views.download_file (access check), then
+# True - file is sent by nginx from internal location (X-Accel-Redirect, see nginx/nginx.conf)
+# False - file is sent by Django (development without nginx)
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', str(not DEBUG)) == 'True'
+MEDIA_ACCEL_REDIRECT_LOCATION = os.environ.get('MEDIA_ACCEL_REDIRECT_LOCATION', '/protected-media/')
+
+# Storage of attachments (rooms.storage)
+# 'filesystem' - MEDIA_ROOT, web containers share media volume
+# 'object' - S3-compatible bucket, files are uploaded and downloaded by browsers directly with
+#            pre-signed URLs, web containers don't need a shared disk
+ATTACHMENTS_STORAGE = os.environ.get('ATTACHMENTS_STORAGE', 'filesystem')
+# CLIENT: 's3' (needs boto3 package) or 'fake' (in-process stand-in for tests and development)
+OBJECT_STORAGE = {
+    'CLIENT': os.environ.get('OBJECT_STORAGE_CLIENT', 's3'),
+    'ENDPOINT_URL': os.environ.get('OBJECT_STORAGE_ENDPOINT_URL', ''),
+    'BUCKET': os.environ.get('OBJECT_STORAGE_BUCKET', 'teamglade'),
+    'REGION': os.environ.get('OBJECT_STORAGE_REGION', ''),
+    'ACCESS_KEY_ID': os.environ.get('OBJECT_STORAGE_ACCESS_KEY_ID', ''),
+    'SECRET_ACCESS_KEY': os.environ.get('OBJECT_STORAGE_SECRET_ACCESS_KEY', ''),
+}
+OBJECT_STORAGE_URL_EXPIRES = int(os.environ.get('OBJECT_STORAGE_URL_EXPIRES', 300))  # seconds
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
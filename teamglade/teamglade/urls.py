@@ -16,16 +16,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
-from django.conf import settings
-from django.conf.urls.static import static
-
 urlpatterns = [
     path('', include('rooms.urls')),
     path('accounts/', include('accounts.urls')),
     path('admin/', admin.site.urls),
 ]
 
-# as far as Django doesn't serve media files, add url pattern for DEBUG mode
-# static - Helper function returns a URL pattern for serving files
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# attachments are not served as static media files (also in DEBUG mode),
+# they are downloaded through rooms.views.download_file with access check
\ No newline at end of file